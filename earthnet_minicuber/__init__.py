@@ -9,7 +9,13 @@ from . import provider, minicuber, plot
 
 from earthnet_minicuber.minicuber import Minicuber
 from earthnet_minicuber.provider.provider_base import Provider
-from earthnet_minicuber.provider import PROVIDERS
+from earthnet_minicuber.provider import PROVIDERS, register_provider
+from earthnet_minicuber.provider.stac import set_stac_cache
+from earthnet_minicuber.provider.tiles import set_tile_cache
+from earthnet_minicuber.provider.blocks import set_block_cache
+from earthnet_minicuber.provider.maskcache import set_mask_cache
+from earthnet_minicuber.tracing import Tracer, tracing
+from earthnet_minicuber.execution import ExecutionBackend, execution
 from earthnet_minicuber.plot import plot_rgb
 
 
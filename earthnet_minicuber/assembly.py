@@ -0,0 +1,97 @@
+"""Incremental assembly of a minicube from provider and time interval results.
+
+Merging every provider cube into the growing minicube with xr.merge re-aligns and copies all data already loaded, and keeping every interval result around until a final merge holds the minicube in memory twice. The CubeAssembler instead collects the per provider, per interval blocks of each variable and writes them into one preallocated array per variable over the union of all timesteps. Blocks are released variable by variable while assembling, so the peak memory is the minicube plus one variable.
+"""
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+
+def to_datetimeindex(values):
+    return pd.DatetimeIndex(pd.to_datetime(np.asarray(values)))
+
+
+class CubeAssembler:
+
+    def __init__(self):
+        self.blocks = {}
+        self.static = {}
+
+    def __len__(self):
+        return len(self.blocks) + len(self.static)
+
+    def add(self, product_cube):
+        """Add a regridded product cube. Variables with a time dimension are appended as a block, others are stored as they are."""
+
+        if "time" in product_cube.dims:
+            product_cube = product_cube.assign_coords(time = to_datetimeindex(product_cube.time.values))
+            product_cube = product_cube.drop_vars([c for c in product_cube.coords if (c != "time") and ("time" in product_cube[c].dims)])
+
+        for name, da in product_cube.data_vars.items():
+            if "time" in da.dims:
+                self.blocks.setdefault(name, []).append(da)
+            else:
+                self.static[name] = da
+
+    def times(self):
+        times = pd.DatetimeIndex([])
+        for blocks in self.blocks.values():
+            for block in blocks:
+                times = times.union(block.indexes["time"])
+        return times.sort_values()
+
+    @staticmethod
+    def assemble_variable(blocks, times):
+        """Write all blocks of one variable into place along the common time axis."""
+
+        if any(block.chunks is not None for block in blocks):
+            # Lazy blocks are concatenated lazily, nothing is loaded into memory here.
+            da = xr.concat(blocks, dim = "time", combine_attrs = "override")
+            da = da.groupby("time").first(skipna = True) if not da.indexes["time"].is_unique else da
+            return da.reindex(time = times)
+
+        first = blocks[0]
+        time_axis = first.dims.index("time")
+        n_covered = len(set().union(*[set(block.indexes["time"]) for block in blocks]))
+        dtype = first.dtype if n_covered == len(times) else np.result_type(first.dtype, np.float32)
+
+        shape = list(first.shape)
+        shape[time_axis] = len(times)
+        if np.issubdtype(dtype, np.floating):
+            data = np.full(shape, np.nan, dtype = dtype)
+        else:
+            data = np.zeros(shape, dtype = dtype)
+        written = np.zeros(len(times), dtype = bool)
+
+        while len(blocks) > 0:
+            block = blocks.pop(0).transpose(*first.dims)
+            idx = times.get_indexer(block.indexes["time"])
+            values = np.moveaxis(block.values, time_axis, 0)
+            target = np.moveaxis(data, time_axis, 0)
+            overlap = written[idx]
+            if overlap.any() and np.issubdtype(dtype, np.floating):
+                # Timesteps loaded twice (e.g. at interval boundaries): keep the existing values, fill gaps only.
+                values = values.copy()
+                values[overlap] = np.where(np.isnan(target[idx[overlap]]), values[overlap], target[idx[overlap]])
+            target[idx] = values
+            written[idx] = True
+
+        coords = {k: v for k, v in first.coords.items() if k != "time"}
+        coords["time"] = times
+
+        return xr.DataArray(data, coords = coords, dims = first.dims, attrs = first.attrs)
+
+    def to_dataset(self, attrs = None):
+        """Assemble all added blocks into a single dataset. The assembler is empty afterwards."""
+
+        times = self.times()
+
+        data_vars = {}
+        for name in list(self.blocks.keys()):
+            data_vars[name] = self.assemble_variable(self.blocks.pop(name), times)
+
+        data_vars.update(self.static)
+        self.static = {}
+
+        return xr.Dataset(data_vars, attrs = attrs or {})
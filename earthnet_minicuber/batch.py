@@ -0,0 +1,301 @@
+"""Batch creation of many minicubes on a persistent process pool.
+
+The batch engine takes a table of specs (CSV or Parquet), one row per minicube, and runs them on a pool of worker processes. Outputs that already exist are skipped and every finished cube is recorded in a manifest (CSV) with its status, duration and error class, so an interrupted batch can simply be restarted.
+
+Table columns:
+- `lon`, `lat`: center pixel of the minicube
+- `time_interval` (or `start_date` and `end_date`)
+- optional `cube_id`: used for the output filename, defaults to a name built from lon, lat and time
+- optional `savepath`: overrides the output path
+- optional `xy_shape` (e.g. "256,256"), `resolution`, `full_time_interval` and `providers` (JSON list of provider configs)
+
+All other specs (and any column missing from the table) are taken from a template specs dictionary.
+"""
+
+import argparse
+import copy
+import datetime
+import json
+import os
+import time
+import traceback
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import pandas as pd
+
+from .execution import BACKENDS, ExecutionBackend
+from .geometry import plan_geometries
+from .retry import CircuitOpenError, backoff_delay, is_retryable, retry_stats
+
+MANIFEST_COLUMNS = ["cube_id", "savepath", "status", "attempts", "retries", "duration", "error_class", "error", "finished_at"]
+
+
+def read_specs_table(path):
+    path = Path(path)
+    if path.suffix in [".parquet", ".pq"]:
+        return pd.read_parquet(path)
+    else:
+        return pd.read_csv(path)
+
+
+def _parse_xy_shape(xy_shape):
+    if isinstance(xy_shape, str):
+        return tuple(int(v) for v in xy_shape.replace("(", "").replace(")", "").split(","))
+    return tuple(int(v) for v in xy_shape)
+
+
+def specs_from_row(row, template = None):
+    """Build a minicube specs dictionary from one row of the specs table."""
+
+    specs = copy.deepcopy(template) if template is not None else {}
+
+    specs["lon_lat"] = (float(row["lon"]), float(row["lat"]))
+
+    if ("time_interval" in row) and pd.notna(row["time_interval"]):
+        specs["time_interval"] = str(row["time_interval"])
+    elif ("start_date" in row) and ("end_date" in row):
+        specs["time_interval"] = f"{str(row['start_date'])[:10]}/{str(row['end_date'])[:10]}"
+
+    if ("full_time_interval" in row) and pd.notna(row["full_time_interval"]):
+        specs["full_time_interval"] = str(row["full_time_interval"])
+
+    if ("xy_shape" in row) and pd.notna(row["xy_shape"]):
+        specs["xy_shape"] = _parse_xy_shape(row["xy_shape"])
+    elif "xy_shape" in specs:
+        specs["xy_shape"] = _parse_xy_shape(specs["xy_shape"])
+
+    if ("resolution" in row) and pd.notna(row["resolution"]):
+        specs["resolution"] = float(row["resolution"])
+
+    if ("providers" in row) and isinstance(row["providers"], str):
+        specs["providers"] = json.loads(row["providers"])
+
+    for key in ["lon_lat", "xy_shape", "resolution", "time_interval", "providers"]:
+        if key not in specs:
+            raise ValueError(f"Specs for row {dict(row)} are missing {key}, add it to the table or the template.")
+
+    return specs
+
+
+def cube_id_from_row(row, specs):
+    if ("cube_id" in row) and pd.notna(row["cube_id"]):
+        return str(row["cube_id"])
+    lon, lat = specs["lon_lat"]
+    start, end = specs["time_interval"][:10], specs["time_interval"][-10:]
+    return f"{lon:.4f}_{lat:.4f}_{start}_{end}"
+
+
+def build_jobs(table, outdir, template = None):
+    """Turn the specs table into a list of jobs, each a dictionary with cube_id, specs, savepath and the planned geometry."""
+
+    outdir = Path(outdir)
+    jobs = []
+    for _, row in table.iterrows():
+        specs = specs_from_row(row, template = template)
+        cube_id = cube_id_from_row(row, specs)
+        if ("savepath" in row) and pd.notna(row["savepath"]):
+            savepath = Path(row["savepath"])
+        else:
+            savepath = outdir/f"{cube_id}.nc"
+        jobs.append({"cube_id": cube_id, "specs": specs, "savepath": str(savepath)})
+
+    for job, geometry in zip(jobs, plan_geometries([job["specs"] for job in jobs])):
+        job["geometry"] = geometry
+
+    return jobs
+
+
+def read_manifest(manifest_path):
+    manifest_path = Path(manifest_path)
+    if not manifest_path.is_file():
+        return pd.DataFrame(columns = MANIFEST_COLUMNS)
+    return pd.read_csv(manifest_path)
+
+
+def append_to_manifest(manifest_path, records):
+    manifest_path = Path(manifest_path)
+    manifest_path.parents[0].mkdir(exist_ok = True, parents = True)
+    # Keep the columns of an existing manifest, e.g. one written before the retries column existed.
+    columns = list(pd.read_csv(manifest_path, nrows = 0).columns) if manifest_path.is_file() else MANIFEST_COLUMNS
+    pd.DataFrame(records).reindex(columns = columns).to_csv(manifest_path, mode = "a", header = not manifest_path.is_file(), index = False)
+
+
+def run_job(job, max_attempts = 3, retry_wait = 10, load_kwargs = None, verbose = False):
+    """Create and save a single minicube, retrying on connection errors. Returns a manifest record.
+
+    Single remote calls are already retried (see earthnet_minicuber.retry), the retries here start the minicube over, reusing checkpoints if a checkpoint_dir is given. The record counts both kinds of retries. If a circuit breaker is open, the retry waits at least until it lets calls through again.
+
+    The minicube is first written to a temporary file that is renamed on success, so an existing output is always complete.
+    """
+    from .minicuber import Minicuber
+    from .tracing import span, trace_context
+
+    load_kwargs = load_kwargs or {}
+
+    savepath = Path(job["savepath"])
+    tmppath = savepath.with_name(savepath.name + ".part")
+
+    starttime = time.time()
+    record = {"cube_id": job["cube_id"], "savepath": str(savepath), "status": "done", "attempts": 0, "retries": 0, "duration": None, "error_class": None, "error": None}
+
+    for attempt in range(max_attempts):
+        record["attempts"] = attempt + 1
+        try:
+            with trace_context(cube_id = job["cube_id"], attempt = attempt + 1), span("cube"), retry_stats() as retries:
+                try:
+                    Minicuber.save_minicube(job["specs"], tmppath, verbose = verbose, geometry = job.get("geometry"), **load_kwargs)
+                finally:
+                    record["retries"] += sum(retries.values())
+            os.replace(tmppath, savepath)
+        except KeyboardInterrupt:
+            raise
+        except Exception as err:
+            record["status"] = "failed"
+            record["error_class"] = type(err).__name__
+            record["error"] = str(err)[:500]
+            if verbose:
+                traceback.print_exc()
+            if isinstance(err, CircuitOpenError) and (attempt + 1 < max_attempts):
+                # Jitter on top, so the waiting workers do not all probe the endpoint at once.
+                time.sleep(err.retry_after + backoff_delay(0, base_delay = retry_wait))
+                continue
+            if is_retryable(err) and (attempt + 1 < max_attempts):
+                time.sleep(backoff_delay(attempt, base_delay = retry_wait, max_delay = 600))
+                continue
+            break
+        else:
+            record["status"] = "done"
+            record["error_class"] = None
+            record["error"] = None
+            break
+
+    if tmppath.is_file():
+        tmppath.unlink()
+
+    record["duration"] = round(time.time() - starttime, 2)
+    record["finished_at"] = datetime.datetime.now().isoformat(timespec = "seconds")
+
+    return record
+
+
+def _init_worker():
+    import warnings
+    warnings.filterwarnings('ignore')
+
+
+def run_batch(table, outdir, template = None, manifest_path = None, n_workers = 4, overwrite = False, max_attempts = 3, retry_wait = 10, load_kwargs = None, verbose = True):
+    """Create all minicubes of a specs table on a persistent process pool.
+
+    Args:
+        table: pandas DataFrame or path to a CSV / Parquet specs table.
+        outdir: Directory for the minicubes without an explicit savepath.
+        template: Specs dictionary providing defaults for all rows.
+        manifest_path: Manifest CSV, defaults to outdir/manifest.csv.
+        n_workers: Number of worker processes.
+        overwrite: If False, minicubes whose output already exists are skipped.
+        max_attempts: Attempts per minicube on connection errors.
+        load_kwargs: Extra keyword arguments for Minicuber.save_minicube and Minicuber.load_minicube, e.g. {"max_workers": 4, "preset": "fast"}.
+
+    Returns:
+        The manifest records of this run as a DataFrame.
+    """
+
+    if not isinstance(table, pd.DataFrame):
+        table = read_specs_table(table)
+
+    outdir = Path(outdir)
+    manifest_path = Path(manifest_path) if manifest_path is not None else outdir/"manifest.csv"
+
+    jobs = build_jobs(table, outdir, template = template)
+
+    todo = []
+    skipped = []
+    for job in jobs:
+        if (not overwrite) and Path(job["savepath"]).is_file():
+            skipped.append(job)
+        else:
+            Path(job["savepath"]).parents[0].mkdir(exist_ok = True, parents = True)
+            todo.append(job)
+
+    if verbose:
+        print(f"{len(jobs)} minicubes, {len(skipped)} already exist, creating {len(todo)}.")
+
+    records = []
+    if len(skipped) > 0:
+        done_ids = set(read_manifest(manifest_path).query("status == 'done'")["cube_id"].astype(str))
+        skipped_records = [{"cube_id": job["cube_id"], "savepath": job["savepath"], "status": "skipped", "attempts": 0, "retries": 0, "duration": 0.0, "error_class": None, "error": None, "finished_at": datetime.datetime.now().isoformat(timespec = "seconds")} for job in skipped if job["cube_id"] not in done_ids]
+        if len(skipped_records) > 0:
+            append_to_manifest(manifest_path, skipped_records)
+        records += skipped_records
+
+    with ProcessPoolExecutor(max_workers = n_workers, initializer = _init_worker) as executor:
+        futures = {executor.submit(run_job, job, max_attempts = max_attempts, retry_wait = retry_wait, load_kwargs = load_kwargs, verbose = False): job for job in todo}
+        for i, future in enumerate(as_completed(futures)):
+            job = futures[future]
+            try:
+                record = future.result()
+            except Exception as err:
+                # The worker process died, e.g. killed by the OOM killer.
+                record = {"cube_id": job["cube_id"], "savepath": job["savepath"], "status": "failed", "attempts": 1, "retries": None, "duration": None, "error_class": type(err).__name__, "error": str(err)[:500], "finished_at": datetime.datetime.now().isoformat(timespec = "seconds")}
+            append_to_manifest(manifest_path, [record])
+            records.append(record)
+            if verbose:
+                print(f"[{i+1}/{len(todo)}] {record['cube_id']}: {record['status']} after {record['duration']} seconds{' (' + record['error_class'] + ')' if record['error_class'] else ''}")
+
+    return pd.DataFrame(records, columns = MANIFEST_COLUMNS)
+
+
+def main(args = None):
+    parser = argparse.ArgumentParser(description = "Create many EarthNet minicubes from a table of specs.")
+    parser.add_argument("table", help = "CSV or Parquet file with one row of specs per minicube.")
+    parser.add_argument("--outdir", required = True, help = "Output directory for the minicubes.")
+    parser.add_argument("--template", default = None, help = "JSON file with default specs for all minicubes.")
+    parser.add_argument("--manifest", default = None, help = "Manifest CSV, defaults to OUTDIR/manifest.csv.")
+    parser.add_argument("--workers", type = int, default = 4, help = "Number of worker processes.")
+    parser.add_argument("--threads", type = int, default = 1, help = "Provider threads per minicube (max_workers of load_minicube).")
+    parser.add_argument("--attempts", type = int, default = 3, help = "Attempts per minicube on connection errors.")
+    parser.add_argument("--overwrite", action = "store_true", help = "Recreate minicubes that already exist.")
+    parser.add_argument("--stac-cache", default = None, help = "Directory of a STAC search cache shared by all workers.")
+    parser.add_argument("--tile-cache", default = None, help = "Directory of a local cache of static layer tiles shared by all workers.")
+    parser.add_argument("--block-cache", default = None, help = "Directory of a local cache of remote raster blocks shared by all workers.")
+    parser.add_argument("--mask-cache", default = None, help = "Directory of a cache of Sentinel 2 cloud mask predictions shared by all workers.")
+    parser.add_argument("--checkpoint-dir", default = None, help = "Scratch directory for per provider and time interval checkpoints, so retries only load what is missing.")
+    parser.add_argument("--stac-concurrency", type = int, default = 8, help = "Concurrent STAC searches per minicube, 0 to search one at a time.")
+    parser.add_argument("--preset", default = "max", choices = ["fast", "balanced", "max"], help = "NetCDF compression preset.")
+    parser.add_argument("--backend", default = "default", choices = BACKENDS, help = "Execution backend of the dask computations in each worker.")
+    parser.add_argument("--backend-workers", type = int, default = None, help = "Threads, processes or distributed workers of the execution backend per worker, defaults to the number of CPUs.")
+    parser.add_argument("--memory-budget", default = None, help = "Estimated memory per loaded time interval, e.g. 2GB, instead of monthly intervals.")
+    parser.add_argument("--trace", default = None, help = "JSON lines file for per stage timings of all workers.")
+    parser.add_argument("--quiet", action = "store_true")
+    args = parser.parse_args(args)
+
+    if args.stac_cache is not None:
+        os.environ["EMC_STAC_CACHE"] = args.stac_cache
+
+    if args.tile_cache is not None:
+        os.environ["EMC_TILE_CACHE"] = args.tile_cache
+
+    if args.block_cache is not None:
+        os.environ["EMC_BLOCK_CACHE"] = args.block_cache
+
+    if args.mask_cache is not None:
+        os.environ["EMC_MASK_CACHE"] = args.mask_cache
+
+    if args.trace is not None:
+        os.environ["EMC_TRACE"] = args.trace
+
+    template = None
+    if args.template is not None:
+        with open(args.template, "r") as fp:
+            template = json.load(fp)
+
+    records = run_batch(args.table, args.outdir, template = template, manifest_path = args.manifest, n_workers = args.workers, overwrite = args.overwrite, max_attempts = args.attempts, load_kwargs = {"max_workers": args.threads, "checkpoint_dir": args.checkpoint_dir, "stac_concurrency": args.stac_concurrency, "preset": args.preset, "backend": ExecutionBackend(args.backend, num_workers = args.backend_workers), "memory_budget": args.memory_budget}, verbose = not args.quiet)
+
+    if not args.quiet:
+        print(records.status.value_counts().to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+"""Offline benchmarks of the minicube pipeline.
+
+The benchmarks run against a local STAC catalog with generated Cloud Optimized GeoTIFFs instead of live endpoints, so timings are reproducible and comparable across library upgrades. Run them with `emc-benchmark` or `python -m earthnet_minicuber.benchmark`.
+"""
+
+from .catalog import LocalCatalog, make_catalog
+from .provider import SyntheticProvider
+from .run import run_benchmark, summarize
+
+
+def register():
+    """Make the SyntheticProvider available to minicube specs under the name "synthetic"."""
+    from ..provider import register_provider
+    register_provider("synthetic", SyntheticProvider)
@@ -0,0 +1,204 @@
+"""A local, file-backed stand-in for a STAC catalog, with generated Cloud Optimized GeoTIFFs.
+
+`make_catalog` writes a small Sentinel 2 like collection (one tile, one item every 5 days, uint16 reflectance bands, an SCL band and a granule metadata file with sun and view angles, so NBAR and processing baseline correction work offline) and a static DEM collection. `LocalCatalog` serves these items through the same `search(...).item_collection()` interface as pystac_client, so providers can use it with `search_items` unchanged.
+"""
+
+import json
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pystac
+import rasterio
+
+from rasterio.transform import from_origin
+
+from ..geometry import get_transformer, utm_epsg
+
+
+S2_BANDS = ["B02", "B03", "B04", "B8A", "SCL"]
+
+S2_REFLECTANCE = {"B02": 800, "B03": 1100, "B04": 1300, "B8A": 2800}
+
+ANGLE_BANDS = ["B01", "B02", "B03", "B04", "B05", "B06", "B07", "B08", "B8A", "B09", "B10", "B11", "B12"]
+
+
+class LocalSearch:
+
+    def __init__(self, items):
+        self.items = items
+
+    def item_collection(self):
+        return pystac.ItemCollection(self.items)
+
+    def matched(self):
+        return len(self.items)
+
+
+class LocalCatalog:
+    """Read-only STAC catalog backed by the item JSON files in root/<collection>/."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self._items = {}
+
+    def get_self_href(self):
+        return self.root.resolve().as_uri()
+
+    def collection_items(self, collection):
+        if collection not in self._items:
+            paths = sorted((self.root/collection).glob("*.json"))
+            self._items[collection] = [pystac.Item.from_file(str(path)) for path in paths]
+        return self._items[collection]
+
+    @staticmethod
+    def _parse_datetime(datetime):
+        start, _, end = datetime.partition("/")
+        end = end or start
+        start = pd.Timestamp(start).tz_localize(None) if start not in ["", ".."] else pd.Timestamp.min
+        end = pd.Timestamp(end).tz_localize(None) if end not in ["", ".."] else pd.Timestamp.max
+        if len(datetime.partition("/")[2] or datetime) == 10:
+            # Dates without time include the whole end day, like in STAC APIs.
+            end = end + pd.Timedelta("1 days") - pd.Timedelta("1 ns")
+        return start, end
+
+    def search(self, collections = None, bbox = None, datetime = None, **kwargs):
+        items = []
+        for collection in (collections or [p.name for p in self.root.iterdir() if p.is_dir()]):
+            items += self.collection_items(collection)
+
+        if bbox is not None:
+            left, bottom, right, top = bbox
+            items = [item for item in items if (item.bbox[0] <= right) and (item.bbox[2] >= left) and (item.bbox[1] <= top) and (item.bbox[3] >= bottom)]
+
+        if datetime is not None:
+            start, end = self._parse_datetime(datetime)
+            items = [item for item in items if start <= pd.Timestamp(item.datetime).tz_localize(None) <= end]
+
+        return LocalSearch(items)
+
+
+def smooth_field(rng, shape, n_waves = 6):
+    """Random smooth 2d field in [0, 1], so that the generated imagery compresses like real imagery and not like white noise."""
+    ny, nx = shape
+    y, x = np.meshgrid(np.linspace(0, 1, ny), np.linspace(0, 1, nx), indexing = "ij")
+    field = np.zeros(shape, dtype = "float32")
+    for _ in range(n_waves):
+        fy, fx = rng.uniform(0.5, 6, size = 2)
+        phase = rng.uniform(0, 2*np.pi)
+        field += np.sin(2*np.pi*(fy*y + fx*x) + phase).astype("float32")
+    field = (field - field.min()) / (field.max() - field.min() + 1e-6)
+    return field
+
+
+def write_cog(path, data, transform, epsg, nodata = None):
+    profile = dict(driver = "COG", width = data.shape[1], height = data.shape[0], count = 1, dtype = data.dtype, crs = f"EPSG:{epsg}", transform = transform, compress = "DEFLATE", blocksize = 512, nodata = nodata)
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(data, 1)
+
+
+def _angle_grid(value, rng):
+    rows = [" ".join(f"{v:.4f}" for v in value + rng.uniform(-0.5, 0.5, 23)) for _ in range(23)]
+    return f"<Values_List>{''.join(f'<VALUES>{row}</VALUES>' for row in rows)}</Values_List>"
+
+
+def write_granule_metadata(path, ulx, uly, epsg, rng):
+    """Minimal Sentinel 2 L2A granule metadata (MTD_TL.xml) with 5 km sun and view angle grids, as read by sen2nbar."""
+    sun_zenith, sun_azimuth = rng.uniform(25, 50), rng.uniform(130, 160)
+    view_grids = "".join(
+        f'<Viewing_Incidence_Angles_Grids bandId="{band_id}" detectorId="1"><Zenith><COL_STEP unit="m">5000</COL_STEP><ROW_STEP unit="m">5000</ROW_STEP>{_angle_grid(rng.uniform(2, 10), rng)}</Zenith><Azimuth><COL_STEP unit="m">5000</COL_STEP><ROW_STEP unit="m">5000</ROW_STEP>{_angle_grid(rng.uniform(90, 110), rng)}</Azimuth></Viewing_Incidence_Angles_Grids>'
+        for band_id in range(len(ANGLE_BANDS))
+    )
+    xml = f"""<?xml version="1.0" encoding="UTF-8"?>
+<n1:Level-2A_Tile_ID xmlns:n1="https://psd-14.sentinel2.eo.esa.int/PSD/S2_PDI_Level-2A_Tile_Metadata.xsd">
+<n1:Geometric_Info>
+<Tile_Geocoding metadataLevel="Brief">
+<HORIZONTAL_CS_NAME>WGS84 / UTM</HORIZONTAL_CS_NAME>
+<HORIZONTAL_CS_CODE>EPSG:{epsg}</HORIZONTAL_CS_CODE>
+<Geoposition resolution="10"><ULX>{ulx}</ULX><ULY>{uly}</ULY><XDIM>10</XDIM><YDIM>-10</YDIM></Geoposition>
+<Geoposition resolution="20"><ULX>{ulx}</ULX><ULY>{uly}</ULY><XDIM>20</XDIM><YDIM>-20</YDIM></Geoposition>
+</Tile_Geocoding>
+<Tile_Angles>
+<Sun_Angles_Grid><Zenith><COL_STEP unit="m">5000</COL_STEP><ROW_STEP unit="m">5000</ROW_STEP>{_angle_grid(sun_zenith, rng)}</Zenith><Azimuth><COL_STEP unit="m">5000</COL_STEP><ROW_STEP unit="m">5000</ROW_STEP>{_angle_grid(sun_azimuth, rng)}</Azimuth></Sun_Angles_Grid>
+{view_grids}
+</Tile_Angles>
+</n1:Geometric_Info>
+</n1:Level-2A_Tile_ID>
+"""
+    Path(path).write_text(xml)
+
+
+def _item(item_id, datetime, bbox_lonlat, epsg, transform, shape, assets, properties = None):
+    left, bottom, right, top = bbox_lonlat
+    geometry = {"type": "Polygon", "coordinates": [[[left, bottom], [right, bottom], [right, top], [left, top], [left, bottom]]]}
+    properties = {"proj:epsg": epsg, "proj:shape": list(shape), "proj:transform": list(transform)[:6], **(properties or {})}
+    item = pystac.Item(id = item_id, geometry = geometry, bbox = list(bbox_lonlat), datetime = datetime.to_pydatetime(), properties = properties)
+    for key, href in assets.items():
+        item.add_asset(key, pystac.Asset(href = str(Path(href).resolve()), media_type = pystac.MediaType.COG if href.endswith(".tif") else pystac.MediaType.XML))
+    return item
+
+
+def make_catalog(root, lon_lat = (11.6, 50.9), extent = 8000, resolution = 10, start = "2021-01-01", end = "2021-12-31", revisit = 5, bands = S2_BANDS, seed = 42):
+    """Generate a local catalog with a Sentinel 2 like collection "s2" and a static collection "dem".
+
+    Args:
+        root: Directory of the catalog. Existing items are overwritten.
+        lon_lat: Center of the tile.
+        extent: Width and height of the tile in metres.
+        resolution: Pixel size in metres.
+        start, end: First and last date of the "s2" items.
+        revisit: Days between "s2" items.
+        bands: Assets of the "s2" items, reflectance bands from S2_REFLECTANCE and/or "SCL".
+        seed: Seed of the random generator, the same arguments give the same catalog.
+
+    Returns:
+        LocalCatalog
+    """
+    root = Path(root)
+    rng = np.random.default_rng(seed)
+
+    epsg = int(utm_epsg(lon_lat[0], lon_lat[1])[0])
+    transformer = get_transformer(4326, epsg)
+    x_center, y_center = transformer.transform(*lon_lat)
+
+    size = int(extent // resolution)
+    ulx, uly = float(np.floor((x_center - extent/2) / 60) * 60), float(np.ceil((y_center + extent/2) / 60) * 60)
+    transform = from_origin(ulx, uly, resolution, resolution)
+    bbox_lonlat = transformer.transform_bounds(ulx, uly - size*resolution, ulx + size*resolution, uly, direction = "INVERSE")
+
+    base = smooth_field(rng, (size, size))
+
+    s2_dir = root/"s2"
+    s2_dir.mkdir(parents = True, exist_ok = True)
+    for i, date in enumerate(pd.date_range(start, end, freq = f"{revisit}D")):
+        item_id = f"S2X_MSIL2A_{date.strftime('%Y%m%d')}T103021_R065_T32UPB"
+        cloud = smooth_field(rng, (size, size), n_waves = 3) > rng.uniform(0.5, 1.1)
+
+        assets = {}
+        for band in bands:
+            path = s2_dir/f"{item_id}_{band}.tif"
+            if band == "SCL":
+                scl = np.where(cloud, 9, np.where(base > 0.6, 5, 4)).astype("uint8")
+                write_cog(path, scl, transform, epsg, nodata = 0)
+            else:
+                reflectance = S2_REFLECTANCE[band] * (0.6 + 0.8*base) + 300*rng.standard_normal((size, size))
+                reflectance = np.where(cloud, 6000 + 500*base, reflectance) + 1000
+                write_cog(path, np.clip(reflectance, 1, 65535).astype("uint16"), transform, epsg, nodata = 0)
+            assets[band] = str(path)
+
+        metadata_path = s2_dir/f"{item_id}_MTD_TL.xml"
+        write_granule_metadata(metadata_path, ulx, uly, epsg, rng)
+        assets["granule-metadata"] = str(metadata_path)
+
+        item = _item(item_id, date, bbox_lonlat, epsg, transform, (size, size), assets, properties = {"s2:processing_baseline": "04.00" if i % 2 else "03.01", "eo:cloud_cover": float(cloud.mean()*100)})
+        (s2_dir/f"{item_id}.json").write_text(json.dumps(item.to_dict()))
+
+    dem_dir = root/"dem"
+    dem_dir.mkdir(parents = True, exist_ok = True)
+    dem_path = dem_dir/"dem.tif"
+    write_cog(dem_path, (200 + 800*smooth_field(rng, (size, size))).astype("float32"), transform, epsg)
+    item = _item("dem", pd.Timestamp(start), bbox_lonlat, epsg, transform, (size, size), {"data": str(dem_path)})
+    (dem_dir/"dem.json").write_text(json.dumps(item.to_dict()))
+
+    return LocalCatalog(root)
@@ -0,0 +1,124 @@
+"""Throughput and parity of the cloud mask runtimes.
+
+Every runtime of earthnet_minicuber.provider.s2.runtimes is compiled from the same model and runs CloudMask.predict on the same inputs, so the timings compare like with like. Parity is measured against the eager model on the benchmark inputs and, with a reference file, against stored inputs and masks of the eager model, e.g. saved with --save-reference from a known good installation.
+
+Without --pretrained the model is randomly initialized from the seed, so nothing is downloaded; the parity of the int8 runtime is only meaningful with the trained weights.
+"""
+
+import argparse
+import time
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import torch
+
+from ..provider.s2.cloudmask import CloudMask
+from ..provider.s2.runtimes import RUNTIMES, compile_model, parity
+from .catalog import S2_BANDS
+
+
+def benchmark_inputs(timesteps = 16, size = 256, n_bands = 13, seed = 0):
+    """Scaled Sentinel 2 like inputs (time, band, y, x): smooth random fields with noise."""
+    rng = np.random.default_rng(seed)
+    coarse = rng.uniform(0, 1, (timesteps, n_bands, size // 16 + 1, size // 16 + 1))
+    fields = np.kron(coarse, np.ones((16, 16)))[..., :size, :size]
+    return (fields + rng.normal(0, 0.02, fields.shape)).astype("float32")
+
+
+def save_reference(path, cloud_mask, x):
+    """Store inputs x and the masks of the eager model for later parity checks."""
+    cloud_mask.compiled_model = cloud_mask.model
+    with torch.inference_mode():
+        mask = cloud_mask.predict(x)
+    np.savez_compressed(path, x = x, mask = mask.astype("uint8"))
+
+
+def run_cloudmask_benchmark(runtimes = RUNTIMES, timesteps = 16, size = 256, repeats = 3, batch_size = 4, num_threads = None, reference = None, pretrained = False, seed = 0, verbose = True):
+    """Time CloudMask.predict with every runtime and check its parity with the eager model.
+
+    Args:
+        runtimes: Runtimes to compare, unavailable ones (e.g. without onnxruntime) are skipped.
+        timesteps, size: Shape of the generated inputs.
+        repeats: Timed runs per runtime, after one warm up run.
+        batch_size, num_threads: CloudMask settings.
+        reference: npz file from save_reference.
+        pretrained: Use the trained weights instead of random ones.
+        seed: Seed of the inputs and the random weights.
+
+    Returns:
+        pandas.DataFrame with one row per runtime.
+    """
+    torch.manual_seed(seed)
+    cloud_mask = CloudMask(bands = S2_BANDS, pretrained = pretrained, batch_size = batch_size, num_threads = num_threads)
+    x = benchmark_inputs(timesteps, size, n_bands = len(cloud_mask.ckpt_bands), seed = seed)
+    ref = np.load(reference) if reference is not None else None
+
+    if num_threads:
+        torch.set_num_threads(num_threads)
+
+    records = []
+    for runtime in runtimes:
+        try:
+            compiled = compile_model(cloud_mask.model, runtime, in_channels = len(cloud_mask.ckpt_bands), num_threads = num_threads)
+        except ImportError as e:
+            if verbose:
+                print(f"Skipping {runtime}: {e}")
+            continue
+        cloud_mask.compiled_model = compiled
+
+        seconds = []
+        with torch.inference_mode():
+            for i in range(repeats + 1):
+                start = time.perf_counter()
+                cloud_mask.predict(x)
+                if i > 0:
+                    seconds.append(time.perf_counter() - start)
+
+        record = {"runtime": runtime, "seconds": float(np.median(seconds)), "megapixels_per_second": x[:, 0].size / 1e6 / float(np.median(seconds))}
+        record.update(parity(cloud_mask.model, compiled, x, batch_size = batch_size))
+        if ref is not None:
+            with torch.inference_mode():
+                record["reference_agreement"] = float((cloud_mask.predict(ref["x"]) == ref["mask"]).mean())
+        records.append(record)
+        if verbose:
+            print(", ".join(f"{k} {v:.4g}" if isinstance(v, float) else f"{k} {v}" for k, v in record.items()))
+
+    cloud_mask.compiled_model = cloud_mask.model
+    return pd.DataFrame(records)
+
+
+def main(args = None):
+    parser = argparse.ArgumentParser(description = "Throughput and parity of the cloud mask runtimes.")
+    parser.add_argument("--runtimes", nargs = "+", default = RUNTIMES, choices = RUNTIMES)
+    parser.add_argument("--timesteps", type = int, default = 16)
+    parser.add_argument("--size", type = int, default = 256, help = "Height and width of the inputs in pixels.")
+    parser.add_argument("--repeats", type = int, default = 3)
+    parser.add_argument("--batch-size", type = int, default = 4)
+    parser.add_argument("--threads", type = int, default = None, help = "Intra-op threads, torch's default if not set.")
+    parser.add_argument("--reference", default = None, help = "npz file of inputs and eager masks to check parity against.")
+    parser.add_argument("--save-reference", default = None, help = "Write the inputs and eager masks of this run to an npz file.")
+    parser.add_argument("--pretrained", action = "store_true", help = "Use the trained weights (downloads the checkpoint).")
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--output", default = None, help = "CSV file for the results.")
+    args = parser.parse_args(args)
+
+    results = run_cloudmask_benchmark(runtimes = args.runtimes, timesteps = args.timesteps, size = args.size, repeats = args.repeats, batch_size = args.batch_size, num_threads = args.threads, reference = args.reference, pretrained = args.pretrained, seed = args.seed)
+
+    if args.save_reference:
+        torch.manual_seed(args.seed)
+        cloud_mask = CloudMask(bands = S2_BANDS, pretrained = args.pretrained, batch_size = args.batch_size)
+        save_reference(args.save_reference, cloud_mask, benchmark_inputs(args.timesteps, args.size, n_bands = len(cloud_mask.ckpt_bands), seed = args.seed))
+
+    if args.output:
+        Path(args.output).parents[0].mkdir(exist_ok = True, parents = True)
+        results.to_csv(args.output, index = False)
+
+    print(results.round(4).to_string(index = False))
+
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import numpy as np
+import stackstac
+
+from rasterio import RasterioIOError
+
+from ..provider import provider_base
+from ..execution import get_backend
+from ..provider.stac import search_items
+from .catalog import LocalCatalog
+
+
+class SyntheticProvider(provider_base.Provider):
+    """Provider reading a collection of a LocalCatalog, the same way the STAC providers read remote collections."""
+
+    def __init__(self, root, collection = "s2", bands = None, is_temporal = True, name = "syn"):
+        """
+        Args:
+            root: Directory of a catalog generated with make_catalog.
+            collection: Collection to load, "s2" or "dem".
+            bands: Assets to load, all if None.
+            is_temporal: If False, the median over time is returned.
+            name: Prefix of the variable names.
+        """
+        self.is_temporal = is_temporal
+        self.name = name
+        self.collection = collection
+        self.bands = bands
+        self.catalog = LocalCatalog(root)
+
+    def load_data(self, bbox, time_interval, **kwargs):
+
+        items = search_items(self.catalog, [self.collection], bbox = bbox, datetime = time_interval if self.is_temporal else None)
+
+        if len(items) == 0:
+            return None
+
+        epsg = items[0].properties["proj:epsg"]
+
+        bands = self.bands or [k for k, v in items[0].assets.items() if v.href.endswith(".tif")]
+
+        stack = stackstac.stack(items, epsg = epsg, assets = bands, dtype = "float32", rescale = False, fill_value = np.float32(np.nan), properties = False, band_coords = False, bounds_latlon = bbox, xy_coords = 'center', chunksize = get_backend().chunksize(2048), errors_as_nodata = (RasterioIOError('.*'), ))
+
+        if self.is_temporal:
+            stack["time"] = np.array([str(d)[:10] for d in stack.time.values], dtype = "datetime64[D]")
+        else:
+            stack = stack.median("time")
+
+        stack["band"] = [f"{self.name}_{b}" for b in bands]
+
+        stack = stack.to_dataset("band")
+
+        for band in bands:
+            stack[f"{self.name}_{band}"].attrs = {"provider": "Synthetic", "interpolation_type": "nearest" if band == "SCL" else "linear"}
+
+        stack = stack.drop_vars([c for c in stack.coords if c not in stack.dims])
+
+        stack.attrs["epsg"] = epsg
+
+        return stack
@@ -0,0 +1,216 @@
+"""Timing of the minicube pipeline stages on the local benchmark catalog.
+
+For every combination of cube size and interval length, the stages are timed separately:
+
+- load_minicube: the full pipeline (search, read, regrid, assemble) with the synthetic providers, computed.
+- regrid_product_cube: regridding one computed Sentinel 2 like product cube, including building the regrid plan.
+- correct_processing_baseline, CloudMask.__call__, call_sen2nbar: the Sentinel 2 post-processing steps on a computed stack, as in Sentinel2.load_data.
+- save_minicube_netcdf: saving the minicube from load_minicube.
+
+Nothing is downloaded, the cloud mask model is randomly initialized, so the numbers only depend on the machine and the installed libraries.
+"""
+
+import argparse
+import json
+import platform
+import shutil
+import tempfile
+import time
+
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import stackstac
+
+from ..execution import BACKENDS, ExecutionBackend, compute, execution
+from ..minicuber import Minicuber
+from ..provider.s2.cloudmask import CloudMask
+from ..provider.s2.nbar import call_sen2nbar, correct_processing_baseline
+from ..provider.stac import search_items
+from .. import regrid
+from .catalog import LocalCatalog, S2_BANDS, make_catalog
+
+
+class StageTimer:
+
+    def __init__(self, **info):
+        self.info = info
+        self.records = []
+
+    @contextmanager
+    def __call__(self, stage):
+        start = time.perf_counter()
+        yield
+        self.records.append({"stage": stage, **self.info, "seconds": time.perf_counter() - start})
+
+
+def catalog_params(sizes, months, resolution, lon_lat, start, seed):
+    return {
+        "lon_lat": list(lon_lat),
+        "extent": int((max(sizes) + 12) * resolution + 2000),
+        "resolution": 10,
+        "start": start,
+        "end": (pd.Timestamp(start) + pd.DateOffset(months = max(months))).strftime("%Y-%m-%d"),
+        "seed": seed
+    }
+
+
+def prepare_catalog(root, params):
+    """Generate the catalog, unless root already holds one generated with the same parameters."""
+    root = Path(root)
+    params_path = root/"benchmark.json"
+    if params_path.is_file() and json.loads(params_path.read_text()) == params:
+        return LocalCatalog(root)
+    if root.exists():
+        shutil.rmtree(root)
+    catalog = make_catalog(root, **params)
+    params_path.write_text(json.dumps(params))
+    return catalog
+
+
+def benchmark_specs(root, xy_size, months, resolution = 20, lon_lat = (11.6, 50.9), start = "2021-01-01"):
+    end = pd.Timestamp(start) + pd.DateOffset(months = months) - pd.Timedelta("1 days")
+    return {
+        "lon_lat": tuple(lon_lat),
+        "xy_shape": (xy_size, xy_size),
+        "resolution": resolution,
+        "time_interval": f"{start}/{end.strftime('%Y-%m-%d')}",
+        "providers": [
+            {"name": "synthetic", "kwargs": {"root": str(root), "collection": "s2", "bands": S2_BANDS, "name": "s2"}},
+            {"name": "synthetic", "kwargs": {"root": str(root), "collection": "dem", "is_temporal": False, "name": "dem"}},
+        ]
+    }
+
+
+def run_case(root, outdir, xy_size, months, cloud_mask, repeat = 0, max_workers = 1, resolution = 20, lon_lat = (11.6, 50.9), start = "2021-01-01", backend = None):
+    with execution(backend):
+        return _run_case(root, outdir, xy_size, months, cloud_mask, repeat = repeat, max_workers = max_workers, resolution = resolution, lon_lat = lon_lat, start = start)
+
+
+def _run_case(root, outdir, xy_size, months, cloud_mask, repeat, max_workers, resolution, lon_lat, start):
+
+    specs = benchmark_specs(root, xy_size, months, resolution = resolution, lon_lat = lon_lat, start = start)
+    timer = StageTimer(xy_size = xy_size, months = months, repeat = repeat)
+
+    with timer("load_minicube"):
+        minicube = Minicuber.load_minicube(specs, verbose = False, compute = True, max_workers = max_workers)
+
+    minicuber = Minicuber(specs)
+    product_cube = compute(minicuber.load_product(minicuber.temporal_providers[0], minicuber.time_interval))
+    regrid._PLAN_CACHE.clear()
+    with timer("regrid_product_cube"):
+        compute(minicuber.regrid_product_cube(product_cube))
+
+    items = search_items(LocalCatalog(root), ["s2"], bbox = minicuber.padded_bbox, datetime = minicuber.time_interval)
+    epsg = items[0].properties["proj:epsg"]
+    stack = stackstac.stack(items, epsg = epsg, assets = S2_BANDS, dtype = "float32", rescale = False, fill_value = np.float32(np.nan), properties = False, band_coords = False, bounds_latlon = minicuber.padded_bbox, xy_coords = 'center', chunksize = 2048)
+    stack = compute(stack)
+
+    with timer("correct_processing_baseline"):
+        stack = correct_processing_baseline(stack, items)
+    with timer("CloudMask.__call__"):
+        stack = cloud_mask(stack)
+    with timer("call_sen2nbar"):
+        call_sen2nbar(stack, items, epsg)
+
+    with timer("save_minicube_netcdf"):
+        Minicuber.save_minicube_netcdf(minicube, Path(outdir)/f"minicube_{xy_size}_{months}_{repeat}.nc")
+
+    n_timesteps = len(minicube.time) if "time" in minicube.dims else 0
+    return [{**record, "n_timesteps": n_timesteps} for record in timer.records]
+
+
+def run_benchmark(root = None, sizes = (64, 128), months = (1, 3), repeats = 3, max_workers = 1, resolution = 20, lon_lat = (11.6, 50.9), start = "2021-01-01", seed = 42, verbose = True, backend = None):
+    """Time all stages for every cube size and interval length.
+
+    Args:
+        root: Directory of the benchmark catalog, reused across runs. A temporary directory if None.
+        sizes: Minicube sizes in pixels (xy_shape is size x size).
+        months: Interval lengths in months.
+        repeats: Runs per combination.
+        max_workers: max_workers of load_minicube.
+        backend: Execution backend of all stages, see earthnet_minicuber.execution.
+        resolution: Minicube resolution in metres.
+        lon_lat: Center of the minicubes and the catalog tile.
+        start: Start date of all intervals.
+        seed: Seed of the generated catalog.
+
+    Returns:
+        pandas.DataFrame with one row per stage and run.
+    """
+    from . import register
+    register()
+
+    tmpdir = tempfile.TemporaryDirectory()
+    root = Path(root) if root is not None else Path(tmpdir.name)/"catalog"
+
+    try:
+        if verbose:
+            print(f"Preparing benchmark catalog in {root}")
+        prepare_catalog(root, catalog_params(sizes, months, resolution, lon_lat, start, seed))
+
+        cloud_mask = CloudMask(bands = S2_BANDS, pretrained = False)
+
+        records = []
+        for xy_size in sizes:
+            for n_months in months:
+                for repeat in range(repeats):
+                    with tempfile.TemporaryDirectory() as outdir:
+                        case = run_case(root, outdir, xy_size, n_months, cloud_mask, repeat = repeat, max_workers = max_workers, resolution = resolution, lon_lat = lon_lat, start = start, backend = backend)
+                    records += case
+                    if verbose:
+                        print(f"size {xy_size}, {n_months} months, run {repeat}: " + ", ".join(f"{r['stage']} {r['seconds']:.2f}s" for r in case))
+    finally:
+        tmpdir.cleanup()
+
+    return pd.DataFrame(records)
+
+
+def summarize(results):
+    """Median seconds per stage, cube size and interval length."""
+    return results.groupby(["stage", "xy_size", "months"], sort = False)["seconds"].median().unstack(["xy_size", "months"])
+
+
+def environment():
+    import dask, rasterio, torch, xarray
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": __import__("os").cpu_count(),
+        "numpy": np.__version__,
+        "xarray": xarray.__version__,
+        "dask": dask.__version__,
+        "rasterio": rasterio.__version__,
+        "gdal": rasterio.__gdal_version__,
+        "torch": torch.__version__,
+    }
+
+
+def main(args = None):
+    parser = argparse.ArgumentParser(description = "Offline benchmark of the minicube pipeline stages on a generated local STAC catalog.")
+    parser.add_argument("--root", default = None, help = "Directory of the benchmark catalog, reused if it was generated with the same parameters.")
+    parser.add_argument("--sizes", type = int, nargs = "+", default = [64, 128], help = "Minicube sizes in pixels.")
+    parser.add_argument("--months", type = int, nargs = "+", default = [1, 3], help = "Interval lengths in months.")
+    parser.add_argument("--repeats", type = int, default = 3, help = "Runs per size and interval length.")
+    parser.add_argument("--threads", type = int, default = 1, help = "Provider threads (max_workers of load_minicube).")
+    parser.add_argument("--backend", default = "default", choices = BACKENDS, help = "Execution backend of the dask computations.")
+    parser.add_argument("--backend-workers", type = int, default = None, help = "Threads, processes or distributed workers of the execution backend.")
+    parser.add_argument("--seed", type = int, default = 42)
+    parser.add_argument("--output", default = None, help = "CSV file for the timings of all runs.")
+    parser.add_argument("--quiet", action = "store_true")
+    args = parser.parse_args(args)
+
+    results = run_benchmark(root = args.root, sizes = args.sizes, months = args.months, repeats = args.repeats, max_workers = args.threads, seed = args.seed, verbose = not args.quiet, backend = ExecutionBackend(args.backend, num_workers = args.backend_workers))
+
+    if args.output:
+        Path(args.output).parents[0].mkdir(exist_ok = True, parents = True)
+        results.to_csv(args.output, index = False)
+        Path(args.output).with_suffix(".json").write_text(json.dumps(environment(), indent = 2))
+
+    print(json.dumps(environment()))
+    print(summarize(results).round(3).to_string())
+
+    return results
@@ -0,0 +1,177 @@
+"""On-disk caches shared between threads and processes.
+
+Entries are plain files below a cache directory, named by the hash of their key. Writes go to a temporary file that is atomically renamed into place, so concurrent readers never see partial entries and concurrent writers of the same key simply overwrite each other with identical content. The file modification time is the creation time (used for the TTL), the access time is updated on every hit (used for least-recently-used eviction once the cache grows above max_bytes).
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from contextlib import contextmanager
+from pathlib import Path
+
+
+def hash_key(key):
+    if not isinstance(key, str):
+        key = json.dumps(key, sort_keys = True, default = str)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def parse_bytes(size):
+    """Parse sizes like 1000, "500MB" or "2 GB" to a number of bytes."""
+    if size is None or isinstance(size, (int, float)):
+        return size
+    size = size.strip().upper().replace(" ", "")
+    for unit, factor in [("TB", 1e12), ("GB", 1e9), ("MB", 1e6), ("KB", 1e3), ("B", 1)]:
+        if size.endswith(unit):
+            return int(float(size[:-len(unit)]) * factor)
+    return int(size)
+
+
+class DiskCache:
+
+    def __init__(self, path, max_bytes = "1GB", ttl = None, evict_every = 100):
+        """
+        Args:
+            path: Cache directory, created if it does not exist.
+            max_bytes: Size limit of the cache, least recently used entries are evicted above it. None for no limit.
+            ttl: Time to live of an entry in seconds. None for no expiry.
+            evict_every: Number of writes between two size checks.
+        """
+        self.path = Path(path)
+        self.path.mkdir(exist_ok = True, parents = True)
+        self.max_bytes = parse_bytes(max_bytes)
+        self.ttl = ttl
+        self.evict_every = evict_every
+
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({str(self.path)!r}, max_bytes = {self.max_bytes}, ttl = {self.ttl})"
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+    def entry_path(self, key, suffix = ""):
+        h = hash_key(key)
+        return self.path/h[:2]/f"{h}{suffix}"
+
+    def lookup(self, key, suffix = ""):
+        """Path of a valid entry for key, or None. Counts as hit or miss."""
+        path = self.entry_path(key, suffix)
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            self._count(hit = False)
+            return None
+
+        if (self.ttl is not None) and (time.time() - stat.st_mtime > self.ttl):
+            self._unlink(path)
+            self._count(hit = False)
+            return None
+
+        try:
+            os.utime(path, (time.time(), stat.st_mtime))
+        except OSError:
+            pass
+
+        self._count(hit = True)
+        return path
+
+    def get_bytes(self, key, suffix = ""):
+        path = self.lookup(key, suffix)
+        if path is None:
+            return None
+        try:
+            return path.read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def put_bytes(self, key, data, suffix = ""):
+        with self.writing(key, suffix) as tmppath:
+            Path(tmppath).write_bytes(data)
+
+    def get_json(self, key, suffix = ".json"):
+        data = self.get_bytes(key, suffix)
+        return json.loads(data) if data is not None else None
+
+    def put_json(self, key, obj, suffix = ".json"):
+        self.put_bytes(key, json.dumps(obj).encode("utf-8"), suffix)
+
+    @contextmanager
+    def writing(self, key, suffix = ""):
+        """Context manager yielding a temporary path, which is moved to the entry for key on success."""
+        path = self.entry_path(key, suffix)
+        path.parents[0].mkdir(exist_ok = True, parents = True)
+        fd, tmppath = tempfile.mkstemp(dir = path.parents[0], prefix = ".tmp-", suffix = suffix)
+        os.close(fd)
+        try:
+            yield tmppath
+            os.replace(tmppath, path)
+        finally:
+            self._unlink(Path(tmppath))
+
+        with self._lock:
+            self._writes += 1
+            evict = (self.max_bytes is not None) and (self._writes % self.evict_every == 1)
+        if evict:
+            self.evict()
+
+    def entries(self):
+        for path in self.path.glob("*/*"):
+            if path.name.startswith(".tmp-"):
+                continue
+            try:
+                yield path, path.stat()
+            except FileNotFoundError:
+                continue
+
+    def size(self):
+        return sum(stat.st_size for _, stat in self.entries())
+
+    def evict(self):
+        """Remove expired entries, then least recently used entries until the cache is below 90% of max_bytes."""
+        now = time.time()
+        entries = []
+        for path, stat in self.entries():
+            if (self.ttl is not None) and (now - stat.st_mtime > self.ttl):
+                self._unlink(path)
+            else:
+                entries.append((stat.st_atime, stat.st_size, path))
+
+        if self.max_bytes is None:
+            return
+
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return
+
+        for _, size, path in sorted(entries, key = lambda e: e[0]):
+            if total <= 0.9 * self.max_bytes:
+                break
+            self._unlink(path)
+            total -= size
+
+    def clear(self):
+        for path, _ in self.entries():
+            self._unlink(path)
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
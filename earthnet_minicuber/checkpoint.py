@@ -0,0 +1,57 @@
+"""Checkpoints of partially built minicubes.
+
+While a minicube is loaded with compute = True, every regridded provider cube is saved per (provider, time interval) to a scratch directory. If loading fails late, e.g. because of a timeout in month 30 of 36, a retry with the same specs and scratch directory only fetches what is missing. The checkpoints are removed once the minicube is complete.
+"""
+
+import os
+import shutil
+
+from pathlib import Path
+
+import pandas as pd
+import xarray as xr
+
+from .cache import hash_key
+
+
+class Checkpointer:
+
+    def __init__(self, scratch_dir, specs):
+        self.path = Path(scratch_dir)/hash_key({k: v for k, v in specs.items() if k not in ["primary_provider", "other_providers"]})
+
+    @staticmethod
+    def provider_key(idx, provider):
+        return f"{idx}_{provider.__class__.__name__}"
+
+    def _path(self, provider_key, time_interval):
+        name = f"{provider_key}_{time_interval.replace('/', '_')}" if time_interval else provider_key
+        return self.path/f"{name}.nc", self.path/f"{name}.none"
+
+    def exists(self, provider_key, time_interval = None):
+        return any(path.is_file() for path in self._path(provider_key, time_interval))
+
+    def load(self, provider_key, time_interval = None):
+        """Returns (found, product_cube). product_cube is None if the provider had no data."""
+        path, none_path = self._path(provider_key, time_interval)
+        if none_path.is_file():
+            return True, None
+        if path.is_file():
+            with xr.open_dataset(path) as ds:
+                return True, ds.load()
+        return False, None
+
+    def save(self, provider_key, product_cube, time_interval = None):
+        path, none_path = self._path(provider_key, time_interval)
+        self.path.mkdir(exist_ok = True, parents = True)
+        if product_cube is None:
+            none_path.touch()
+            return
+        if "time" in product_cube.dims:
+            product_cube = product_cube.assign_coords(time = pd.DatetimeIndex(pd.to_datetime(product_cube.time.values)))
+        tmppath = path.with_name(f".tmp-{os.getpid()}-{path.name}")
+        product_cube.to_netcdf(tmppath)
+        os.replace(tmppath, path)
+
+    def cleanup(self):
+        if self.path.exists():
+            shutil.rmtree(self.path, ignore_errors = True)
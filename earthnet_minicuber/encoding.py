@@ -0,0 +1,121 @@
+"""Encoding of minicubes for saving.
+
+Packing a variable to int16 needs its minimum and maximum. `variable_stats` gathers both for all variables in one pass: lazy variables in a single dask computation, so every chunk is loaded once, in-memory variables in parallel on a thread pool (the numpy reductions release the GIL). Compression presets trade file size against save time, and linear variables can optionally be bit-rounded instead of packed.
+"""
+
+import warnings
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .execution import compute_all
+
+
+NETCDF_PRESETS = {
+    "fast": {"zlib": True, "complevel": 1},
+    "balanced": {"zlib": True, "complevel": 4},
+    "max": {"zlib": True, "complevel": 9},
+}
+
+
+def scale_and_offset(vmin, vmax, n = 16):
+    """Offset and scale factor to pack values in [vmin, vmax] into n bit integers."""
+
+    # stretch/compress data to the available packed range
+    scale_factor = (vmax - vmin) / (2 ** n - 1)
+
+    # translate the range to be symmetric about zero
+    add_offset = vmin + 2 ** (n - 1) * scale_factor
+
+    return scale_factor, add_offset
+
+
+def is_linear(da):
+    return ("interpolation_type" in da.attrs) and (da.attrs["interpolation_type"] == "linear")
+
+
+def _nanminmax(values):
+    values = np.asarray(values)
+    if values.size == 0 or not (np.issubdtype(values.dtype, np.number) or values.dtype == bool):
+        return np.nan, np.nan
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning) # All-NaN variables
+        return float(np.nanmin(values)), float(np.nanmax(values))
+
+
+def variable_stats(minicube, variables = None, max_workers = None):
+    """(min, max) ignoring NaN of each variable, computed in one pass over the data."""
+
+    variables = list(minicube.variables) if variables is None else variables
+
+    lazy = [v for v in variables if minicube[v].chunks is not None]
+    eager = [v for v in variables if minicube[v].chunks is None]
+
+    stats = {}
+    if len(lazy) > 0:
+        results = compute_all(*[(minicube[v].min(), minicube[v].max()) for v in lazy])
+        stats.update({v: (float(vmin), float(vmax)) for v, (vmin, vmax) in zip(lazy, results)})
+
+    with ThreadPoolExecutor(max_workers = max_workers) as executor:
+        stats.update(zip(eager, executor.map(lambda v: _nanminmax(minicube[v].values), eager)))
+
+    return stats
+
+
+def bitround(values, keepbits):
+    """Round float values to keepbits (0 to 23, more keeps all) mantissa bits (round to nearest), so they compress much better."""
+
+    if keepbits < 0:
+        raise ValueError(f"keepbits must be at least 0, got {keepbits}.")
+    values = np.asarray(values, dtype = "float32")
+    if keepbits >= 23:
+        return values
+    bits = values.view("uint32")
+    maskbits = 23 - keepbits
+    mask = np.uint32((0xFFFFFFFF >> maskbits) << maskbits)
+    half_quantum = np.uint32(1 << (maskbits - 1))
+    rounded = ((bits + half_quantum) & mask).view("float32")
+    # Values next to the float32 maximum would round up to Inf, they are truncated instead
+    rounded = np.where(np.isfinite(rounded), rounded, (bits & mask).view("float32"))
+    # Keep NaN and Inf as they are
+    return np.where(np.isfinite(values), rounded, values)
+
+
+def packing_encoding(da, stats, n = 16):
+    """int16 packing (scale_factor, add_offset) of a variable from its (min, max), empty if it is stored as is."""
+
+    vmin, vmax = stats
+
+    if is_linear(da):
+        scale_factor, add_offset = scale_and_offset(vmin, vmax, n = n)
+    else:
+        scale_factor, add_offset = 1.0, 0.0
+
+    if abs(scale_factor) < 1e-8 or np.isnan(scale_factor) or (scale_factor == 1.0 and vmax > 32766):
+        return {}
+    else:
+        return {
+            "dtype": 'int16',
+            "scale_factor": scale_factor,
+            "add_offset": add_offset,
+            "_FillValue": -32767,
+        }
+
+
+def encode_minicube(minicube, variables, keepbits = None, max_workers = None):
+    """Encoding of the given variables, and the minicube with linear variables bit-rounded if keepbits is given.
+
+    Bit-rounded variables are stored as float32 instead of packed to int16: they keep keepbits mantissa bits of relative precision at any magnitude.
+    """
+
+    rounded = [v for v in variables if keepbits is not None and is_linear(minicube[v]) and np.issubdtype(minicube[v].dtype, np.floating)]
+    if len(rounded) > 0:
+        with ThreadPoolExecutor(max_workers = max_workers) as executor:
+            minicube = minicube.assign({v: minicube[v].copy(data = data) for v, data in zip(rounded, executor.map(lambda v: bitround(minicube[v].values, keepbits), rounded))})
+
+    stats = variable_stats(minicube, [v for v in variables if v not in rounded], max_workers = max_workers)
+
+    encoding = {v: ({"dtype": "float32"} if v in rounded else packing_encoding(minicube[v], stats[v])) for v in variables}
+
+    return minicube, encoding
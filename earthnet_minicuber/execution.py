@@ -0,0 +1,149 @@
+"""Execution backends for the dask computations of the package.
+
+Every computation of the package (the Sentinel 2 stack for the cloud mask, the product cubes of each time interval, the minicube, the statistics for packing and saving) runs through `compute` / `compute_all` or inside `activate()`, so all of them use the same backend: the one set with `execution(...)` or the backend argument of Minicuber.load_minicube. Without a backend, dask's globally configured scheduler is used, as before.
+
+Backends:
+
+- "sync": everything in the calling thread. For debugging and profiling, or when many minicubes run in parallel processes anyway (e.g. emc-batch with many workers).
+- "threads": a pool of num_workers threads. Reading, decompression and numpy release the GIL, pure Python steps do not.
+- "processes": a pool of num_workers processes, which sidesteps the GIL at the cost of sending results back to the main process.
+- "distributed": a dask.distributed LocalCluster of num_workers worker processes with threads_per_worker threads each. Needs the distributed package.
+
+Pools and clusters are created on first use and shared by all backends with the same settings in a process. Process pools and clusters start new Python processes, so scripts using them need an `if __name__ == "__main__":` guard.
+
+Each backend also has a default spatial chunk size for the stackstac reads of the providers: the providers' own chunk sizes for "sync" and the default backend, at most 1024 pixels for the parallel backends, so that single timesteps of large minicubes are split over several workers.
+"""
+
+import contextvars
+import multiprocessing
+import os
+import threading
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+
+import dask
+
+BACKENDS = ["default", "sync", "threads", "processes", "distributed"]
+
+CHUNKSIZES = {"default": None, "sync": None, "threads": 1024, "processes": 1024, "distributed": 1024}
+
+_BACKEND = contextvars.ContextVar("emc_backend", default = None)
+
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+
+class ExecutionBackend:
+
+    def __init__(self, kind = "default", num_workers = None, threads_per_worker = None, chunksize = None):
+        """
+        Args:
+            kind: "default" (dask's global scheduler), "sync", "threads", "processes" or "distributed".
+            num_workers: Threads, processes or distributed workers. Defaults to the number of CPUs (LocalCluster's default for "distributed").
+            threads_per_worker: Threads per distributed worker.
+            chunksize: Maximum spatial chunk size of the provider reads, overriding the default of the backend.
+        """
+        if kind not in BACKENDS:
+            raise ValueError(f"Unknown execution backend {kind}, use one of {BACKENDS}.")
+        self.kind = kind
+        self.num_workers = num_workers
+        self.threads_per_worker = threads_per_worker
+        self._chunksize = chunksize
+
+    def __repr__(self):
+        return f"ExecutionBackend({self.kind}, num_workers = {self.num_workers})"
+
+    def _pool(self):
+        key = (self.kind, self.num_workers, self.threads_per_worker)
+        with _POOLS_LOCK:
+            if key not in _POOLS:
+                num_workers = self.num_workers or os.cpu_count()
+                if self.kind == "threads":
+                    _POOLS[key] = ThreadPoolExecutor(num_workers)
+                elif self.kind == "processes":
+                    _POOLS[key] = ProcessPoolExecutor(num_workers, mp_context = multiprocessing.get_context(dask.config.get("multiprocessing.context", "spawn")))
+                elif self.kind == "distributed":
+                    from distributed import Client, LocalCluster
+                    cluster = LocalCluster(n_workers = self.num_workers, threads_per_worker = self.threads_per_worker, dashboard_address = None)
+                    _POOLS[key] = Client(cluster, set_as_default = False)
+            return _POOLS[key]
+
+    def config(self):
+        """dask config of this backend, empty for the default backend."""
+        if self.kind == "default":
+            return {}
+        if self.kind == "sync":
+            return {"scheduler": "synchronous"}
+        if self.kind == "distributed":
+            return {"scheduler": self._pool()}
+        return {"scheduler": self.kind, "pool": self._pool()}
+
+    def activate(self):
+        """Context manager in which dask computes with this backend."""
+        stack = ExitStack()
+        config = self.config()
+        if config:
+            stack.enter_context(dask.config.set(**config))
+        if self.kind == "distributed":
+            # xarray's distributed locks (e.g. for writing NetCDF) need a current client.
+            stack.enter_context(config["scheduler"].as_current())
+        return stack
+
+    def chunksize(self, default):
+        """Spatial chunk size for a provider whose own chunk size is default."""
+        chunksize = self._chunksize or CHUNKSIZES[self.kind]
+        return default if chunksize is None else min(default, chunksize)
+
+
+def as_backend(backend):
+    """ExecutionBackend from an ExecutionBackend, a kind or a dict of ExecutionBackend arguments."""
+    if isinstance(backend, ExecutionBackend):
+        return backend
+    if isinstance(backend, dict):
+        return ExecutionBackend(**backend)
+    return ExecutionBackend(backend)
+
+
+def get_backend():
+    backend = _BACKEND.get()
+    return backend if backend is not None else ExecutionBackend()
+
+
+@contextmanager
+def execution(backend = None):
+    """Use an execution backend for all computations of the enclosed code. With None, the current backend is kept."""
+    if backend is None:
+        yield get_backend()
+        return
+    backend = as_backend(backend)
+    token = _BACKEND.set(backend)
+    try:
+        yield backend
+    finally:
+        _BACKEND.reset(token)
+
+
+def compute(obj):
+    """Compute a dask backed object, e.g. an xarray Dataset, with the current backend."""
+    with get_backend().activate():
+        return obj.compute()
+
+
+def compute_all(*objs):
+    """Compute several dask backed objects in one pass with the current backend, like dask.compute."""
+    with get_backend().activate():
+        return dask.compute(*objs)
+
+
+def shutdown():
+    """Close all pools and clusters of this process."""
+    with _POOLS_LOCK:
+        for pool in _POOLS.values():
+            if hasattr(pool, "cluster"):
+                cluster = pool.cluster
+                pool.close()
+                cluster.close()
+            else:
+                pool.shutdown()
+        _POOLS.clear()
@@ -0,0 +1,102 @@
+"""Geometry planning for minicubes.
+
+The geometry of a minicube (UTM zone, bounding box, padded bounding box and target lon/lat grid) only depends on its center, shape and resolution. `plan_geometries` computes it for a whole batch of specs at once: UTM zones are computed arithmetically instead of querying the CRS database for every minicube, pyproj Transformers are cached per EPSG code and the centers are transformed with one vectorized call per UTM zone. The resulting MinicubeGeometry objects can be handed to Minicuber, which otherwise plans its own geometry once on construction.
+"""
+
+from functools import lru_cache
+
+import numpy as np
+
+from pyproj import Transformer
+from pyproj.aoi import AreaOfInterest
+from pyproj.database import query_utm_crs_info
+
+
+@lru_cache(maxsize = None)
+def get_transformer(from_epsg, to_epsg):
+    return Transformer.from_crs(from_epsg, to_epsg, always_xy = True)
+
+
+def query_utm_epsg(lon, lat):
+    return int(query_utm_crs_info(
+        datum_name="WGS 84",
+        area_of_interest=AreaOfInterest(lon, lat, lon, lat)
+    )[0].code)
+
+
+def utm_epsg(lons, lats):
+    """EPSG codes of the WGS 84 UTM zones of the given points.
+
+    Zones are computed arithmetically. Points on a zone border or outside the UTM latitudes are looked up in the CRS database, as their zone depends on its ordering.
+    """
+    lons, lats = np.atleast_1d(np.asarray(lons, dtype = "float64")), np.atleast_1d(np.asarray(lats, dtype = "float64"))
+
+    zones = (np.floor((lons + 180) / 6).astype("int64") % 60) + 1
+    epsgs = np.where(lats >= 0, 32600, 32700) + zones
+
+    offset = np.mod(lons + 180, 6)
+    ambiguous = (np.minimum(offset, 6 - offset) < 1e-9) | (lats > 84) | (lats < -80)
+    for i in np.flatnonzero(ambiguous):
+        epsgs[i] = query_utm_epsg(lons[i], lats[i])
+
+    return epsgs
+
+
+class MinicubeGeometry:
+
+    def __init__(self, lon_lat, xy_shape, resolution, utm_epsg, bbox):
+        self.lon_lat = lon_lat
+        self.xy_shape = xy_shape
+        self.resolution = resolution
+        self.utm_epsg = int(utm_epsg)
+        self.bbox = tuple(float(v) for v in bbox) # left, bottom, right, top
+
+        left, bottom, right, top = self.bbox
+        lat_extra = (top - bottom) / self.xy_shape[0] * 6
+        lon_extra = (right - left) / self.xy_shape[1] * 6
+        self.padded_bbox = (left - lon_extra, bottom - lat_extra, right + lon_extra, top + lat_extra)
+
+        nx, ny = self.xy_shape
+        self.lon_grid = np.linspace(left, right, nx)
+        self.lat_grid = np.linspace(top, bottom, ny)
+
+    def __repr__(self):
+        return f"MinicubeGeometry(lon_lat = {self.lon_lat}, xy_shape = {self.xy_shape}, resolution = {self.resolution}, utm_epsg = {self.utm_epsg})"
+
+    @property
+    def lon_lat_grid(self):
+        return self.lon_grid, self.lat_grid
+
+
+def plan_geometries(specs_list):
+    """Plan the geometries of many minicubes at once. Returns a list of MinicubeGeometry in the order of specs_list."""
+
+    lons = np.array([specs["lon_lat"][0] for specs in specs_list], dtype = "float64")
+    lats = np.array([specs["lon_lat"][1] for specs in specs_list], dtype = "float64")
+    epsgs = utm_epsg(lons, lats)
+
+    geometries = [None] * len(specs_list)
+    for epsg in np.unique(epsgs):
+        idxs = np.flatnonzero(epsgs == epsg)
+        transformer = get_transformer(4326, int(epsg))
+
+        x_centers, y_centers = transformer.transform(lons[idxs], lats[idxs])
+
+        for i, x_center, y_center in zip(idxs, np.atleast_1d(x_centers), np.atleast_1d(y_centers)):
+            specs = specs_list[i]
+            nx, ny = specs["xy_shape"]
+            resolution = specs["resolution"]
+
+            x_left, x_right = x_center - resolution * (nx//2), x_center + resolution * (nx//2)
+
+            y_top, y_bottom = y_center + resolution * (ny//2), y_center - resolution * (ny//2)
+
+            bbox = transformer.transform_bounds(x_left, y_bottom, x_right, y_top, direction = 'INVERSE')
+
+            geometries[i] = MinicubeGeometry(tuple(specs["lon_lat"]), tuple(specs["xy_shape"]), resolution, epsg, bbox)
+
+    return geometries
+
+
+def plan_geometry(specs):
+    return plan_geometries([specs])[0]
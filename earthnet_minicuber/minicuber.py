@@ -4,21 +4,31 @@ import numpy as np
 import pandas as pd
 import xarray as xr
 
-from pyproj import Transformer
-from pyproj.aoi import AreaOfInterest
-from pyproj.database import query_utm_crs_info
-
 from pathlib import Path
+import shutil
+
 
 import pystac_client
 import rasterio
 import datetime
 import time
 import warnings
-import traceback
 import random
-
-from .provider import PROVIDERS
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextvars import copy_context
+
+from .provider.pool import get_provider
+from .assembly import CubeAssembler
+from .checkpoint import Checkpointer
+from .stream import ZarrStreamWriter, blosc_encoding
+from .geometry import get_transformer, plan_geometry
+from .partition import plan_minicube_intervals
+from .regrid import get_regrid_plan
+from .encoding import NETCDF_PRESETS, encode_minicube, scale_and_offset
+from .tracing import span, trace_context
+from .execution import ExecutionBackend, compute as compute_with_backend, compute_all, execution, get_backend
+from .provider.stac import discard_prefetched
+from .provider.stac_async import prefetch_searches
 
 def compute_scale_and_offset(da, n=16):
     """Calculate offset and scale factor for int conversion
@@ -29,18 +39,20 @@ def compute_scale_and_offset(da, n=16):
     vmin = np.nanmin(da).item()
     vmax = np.nanmax(da).item()
 
-    # stretch/compress data to the available packed range
-    scale_factor = (vmax - vmin) / (2 ** n - 1)
-
-    # translate the range to be symmetric about zero
-    add_offset = vmin + 2 ** (n - 1) * scale_factor
-
-    return scale_factor, add_offset
+    return scale_and_offset(vmin, vmax, n = n)
 
 class Minicuber:
 
-    def __init__(self, specs):
+    def __init__(self, specs, geometry = None, memory_budget = None):
+        """
+        Args:
+            specs: Minicube specs.
+            geometry: MinicubeGeometry of the specs, e.g. from earthnet_minicuber.geometry.plan_geometries for a whole batch. Planned on construction if None.
+            memory_budget: Estimated bytes (or e.g. "2GB") per loaded time interval, see earthnet_minicuber.partition. Monthly intervals if None.
+        """
         self.specs = specs
+        self.memory_budget = memory_budget
+        self._time_intervals = None
 
         self.lon_lat = specs["lon_lat"]
         self.xy_shape = specs["xy_shape"]
@@ -54,11 +66,13 @@ class Minicuber:
         if "primary_provider" in specs:
             specs["providers"] =  [specs["primary_provider"]] + specs["other_providers"]
 
-        self.providers = [PROVIDERS[p["name"]](**p["kwargs"]) for p in specs["providers"]]
+        self.providers = [get_provider(p["name"], p["kwargs"]) for p in specs["providers"]]
 
         self.temporal_providers = [p for p in self.providers if p.is_temporal]
         self.spatial_providers = [p for p in self.providers if not p.is_temporal]
 
+        self.geometry = geometry if geometry is not None else plan_geometry(specs)
+
 
     @property
     def monthly_intervals(self):
@@ -79,90 +93,54 @@ class Minicuber:
         return monthly_intervals
 
     @property
-    def bbox(self):
-
-        utm_epsg = int(query_utm_crs_info(
-            datum_name="WGS 84",
-            area_of_interest=AreaOfInterest(self.lon_lat[0], self.lon_lat[1], self.lon_lat[0], self.lon_lat[1])
-        )[0].code)
-
-        transformer = Transformer.from_crs(4326, utm_epsg, always_xy=True)
-
-        x_center, y_center = transformer.transform(*self.lon_lat)
-
-        nx, ny = self.xy_shape
-        
-        x_left, x_right = x_center - self.resolution * (nx//2), x_center + self.resolution * (nx//2)
-
-        y_top, y_bottom = y_center + self.resolution * (ny//2), y_center - self.resolution * (ny//2)
+    def time_intervals(self):
+        """The time intervals the minicube is loaded in: monthly_intervals, or the intervals planned for the memory_budget."""
+        if self._time_intervals is None:
+            if self.memory_budget is None:
+                self._time_intervals = self.monthly_intervals
+            else:
+                with span("plan_intervals") as record:
+                    self._time_intervals = plan_minicube_intervals(self, self.memory_budget)
+                    record["intervals"] = len(self._time_intervals)
+        return self._time_intervals
 
-        return transformer.transform_bounds(x_left, y_bottom, x_right, y_top, direction = 'INVERSE') # left, bottom, right, top
+    @property
+    def bbox(self):
+        return self.geometry.bbox # left, bottom, right, top
 
     @property
     def padded_bbox(self):
-        left, bottom, right, top = self.bbox
-        lat_extra = (top - bottom) / self.xy_shape[0] * 6
-        lon_extra = (right - left) / self.xy_shape[1] * 6
-        return left - lon_extra, bottom - lat_extra, right + lon_extra, top + lat_extra
-
+        return self.geometry.padded_bbox
 
     @property
     def lon_lat_grid(self):
-        nx, ny = self.xy_shape
-        lon_left, lat_bottom, lon_right, lat_top = self.bbox
-
-        lon_grid = np.linspace(lon_left, lon_right, nx)
-        lat_grid = np.linspace(lat_top, lat_bottom, ny)
-
-        return lon_grid, lat_grid
+        return self.geometry.lon_lat_grid
 
     def regrid_product_cube(self, product_cube):
 
+        lon_grid, lat_grid = self.lon_lat_grid
+
         if ("x" in product_cube.coords) and ("y" in product_cube.coords):
 
             x, y = product_cube.x.values, product_cube.y.values
 
             product_epsg = product_cube.attrs["epsg"]
 
-            transformer = Transformer.from_crs(4326, product_epsg, always_xy=True)
-
-            lon_grid, lat_grid = self.lon_lat_grid
+            transformer = get_transformer(4326, int(product_epsg))
 
             new_x, new_y = transformer.transform(lon_grid, lat_grid)
 
-            
-            product_cube_nearest = product_cube.filter_by_attrs(interpolation_type=lambda v: ((v is None) or (v == "nearest")))
-            product_cube_linear = product_cube.filter_by_attrs(interpolation_type="linear")
-            if len(product_cube_nearest) > 0:
-                product_cube_nearest = product_cube_nearest.interp(x = new_x, y = new_y, method = "nearest")
-            if len(product_cube_linear) > 0:
-                product_cube_linear = product_cube_linear.interp(x = new_x, y = new_y, method = "linear")
-            if (len(product_cube_nearest) > 0) and (len(product_cube_linear) > 0):
-                product_cube = xr.merge([product_cube_nearest, product_cube_linear])
-            elif (len(product_cube_linear) > 0):
-                product_cube = product_cube_linear
-            else:
-                product_cube = product_cube_nearest
-            
+            plan = get_regrid_plan(x, y, new_x, new_y)
 
-            product_cube["x"], product_cube["y"] = lon_grid, lat_grid
+            product_cube = plan.apply(product_cube, "x", "y", lon_grid, lat_grid)
 
             product_cube = product_cube.rename({"x": "lon", "y": "lat"})
 
         elif ("lat" in product_cube.coords) and ("lon" in product_cube.coords):
-            lon_grid, lat_grid = self.lon_lat_grid
-            product_cube_nearest = product_cube.filter_by_attrs(interpolation_type=lambda v: ((v is None) or (v == "nearest")))
-            if len(product_cube_nearest) > 0:
-                product_cube_nearest = product_cube_nearest.interp(lon = lon_grid, lat = lat_grid, method = "nearest")
-            product_cube_linear = product_cube.filter_by_attrs(interpolation_type="linear")
-            if len(product_cube_linear) > 0:
-                product_cube_linear = product_cube_linear.interp(lon = lon_grid, lat = lat_grid, method = "linear")
-            if (len(product_cube_nearest) > 0) and (len(product_cube_linear) > 0):
-                product_cube = xr.merge([product_cube_nearest, product_cube_linear])
-            elif (len(product_cube_linear) > 0):
-                product_cube = product_cube_linear
-            else:
-                product_cube = product_cube_nearest
+
+            plan = get_regrid_plan(product_cube.lon.values, product_cube.lat.values, lon_grid, lat_grid)
+
+            product_cube = plan.apply(product_cube, "lon", "lat", lon_grid, lat_grid)
         
         product_cube.attrs = {}
 
@@ -170,72 +148,157 @@ class Minicuber:
 
 
 
-    @classmethod
-    def load_minicube(cls, specs, verbose = True, compute = False):
+    @staticmethod
+    def provider_name(provider):
+        return getattr(provider, "name", provider.__class__.__name__)
+
+    def load_product(self, provider, time_interval, **kwargs):
+        with trace_context(provider = self.provider_name(provider), interval = time_interval if provider.is_temporal else None):
+            with span("load_data") as record:
+                product_cube = provider.load_data(self.padded_bbox, time_interval, **kwargs)
+                record["bytes"] = product_cube.nbytes if product_cube is not None else 0
+        return product_cube
 
-        self = cls(specs)
+    def regrid_and_compute(self, provider, product_cube, time_interval = None, compute = False):
+        """Regrid a product cube and, if compute, compute it, traced as the provider's stages."""
+        with trace_context(provider = self.provider_name(provider), interval = time_interval):
+            with span("regrid"):
+                product_cube = self.regrid_product_cube(product_cube)
+            if compute:
+                with span("compute") as record:
+                    product_cube = compute_with_backend(product_cube)
+                    record["bytes"] = product_cube.nbytes
+        return product_cube
 
-        if not compute and (len(self.monthly_intervals) > 3):
-            warnings.warn("You are querying a long time interval with compute = False, this might lead to failure in the dask sheduler and high memory consumption upon calling .compute(). Consider using compute = True instead.")
+    def stac_queries(self, checkpointer = None):
+        """All STAC searches of the providers for all time intervals, except those of checkpointed products."""
+        provider_keys = {id(p): Checkpointer.provider_key(i, p) for i, p in enumerate(self.providers)}
+        queries = []
+        for provider in self.spatial_providers:
+            if not (checkpointer and checkpointer.exists(provider_keys[id(provider)])):
+                queries += provider.stac_queries(self.padded_bbox, "not_needed")
+        for time_interval in self.time_intervals:
+            for provider in self.temporal_providers:
+                if not (checkpointer and checkpointer.exists(provider_keys[id(provider)], time_interval)):
+                    queries += provider.stac_queries(self.padded_bbox, time_interval, full_time_interval = self.full_time_interval)
+        return queries
 
-        warnings.filterwarnings('ignore')
+    def iter_product_cubes(self, verbose = True, compute = False, max_workers = 1, checkpointer = None, stac_concurrency = 8):
+        """Yield the regridded product cubes of the minicube as (time_interval, product_cubes): first the cubes of all temporal providers for each time interval, then the cubes of the spatial providers with time_interval None.
 
-        all_data = []
-        cube = None
-        for time_interval in self.monthly_intervals:
+        With max_workers > 1, providers are loaded concurrently on a thread pool of that width: the temporal providers of each time interval run at the same time, alongside the spatial providers.
 
-            for provider in self.temporal_providers:
+        With a checkpointer (and compute = True), every product cube is saved once computed, and product cubes saved by an earlier, failed attempt are reused instead of loaded again.
+
+        With stac_concurrency > 0, the STAC searches of all providers and time intervals are first run concurrently with up to that many requests at a time.
+        """
+
+        if not compute:
+            checkpointer = None
+
+        prefetched = prefetch_searches(self.stac_queries(checkpointer), max_concurrency = stac_concurrency, verbose = verbose) if stac_concurrency else []
+        try:
+            yield from self._iter_product_cubes(verbose = verbose, compute = compute, max_workers = max_workers, checkpointer = checkpointer)
+        finally:
+            discard_prefetched(prefetched)
+
+    def _iter_product_cubes(self, verbose, compute, max_workers, checkpointer):
+
+        provider_keys = {id(p): Checkpointer.provider_key(i, p) for i, p in enumerate(self.providers)}
+
+        # ERA5 matching needs the first S2 date of the interval, so S2 is merged first.
+        temporal_providers = sorted(self.temporal_providers, key = lambda p: getattr(p, "name", None) != 's2')
+
+        with ThreadPoolExecutor(max_workers = max_workers) as executor:
 
+            spatial_futures = []
+            for provider in self.spatial_providers:
+                found, product_cube = checkpointer.load(provider_keys[id(provider)]) if checkpointer else (False, None)
+                if found:
+                    spatial_futures.append(product_cube)
+                    continue
                 if verbose:
-                    print(f"Loading {provider.__class__.__name__} for {time_interval}")
+                    print(f"Loading {provider.__class__.__name__}")
+                spatial_futures.append(executor.submit(copy_context().run, self.load_product, provider, "not_needed"))
 
-                product_cube = provider.load_data(self.padded_bbox, time_interval, full_time_interval = self.full_time_interval)
+            first_date = None
+            for time_interval in self.time_intervals:
+
+                temporal_futures = []
+                for provider in temporal_providers:
+
+                    found, product_cube = checkpointer.load(provider_keys[id(provider)], time_interval) if checkpointer else (False, None)
+                    if found:
+                        if verbose:
+                            print(f"Using checkpoint of {provider.__class__.__name__} for {time_interval}")
+                        temporal_futures.append(product_cube)
+                        continue
 
-                if product_cube is not None:
-                    # Match ERA5 dates to S2
-                    if provider.name == 's2':
-                        first_date = pd.to_datetime(str(product_cube.time[0].values))
-                    if provider.name == 'e5':
-                        if provider.match_s2:
-                            product_cube = provider.match_to_sentinel(product_cube, first_date)
-
-                    if cube is None:
-                        cube = self.regrid_product_cube(product_cube)
-                    else:
-                        cube = xr.merge([cube, self.regrid_product_cube(product_cube)])
-                else:
                     if verbose:
-                        print(f"Skipping {provider.__class__.__name__} for {time_interval} - no data found.")
-            
-            if cube is not None:
-                if compute:
+                        print(f"Loading {provider.__class__.__name__} for {time_interval}")
+
+                    temporal_futures.append(executor.submit(copy_context().run, self.load_product, provider, time_interval, full_time_interval = self.full_time_interval))
+
+                product_cubes = []
+                for provider, future in zip(temporal_providers, temporal_futures):
+
+                    if isinstance(future, Future):
+                        product_cube = future.result()
+
+                        if product_cube is not None:
+                            # Match ERA5 dates to S2
+                            if getattr(provider, "name", None) == 's2':
+                                first_date = pd.to_datetime(str(product_cube.time[0].values))
+                            if getattr(provider, "name", None) == 'e5':
+                                if provider.match_s2 and (first_date is not None):
+                                    product_cube = provider.match_to_sentinel(product_cube, first_date)
+
+                            product_cube = self.regrid_and_compute(provider, product_cube, time_interval, compute = checkpointer is not None)
+
+                        if checkpointer:
+                            checkpointer.save(provider_keys[id(provider)], product_cube, time_interval)
+                    else:
+                        # Loaded from checkpoint, already regridded
+                        product_cube = future
+                        if (product_cube is not None) and (getattr(provider, "name", None) == 's2'):
+                            first_date = pd.to_datetime(str(product_cube.time[0].values))
+
+                    if product_cube is not None:
+                        product_cubes.append(product_cube)
+                    else:
+                        if verbose:
+                            print(f"Skipping {provider.__class__.__name__} for {time_interval} - no data found.")
+                
+                if compute and (len(product_cubes) > 0):
                     if verbose:
                         print(f"Downloading for {time_interval}...")
-                    all_data.append(cube.compute())
+                    with trace_context(interval = time_interval), span("compute") as record:
+                        product_cubes = list(compute_all(*product_cubes))
+                        record["bytes"] = sum(product_cube.nbytes for product_cube in product_cubes)
+
+                yield time_interval, product_cubes
+                product_cubes = None
+
+            product_cubes = []
+            for provider, future in zip(self.spatial_providers, spatial_futures):
+                if isinstance(future, Future):
+                    product_cube = future.result()
+                    if product_cube is not None:
+                        product_cube = self.regrid_and_compute(provider, product_cube, compute = compute)
+                    if checkpointer:
+                        checkpointer.save(provider_keys[id(provider)], product_cube)
                 else:
-                    all_data.append(cube)
-            cube = None
-        
-        cube = xr.merge(all_data, combine_attrs = 'override')
-
-
-        for provider in self.spatial_providers:
-            if verbose:
-                print(f"Loading {provider.__class__.__name__}")
-            product_cube = provider.load_data(self.padded_bbox, "not_needed")
-            if product_cube is not None:
-                if cube is None:
-                    cube = self.regrid_product_cube(product_cube)
+                    product_cube = future
+                if product_cube is not None:
+                    product_cubes.append(product_cube)
                 else:
-                    cube = xr.merge([cube, self.regrid_product_cube(product_cube)])
-            else:
-                if verbose:
-                    print(f"Skipping {provider.__class__.__name__} - no data found.")
+                    if verbose:
+                        print(f"Skipping {provider.__class__.__name__} - no data found.")
 
-        if compute:
-            cube = cube.compute()
-        
-        if "time" in cube:
+            yield None, product_cubes
+
+    def finalize_cube(self, cube):
+        if "time" in cube.dims:
             cube['time'] = pd.DatetimeIndex(cube['time'].values)
             cube = cube.sortby('time')
             cube = cube.sel(time = slice(self.time_interval[:10], self.time_interval[-10:]))
@@ -246,101 +309,210 @@ class Minicuber:
 
         return cube
 
+    @classmethod
+    def load_minicube(cls, specs, verbose = True, compute = False, max_workers = 1, checkpoint_dir = None, geometry = None, stac_concurrency = 8, backend = None, memory_budget = None):
+        """Load a minicube for the given specs.
+
+        With max_workers > 1, providers are loaded concurrently on a thread pool of that width.
+
+        All dask computations run on the execution backend (see earthnet_minicuber.execution), e.g. backend = "sync", ExecutionBackend("threads", num_workers = 16) or {"kind": "distributed", "num_workers": 16, "threads_per_worker": 4}. If None, the current backend is used, by default dask's global scheduler.
+
+        With a checkpoint_dir (and compute = True), each provider and time interval is checkpointed to that scratch directory, so that a retry after a failure only loads what is missing. The checkpoints are removed once the minicube is loaded.
+
+        All STAC searches are prefetched concurrently, with up to stac_concurrency requests at a time (0 searches one at a time while loading).
+
+        The time interval is loaded month by month, or, with a memory_budget (bytes or e.g. "2GB"), in intervals whose estimated size fits the budget (see earthnet_minicuber.partition).
+        """
+
+        with execution(backend):
+            return cls._load_minicube(specs, verbose = verbose, compute = compute, max_workers = max_workers, checkpoint_dir = checkpoint_dir, geometry = geometry, stac_concurrency = stac_concurrency, memory_budget = memory_budget)
+
+    @classmethod
+    def _load_minicube(cls, specs, verbose, compute, max_workers, checkpoint_dir, geometry, stac_concurrency, memory_budget):
+
+        self = cls(specs, geometry = geometry, memory_budget = memory_budget)
+
+        checkpointer = Checkpointer(checkpoint_dir, specs) if (checkpoint_dir is not None) and compute else None
+
+        if not compute and (len(self.time_intervals) > 3):
+            warnings.warn("You are querying a long time interval with compute = False, this might lead to failure in the dask sheduler and high memory consumption upon calling .compute(). Consider using compute = True instead.")
+
+        warnings.filterwarnings('ignore')
+
+        with span("load_minicube", lon_lat = list(self.lon_lat), xy_shape = list(self.xy_shape), time_interval = self.time_interval) as record:
 
+            assembler = CubeAssembler()
+            for _, product_cubes in self.iter_product_cubes(verbose = verbose, compute = compute, max_workers = max_workers, checkpointer = checkpointer, stac_concurrency = stac_concurrency):
+                for product_cube in product_cubes:
+                    assembler.add(product_cube)
 
+            with span("assemble"):
+                cube = assembler.to_dataset()
 
+            if compute:
+                cube = compute_with_backend(cube)
+
+            record["bytes"] = cube.nbytes
+
+        if checkpointer:
+            checkpointer.cleanup()
+        
+        return self.finalize_cube(cube)
+
+    @classmethod
+    def stream_minicube_zarr(cls, specs, savepath, verbose = True, max_workers = 1, time_chunksize = 1, checkpoint_dir = None, geometry = None, stac_concurrency = 8, backend = None, memory_budget = None):
+        """Load a minicube and append each time interval to a Zarr store as soon as it is computed.
+
+        Memory is bounded by a single time interval, no matter how long the time_interval of the specs is, and with a memory_budget the intervals are planned to fit it. Static providers are written once at the end.
+        """
+        with execution(backend):
+            return cls._stream_minicube_zarr(specs, savepath, verbose = verbose, max_workers = max_workers, time_chunksize = time_chunksize, checkpoint_dir = checkpoint_dir, geometry = geometry, stac_concurrency = stac_concurrency, memory_budget = memory_budget)
+
+    @classmethod
+    def _stream_minicube_zarr(cls, specs, savepath, verbose, max_workers, time_chunksize, checkpoint_dir, geometry, stac_concurrency, memory_budget):
+
+        self = cls(specs, geometry = geometry, memory_budget = memory_budget)
+
+        warnings.filterwarnings('ignore')
+
+        checkpointer = Checkpointer(checkpoint_dir, specs) if checkpoint_dir is not None else None
+
+        writer = ZarrStreamWriter(savepath, time_chunksize = time_chunksize)
+
+        for time_interval, product_cubes in self.iter_product_cubes(verbose = verbose, compute = True, max_workers = max_workers, checkpointer = checkpointer, stac_concurrency = stac_concurrency):
+
+            assembler = CubeAssembler()
+            for product_cube in product_cubes:
+                assembler.add(product_cube)
+            product_cubes = None
+
+            if len(assembler) == 0:
+                continue
+
+            cube = self.finalize_cube(assembler.to_dataset())
+
+            if verbose:
+                print(f"Saving {'static variables' if time_interval is None else time_interval} to {savepath}")
+
+            with span("save", format = "zarr", interval = time_interval):
+                writer.write(cube)
+
+        writer.close()
+
+        if checkpointer:
+            checkpointer.cleanup()
+
+        return writer.store
 
     @staticmethod
-    def save_minicube_netcdf(minicube, savepath):
+    def save_minicube_netcdf(minicube, savepath, preset = "max", keepbits = None, max_workers = None):
+        """Save a minicube as NetCDF.
+
+        Args:
+            minicube: Minicube dataset.
+            savepath: Path of the NetCDF file. An existing file is replaced.
+            preset: Compression preset, "fast" (zlib level 1), "balanced" (level 4) or "max" (level 9).
+            keepbits: If given, linear variables are bit-rounded to keepbits mantissa bits and stored as float32 instead of packed to int16.
+            max_workers: Number of threads gathering the per variable statistics.
+        """
 
         savepath = Path(savepath)
 
-        encoding = {}
-        for v in list(minicube.variables):
-            if v in ["time", "time_clim", "lat", "lon"]:
-                continue
-            elif ("interpolation_type" in minicube[v].attrs) and (minicube[v].attrs["interpolation_type"] == "linear"):
-                scale_factor, add_offset = compute_scale_and_offset(minicube[v].values)
-            else:
-                scale_factor, add_offset = 1.0, 0.0
-                            
-            if abs(scale_factor) < 1e-8 or np.isnan(scale_factor) or (scale_factor == 1.0 and minicube[v].max() > 32766):
-                encoding[v] = {"zlib": True, "complevel": 9}
-            else:
-                encoding[v] =  {
-                    "dtype": 'int16',
-                    "scale_factor": scale_factor,
-                    "add_offset": add_offset,
-                    "_FillValue": -32767,
-                    "zlib": True,
-                    "complevel": 9
-                }
+        variables = [v for v in minicube.variables if v not in ["time", "time_clim", "lat", "lon"]]
+        with span("encode"):
+            minicube, encoding = encode_minicube(minicube, variables, keepbits = keepbits, max_workers = max_workers)
+        encoding = {v: {**enc, **NETCDF_PRESETS[preset]} for v, enc in encoding.items()}
 
         if savepath.is_file():
             savepath.unlink()
         else:
             savepath.parents[0].mkdir(exist_ok=True, parents=True)
 
-        minicube.to_netcdf(savepath, encoding = encoding, compute = True)
+        with span("save", format = "netcdf", preset = preset) as record:
+            with get_backend().activate():
+                minicube.to_netcdf(savepath, encoding = encoding, compute = True)
+            record["bytes"] = savepath.stat().st_size
+
+    @staticmethod
+    def save_minicube_zarr(minicube, savepath, chunks = None, cname = "zstd", clevel = 5, shuffle = "shuffle", keepbits = None, num_workers = None):
+        """Save a minicube as a Zarr store with consolidated metadata.
+
+        Variables are packed to int16 like in save_minicube_netcdf and compressed with Blosc. Chunks are encoded and written in parallel with the dask threaded scheduler.
+
+        Args:
+            minicube: Minicube dataset.
+            savepath: Path of the Zarr store. An existing store is replaced.
+            chunks: Chunk size per dimension, e.g. {"time": 10, "lat": 128, "lon": 128}. Dimensions not given are stored in one chunk, except time, which defaults to 1.
+            cname, clevel, shuffle: Blosc compressor, compression level and shuffle ("noshuffle", "shuffle" or "bitshuffle").
+            keepbits: If given, linear variables are bit-rounded to keepbits mantissa bits and stored as float32 instead of packed to int16.
+            num_workers: Number of threads writing chunks. Defaults to the current execution backend.
+        """
+        savepath = Path(savepath)
+
+        chunks = {"time": 1, **(chunks or {})}
+        chunks = {d: size if chunks.get(d, -1) in (-1, None) else min(chunks[d], size) for d, size in minicube.sizes.items()}
+
+        compression = blosc_encoding(cname = cname, clevel = clevel, shuffle = shuffle, zarr_format = 2)
+
+        with span("encode"):
+            minicube, encoding = encode_minicube(minicube, list(minicube.data_vars), keepbits = keepbits, max_workers = num_workers)
+        encoding = {v: {**enc, **compression, "chunks": tuple(chunks[d] for d in minicube[v].dims)} for v, enc in encoding.items()}
+
+        if savepath.exists():
+            shutil.rmtree(savepath)
+        else:
+            savepath.parents[0].mkdir(exist_ok=True, parents=True)
+
+        minicube = minicube.chunk(chunks)
+        for v in minicube.variables:
+            minicube[v].encoding = {}
+
+        backend = ExecutionBackend("threads", num_workers = num_workers) if num_workers is not None else get_backend()
+
+        import numcodecs
+        # Blosc runs single threaded inside each task, dask parallelizes over chunks.
+        use_threads = numcodecs.blosc.use_threads
+        numcodecs.blosc.use_threads = False
+        try:
+            with span("save", format = "zarr"), backend.activate():
+                minicube.to_zarr(savepath, mode = "w", encoding = encoding, consolidated = True, zarr_format = 2, compute = True)
+        finally:
+            numcodecs.blosc.use_threads = use_threads
 
     @classmethod
-    def save_minicube(cls, specs, savepath, verbose = True):
+    def save_minicube(cls, specs, savepath, verbose = True, preset = "max", keepbits = None, backend = None, **kwargs):
 
-        minicube = cls.load_minicube(specs, verbose = verbose, compute = True)            
+        with execution(backend):
 
-        if verbose:
-            print(f"Downloading minicube at {specs['lon_lat']}")
+            minicube = cls.load_minicube(specs, verbose = verbose, compute = True, **kwargs)            
 
-        minicube = minicube.compute()
+            if verbose:
+                print(f"Downloading minicube at {specs['lon_lat']}")
+
+            minicube = compute_with_backend(minicube)
 
-        if verbose:
-            print(f"Saving minicube at {specs['lon_lat']}")
+            if verbose:
+                print(f"Saving minicube at {specs['lon_lat']}")
 
-        cls.save_minicube_netcdf(minicube, savepath)
+            cls.save_minicube_netcdf(minicube, savepath, preset = preset, keepbits = keepbits)
 
 
     @classmethod
     def save_minicube_mp(cls, pars):
-        starttime = time.time()
-        time.sleep(random.uniform(0,2))
-        done = False
-        c = 0
-        while not done:
-            try:
-                cls.save_minicube(**pars)
-                done = True
-            except pystac_client.exceptions.APIError:
-                time.sleep(10)
-                cls.save_minicube(**pars)
-            except rasterio._err.CPLE_OpenFailedError as err:
-                traceback.print_exc()
-                print(f"Cant read file.. {err}... skipping {pars['savepath']}")
-                done = True
-            except RuntimeError as err:
-                traceback.print_exc()
-                print(f"Runtime error.. {err}... skipping {pars['savepath']}")
-                done = True
-            except IndexError as err:
-                traceback.print_exc()
-                print(f"Index error..  {err}... skipping {pars['savepath']}")
-                done = True
-            except TypeError as err:
-                traceback.print_exc()
-                print(f"Type error.. {err}... skipping {pars['savepath']}")
-                done = True
-            except ValueError as err:
-                traceback.print_exc()
-                print(f"Value error.. {err}... skipping {pars['savepath']}")
-                done = True
-            except KeyboardInterrupt:
-                return
-            except Exception as err:
-                traceback.print_exc()
-                print(f"Unknown exception.. {err}... skipping {pars['savepath']}")
-                done = True
-            c+=1
-            if c > 5:
-                done = True
-                print(f"Pystac connection error.. skipping {pars['savepath']}")
-
-        print(f"{pars['savepath']} took {time.time()-starttime:.2f} seconds.")
+        """Save one minicube, for use with a multiprocessing pool. Superseded by earthnet_minicuber.batch.run_batch."""
+        from .batch import run_job
+
+        job = {"cube_id": str(pars["savepath"]), "specs": pars["specs"], "savepath": str(pars["savepath"])}
+        load_kwargs = {k: v for k, v in pars.items() if k not in ["specs", "savepath", "verbose"]}
+
+        try:
+            record = run_job(job, load_kwargs = load_kwargs, verbose = pars.get("verbose", True))
+        except KeyboardInterrupt:
+            return
+
+        if record["status"] != "done":
+            print(f"{record['error_class']}.. {record['error']}... skipping {pars['savepath']}")
+
+        print(f"{pars['savepath']} took {record['duration']:.2f} seconds.")
+
+        return record
@@ -0,0 +1,117 @@
+"""Memory-budgeted partitioning of the time interval of a minicube.
+
+By default a minicube is loaded month by month. With a memory budget, the time interval is instead cut into the fewest consecutive intervals whose estimated in-memory size fits the budget: small minicubes are loaded several months at a time, large ones in parts of a month.
+
+The size of a temporal provider's product cube is estimated per day from one STAC search over the full time interval: timesteps (STAC items) x bands x lat x lon x itemsize (float32), times an overhead factor for the source grid before regridding and intermediate copies (e.g. the cloud mask input). Providers without STAC searches are counted with one timestep per day. Providers that can only load whole calendar months (ERA5) restrict the boundaries, see Provider.time_alignment.
+
+The budget bounds the data of one time interval. load_minicube with compute = True still holds the whole minicube in the end, stream_minicube_zarr only ever holds one interval.
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from .cache import parse_bytes
+
+
+def interval_days(time_interval):
+    return pd.date_range(time_interval[:10], time_interval[-10:], freq = "D")
+
+
+def format_interval(days):
+    return days[0].strftime('%Y-%m-%d') + "/" + days[-1].strftime('%Y-%m-%d')
+
+
+def estimate_daily_bytes(minicuber, itemsize = 4, overhead = 4):
+    """Estimated bytes per day of the temporal providers of a Minicuber, as a pandas Series over all days of its time interval."""
+    days = interval_days(minicuber.time_interval)
+    pixels = int(np.prod(minicuber.xy_shape))
+    daily_bytes = pd.Series(0.0, index = days)
+    for provider in minicuber.temporal_providers:
+        timesteps = provider.daily_timesteps(minicuber.padded_bbox, minicuber.time_interval)
+        if timesteps is None:
+            timesteps = pd.Series(1, index = days)
+        n_bands = len(getattr(provider, "bands", None) or [None])
+        daily_bytes += timesteps.reindex(days, fill_value = 0) * n_bands * pixels * itemsize * overhead
+    return daily_bytes
+
+
+def split_days(days, daily_bytes, budget):
+    """Split consecutive days into as few runs fitting the budget as a greedy split needs, balanced in size. Single days over budget become runs of their own."""
+    greedy, run, run_bytes = [], [], 0
+    for day in days:
+        if run and (run_bytes + daily_bytes[day] > budget):
+            greedy.append(run)
+            run, run_bytes = [], 0
+        run.append(day)
+        run_bytes += daily_bytes[day]
+    if run:
+        greedy.append(run)
+
+    # Cut at equal shares of the total instead, so the last run is not a short remainder.
+    n = len(greedy)
+    cumulative = daily_bytes[days].cumsum().values
+    piece = np.minimum((cumulative - daily_bytes[days].values / 2) * n // max(cumulative[-1], 1), n - 1)
+    balanced = [[day for day, p in zip(days, piece) if p == i] for i in range(n)]
+    if all(len(run) > 0 for run in balanced) and all(daily_bytes[run].sum() <= budget for run in balanced if len(run) > 1):
+        return balanced
+    return greedy
+
+
+def plan_intervals(time_interval, daily_bytes, budget, alignment = None):
+    """Cut time_interval into consecutive intervals whose summed daily_bytes fit the budget.
+
+    Whole calendar months are merged as long as they fit. A month larger than the budget is split into runs of days, unless alignment is "months" (only whole months). With alignment "month", every calendar month is one interval.
+
+    Args:
+        time_interval: "YYYY-MM-DD/YYYY-MM-DD".
+        daily_bytes: pandas Series of estimated bytes per day of time_interval.
+        budget: Bytes per interval, e.g. 2e9 or "2GB".
+        alignment: None, "months" or "month".
+
+    Returns:
+        List of "YYYY-MM-DD/YYYY-MM-DD" intervals.
+    """
+    budget = parse_bytes(budget)
+    days = interval_days(time_interval)
+    months = [days[days.to_period("M") == month] for month in days.to_period("M").unique()]
+
+    if alignment == "month":
+        return [format_interval(month) for month in months]
+
+    intervals, current, current_bytes = [], None, 0
+    for month in months:
+        month_bytes = daily_bytes.reindex(month, fill_value = 0).sum()
+        if (current is not None) and (current_bytes + month_bytes <= budget):
+            current = current.append(month)
+            current_bytes += month_bytes
+            continue
+        if current is not None:
+            intervals.append(format_interval(current))
+            current = None
+        if (month_bytes <= budget) or (alignment == "months"):
+            current, current_bytes = month, month_bytes
+        else:
+            intervals += [format_interval(run) for run in split_days(month, daily_bytes.reindex(month, fill_value = 0), budget)]
+    if current is not None:
+        intervals.append(format_interval(current))
+
+    return intervals
+
+
+def plan_minicube_intervals(minicuber, budget, overhead = 4):
+    """Time intervals of a Minicuber fitting the memory budget, see plan_intervals."""
+    budget = parse_bytes(budget)
+    daily_bytes = estimate_daily_bytes(minicuber, overhead = overhead)
+
+    alignments = {getattr(p, "time_alignment", None) for p in minicuber.temporal_providers}
+    alignment = "month" if "month" in alignments else ("months" if "months" in alignments else None)
+
+    intervals = plan_intervals(minicuber.time_interval, daily_bytes, budget, alignment = alignment)
+
+    largest = max(daily_bytes.reindex(interval_days(interval), fill_value = 0).sum() for interval in intervals)
+    if largest > budget:
+        warnings.warn(f"The largest time interval is estimated at {largest/1e9:.2f} GB, over the memory budget of {budget/1e9:.2f} GB.")
+
+    return intervals
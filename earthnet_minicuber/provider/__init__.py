@@ -1,20 +1,31 @@
-from . import era5_old
-from . import provider_base, s2, sentinel1, ndviclim, srtm, esawc, era5_old, era5, soilgrids, geomorphons, landsat, cop30, alos, era5_esdl, nasadem
+from . import provider_base
+from .registry import ProviderRegistry
 
-PROVIDERS = {
-    "s2": s2.sentinel2.Sentinel2,
-    "s1": sentinel1.Sentinel1,
-    "ndviclim": ndviclim.NDVIClim,
-    "srtm": srtm.SRTM,
-    "esawc": esawc.ESAWorldcover,
-    "era5_old": era5_old.ERA5,
-    "era5land": era5_old.ERA5,
-    "sg": soilgrids.Soilgrids,
-    "geom": geomorphons.Geomorphons,
-    "ls": landsat.Landsat,
-    "cop": cop30.Copernicus30,
-    "alos": alos.ALOSWorld,
-    "era5esdl": era5_esdl.ERA5_ESDL,
-    "nasa": nasadem.NASADEM,
-    "era5": era5.ERA5
-}
\ No newline at end of file
+PROVIDERS = ProviderRegistry({
+    "s2": "earthnet_minicuber.provider.s2.sentinel2:Sentinel2",
+    "s1": "earthnet_minicuber.provider.sentinel1:Sentinel1",
+    "ndviclim": "earthnet_minicuber.provider.ndviclim:NDVIClim",
+    "srtm": "earthnet_minicuber.provider.srtm:SRTM",
+    "esawc": "earthnet_minicuber.provider.esawc:ESAWorldcover",
+    "era5_old": "earthnet_minicuber.provider.era5_old:ERA5",
+    "era5land": "earthnet_minicuber.provider.era5_old:ERA5",
+    "sg": "earthnet_minicuber.provider.soilgrids:Soilgrids",
+    "geom": "earthnet_minicuber.provider.geomorphons:Geomorphons",
+    "ls": "earthnet_minicuber.provider.landsat:Landsat",
+    "cop": "earthnet_minicuber.provider.cop30:Copernicus30",
+    "alos": "earthnet_minicuber.provider.alos:ALOSWorld",
+    "era5esdl": "earthnet_minicuber.provider.era5_esdl:ERA5_ESDL",
+    "nasa": "earthnet_minicuber.provider.nasadem:NASADEM",
+    "era5": "earthnet_minicuber.provider.era5:ERA5"
+})
+
+
+def register_provider(name, provider):
+    """Make a provider available to minicube specs under name.
+
+    Args:
+        name: Name used in the "providers" of specs.
+        provider: Provider class, or a "module:Class" string imported on first use.
+    """
+    PROVIDERS[name] = provider
+    return provider
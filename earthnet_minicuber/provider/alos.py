@@ -10,6 +10,11 @@ import time
 import random
 
 from . import provider_base
+from .stac import search_items
+from .sessions import get_session
+from .blocks import proxy_items
+from .tiles import localize_items
+from ..execution import get_backend
 
 
 class ALOSWorld(provider_base.Provider):
@@ -22,26 +27,15 @@ class ALOSWorld(provider_base.Provider):
         self.catalog = pystac_client.Client.open(URL)
 
 
+    def stac_queries(self, bbox, time_interval, **kwargs):
+        return [dict(catalog = self.catalog, collections = ["alos-dem"], bbox = bbox)]
+
     def load_data(self, bbox, time_interval, **kwargs):
         
         stack = None
 
-        search = self.catalog.search(
-                bbox = bbox,
-                collections=["alos-dem"]
-            )
         
-        for attempt in range(10):
-            try:
-                items_dem = pc.sign(search)
-            except pystac_client.exceptions.APIError:
-                print(f"ALOS Dem: Planetary computer time out, attempt {attempt}, retrying in 60 seconds...")
-                time.sleep(random.uniform(30,90))
-            else:
-                break
-        else:
-            print("Loading Alos DEM failed after 10 attempts...")
-            return None
+        items_dem = search_items(self.catalog, ["alos-dem"], bbox = bbox, sign = True)
 
         if len(items_dem.to_dict()['features']) == 0:
             return None
@@ -49,7 +43,9 @@ class ALOSWorld(provider_base.Provider):
         metadata = items_dem.to_dict()['features'][0]["properties"]
         epsg = metadata["proj:epsg"]
 
-        stack = stackstac.stack(items_dem, epsg = epsg, dtype = "float32", properties = False, band_coords = False, bounds_latlon = bbox, xy_coords = 'center', chunksize = 512)
+        items_dem = proxy_items(localize_items(items_dem, get_session("planetary_computer")), get_session("planetary_computer"))
+
+        stack = stackstac.stack(items_dem, epsg = epsg, dtype = "float32", properties = False, band_coords = False, bounds_latlon = bbox, xy_coords = 'center', chunksize = get_backend().chunksize(512), gdal_env = get_session("planetary_computer").gdal_env())
 
         stack["band"] = ["alos_dem"]
 
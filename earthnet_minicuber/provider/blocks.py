@@ -0,0 +1,259 @@
+"""Block-level read-through cache for remote COG assets.
+
+stackstac reads the assets of the temporal providers (Sentinel 2, Sentinel 1, Landsat) and of the DEMs block by block over HTTP, and a rerun or an overlapping minicube fetches the same byte ranges again. With a block cache, either set with `set_block_cache` or through the environment variable EMC_BLOCK_CACHE (a directory), the asset hrefs are rewritten to a small HTTP server on localhost, started once per process, that answers GDAL's range requests from fixed-size blocks on disk and fetches missing blocks from the original URL (s3:// hrefs through the HTTPS endpoint of their bucket). So all reads of GDAL benefit without changes to stackstac.
+
+The proxy only serves the hrefs registered by `proxy` in its process, under URLs that contain a random secret of the process, so other local users and processes can neither send it to arbitrary URLs nor read the cache through it.
+
+Blocks are keyed by the asset href without its query string (signing tokens change between searches) and the block index. The cache is a DiskCache: shared by all processes using the same directory, written atomically and limited to max_bytes (least recently used blocks are evicted). Upstream errors are passed on to GDAL as HTTP errors, so its retries and errors_as_nodata apply as before.
+"""
+
+import hashlib
+import hmac
+import os
+import re
+import secrets
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import pystac
+import requests
+
+from ..cache import DiskCache
+from .tiles import is_raster_asset, strip_query
+
+BLOCK_SIZE = 512 * 1024
+
+
+class UpstreamError(Exception):
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def https_url(href, session = None):
+    """HTTPS URL of an s3:// href, through the S3 endpoint of the session if it has one. Other hrefs are returned unchanged."""
+    parsed = urlparse(href)
+    if parsed.scheme != "s3":
+        return href
+    endpoint = session.options.get("AWS_S3_ENDPOINT") if session is not None else None
+    if endpoint:
+        return f"https://{endpoint}/{parsed.netloc}{parsed.path}"
+    return f"https://{parsed.netloc}.s3.amazonaws.com{parsed.path}"
+
+
+def parse_range(header, size):
+    """First and last byte of a "bytes=start-end" Range header, None for no or multiple ranges."""
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", (header or "").strip())
+    if match is None:
+        return None
+    start, end = match.groups()
+    if start == "":
+        return max(0, size - int(end)), size - 1
+    return int(start), min(size - 1, int(end)) if end != "" else size - 1
+
+
+class _ProxyHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self._serve(body = False)
+
+    def do_GET(self):
+        self._serve(body = True)
+
+    def _send(self, status, headers, data = b""):
+        headers.setdefault("Content-Length", len(data))
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, str(value))
+        self.end_headers()
+        if data:
+            self.wfile.write(data)
+
+    def _serve(self, body):
+        cache = self.server.block_cache
+        parts = self.path.split("/")
+        upstream = cache.registered_href(parts[2]) if (len(parts) > 2) and hmac.compare_digest(parts[1], self.server.secret) else None
+        if upstream is None:
+            return self._send(403, {})
+        try:
+            size = cache.file_size(upstream)
+            byte_range = parse_range(self.headers.get("Range"), size)
+            if (byte_range is not None) and (byte_range[0] >= size):
+                return self._send(416, {"Content-Range": f"bytes */{size}"})
+            start, end = byte_range if byte_range is not None else (0, size - 1)
+            data = cache.read_range(upstream, start, end) if body else b""
+        except UpstreamError as e:
+            return self._send(e.status, {})
+        except Exception:
+            return self._send(502, {})
+
+        headers = {"Accept-Ranges": "bytes", "Content-Type": "application/octet-stream"}
+        if byte_range is not None:
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        if not body:
+            headers["Content-Length"] = end - start + 1
+        self._send(206 if byte_range is not None else 200, headers, data)
+
+
+class _ProxyServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # GDAL closes kept-alive connections at will, errors of the requests themselves are answered in _serve.
+        pass
+
+
+class BlockCache(DiskCache):
+
+    def __init__(self, path, max_bytes = "10GB", ttl = None, block_size = BLOCK_SIZE, timeout = 60, **kwargs):
+        """
+        Args:
+            path: Cache directory.
+            max_bytes: Size limit, least recently used blocks are evicted above it.
+            ttl: Time to live of a block in seconds. None for no expiry, published assets do not change.
+            block_size: Bytes per cached block. Requests are rounded out to whole blocks.
+            timeout: Seconds before an upstream request fails.
+        """
+        super().__init__(path, max_bytes = max_bytes, ttl = ttl, **kwargs)
+        self.block_size = block_size
+        self.timeout = timeout
+        self._server = None
+        self._server_pid = None
+        self._server_lock = threading.Lock()
+        self._local = threading.local()
+        self._hrefs = {}
+
+    def _http(self):
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def fetch(self, upstream, start, end):
+        """Bytes start to end (inclusive, clipped to the file) of upstream and its total size. Responses that are not exactly this range raise UpstreamError(502)."""
+        response = self._http().get(upstream, headers = {"Range": f"bytes={start}-{end}"}, timeout = self.timeout)
+        if response.status_code == 200:
+            data, size = response.content[start:end + 1], len(response.content)
+        elif response.status_code == 206:
+            match = re.fullmatch(r"bytes (\d+)-(\d+)/(\d+)", response.headers.get("Content-Range", "").strip())
+            if match is None:
+                raise UpstreamError(502, f"Invalid Content-Range for {strip_query(upstream)}")
+            first, last, size = [int(v) for v in match.groups()]
+            if (first != start) or (last != min(end, size - 1)):
+                raise UpstreamError(502, f"Range {first}-{last} instead of {start}-{min(end, size - 1)} for {strip_query(upstream)}")
+            data = response.content
+        else:
+            raise UpstreamError(response.status_code, f"{response.status_code} for {strip_query(upstream)}")
+        if len(data) != max(0, min(end, size - 1) - start + 1):
+            raise UpstreamError(502, f"Truncated response for {strip_query(upstream)}")
+        return data, size
+
+    def block_key(self, upstream, index):
+        return {"href": strip_query(upstream), "block": index, "block_size": self.block_size}
+
+    def file_size(self, upstream):
+        key = {"href": strip_query(upstream), "size": True}
+        size = self.get_json(key)
+        if size is None:
+            data, size = self.fetch(upstream, 0, self.block_size - 1)
+            self.put_bytes(self.block_key(upstream, 0), data)
+            self.put_json(key, size)
+        return size
+
+    def read_range(self, upstream, start, end):
+        """Bytes start to end (inclusive) of upstream, from cached blocks. Consecutive missing blocks are fetched with one request."""
+        size = self.file_size(upstream)
+        first, last = start // self.block_size, end // self.block_size
+        blocks = {index: self.get_bytes(self.block_key(upstream, index)) for index in range(first, last + 1)}
+
+        missing = [index for index, data in blocks.items() if data is None]
+        runs = []
+        for index in missing:
+            if runs and (runs[-1][-1] == index - 1):
+                runs[-1].append(index)
+            else:
+                runs.append([index])
+        for run in runs:
+            data, _ = self.fetch(upstream, run[0] * self.block_size, min(size, (run[-1] + 1) * self.block_size) - 1)
+            for i, index in enumerate(run):
+                blocks[index] = data[i * self.block_size:(i + 1) * self.block_size]
+                self.put_bytes(self.block_key(upstream, index), blocks[index])
+
+        data = b"".join(blocks[index] for index in range(first, last + 1))
+        offset = first * self.block_size
+        return data[start - offset:end - offset + 1]
+
+    def serve(self):
+        """Base URL of the proxy of this process, including its secret, started on first use."""
+        with self._server_lock:
+            if self._server_pid != os.getpid():
+                self._server = _ProxyServer(("127.0.0.1", 0), _ProxyHandler)
+                self._server.block_cache = self
+                self._server.secret = secrets.token_urlsafe(32)
+                self._hrefs = {}
+                threading.Thread(target = self._server.serve_forever, daemon = True).start()
+                self._server_pid = os.getpid()
+            return f"http://127.0.0.1:{self._server.server_address[1]}/{self._server.secret}"
+
+    def registered_href(self, token):
+        """Upstream URL registered by proxy_href under token, None for unknown tokens."""
+        with self._server_lock:
+            return self._hrefs.get(token)
+
+    def proxy_href(self, href, session = None):
+        upstream = https_url(href, session)
+        base = self.serve()
+        # Keyed without the query string, so re-signed hrefs replace their earlier signature.
+        token = hashlib.sha256(strip_query(upstream).encode("utf-8")).hexdigest()[:32]
+        with self._server_lock:
+            self._hrefs[token] = upstream
+        return f"{base}/{token}/{os.path.basename(urlparse(upstream).path)}"
+
+    def proxy(self, items, session = None, assets = None):
+        """Copy of the STAC items with the hrefs of their remote raster assets (or of the given asset keys) pointing to the proxy."""
+        items = [item.clone() for item in items]
+        for item in items:
+            for key, asset in item.assets.items():
+                if (key in assets if assets is not None else is_raster_asset(asset)) and urlparse(asset.href).scheme in ["http", "https", "s3"]:
+                    asset.href = self.proxy_href(asset.href, session)
+        return pystac.ItemCollection(items)
+
+
+_BLOCK_CACHE = None
+
+
+def set_block_cache(cache = None, **kwargs):
+    """Set the block cache used by all raster reads of stackstac in this process.
+
+    Args:
+        cache: A BlockCache, a directory for a new BlockCache, or None to disable caching.
+        kwargs: Passed on to BlockCache if cache is a directory, e.g. max_bytes or block_size.
+    """
+    global _BLOCK_CACHE
+    if (cache is not None) and isinstance(cache, (str, os.PathLike)):
+        cache = BlockCache(cache, **kwargs)
+    _BLOCK_CACHE = cache
+    return cache
+
+
+def get_block_cache():
+    global _BLOCK_CACHE
+    if (_BLOCK_CACHE is None) and os.environ.get("EMC_BLOCK_CACHE"):
+        _BLOCK_CACHE = BlockCache(os.environ["EMC_BLOCK_CACHE"])
+    return _BLOCK_CACHE
+
+
+def proxy_items(items, session = None, assets = None):
+    """The STAC items reading through the block cache if one is set, else the items unchanged."""
+    cache = get_block_cache()
+    if cache is None:
+        return items
+    return cache.proxy(items, session = session, assets = assets)
@@ -12,14 +12,15 @@ import zarr
 from rasterio import RasterioIOError
 import time
 import numpy as np
+import pandas as pd
 import xarray as xr
 import random
-from contextlib import nullcontext
 import os.path
 import datetime
 
 from shapely.geometry import Polygon, box
 from . import provider_base
+from .stac import search_items
 
 ERA5BANDS_DESCRIPTION = {
     'sp': 'surface_air_pressure', 
@@ -48,6 +49,8 @@ class ERA5(provider_base.Provider):
         self.agg_list = agg_list
         self.match_s2 = match_s2
         self.aws_bucket = aws_bucket
+        # Both buckets return whole months of data, the s3 bucket only the month the interval starts in.
+        self.time_alignment = "month" if aws_bucket == "s3" else "months"
 
         if aws_bucket == "planetary_computer":
             URL = 'https://planetarycomputer.microsoft.com/api/stac/v1'
@@ -60,8 +63,6 @@ class ERA5(provider_base.Provider):
         else:
             raise Exception("Bucket not supported.")
         
-        
-        os.environ['AWS_NO_SIGN_REQUEST'] = "TRUE"
 
 
     def get_attrs_for_band(self, band):
@@ -75,59 +76,44 @@ class ERA5(provider_base.Provider):
         
 
 
+    def stac_queries(self, bbox, time_interval, **kwargs):
+        if self.aws_bucket != "planetary_computer":
+            return []
+        return [dict(catalog = self.catalog, collections = ["era5-pds"], bbox = bbox, datetime = time_interval)]
+
+    def daily_timesteps(self, bbox, time_interval):
+        # Hourly data
+        return pd.Series(24, index = pd.date_range(time_interval[:10], time_interval[-10:], freq = "D"))
+
     def load_data(self, bbox, time_interval, **kwargs):
 
         if self.aws_bucket == "planetary_computer":
 
-            cm = nullcontext()
-            gdal_session = stackstac.DEFAULT_GDAL_ENV.updated(always=dict(session=rasterio.session.AWSSession(aws_unsigned = True, endpoint_url = None)))
+            items_era5 = search_items(self.catalog, ["era5-pds"], bbox = bbox, datetime = time_interval)
 
-            with cm as gs:
-            
-                search = self.catalog.search(
-                            bbox = bbox,
-                            collections=["era5-pds"],
-                            datetime=time_interval
-                )            
-        
-                if self.aws_bucket == "planetary_computer":
-                    for attempt in range(10):
-                        try:
-                            items_era5 = pc.sign(search)
-                        except pystac_client.exceptions.APIError:
-                            print(f"ERA5: Planetary computer time out, attempt {attempt}, retrying in 60 seconds...")
-                            time.sleep(random.uniform(30,90))
-                        else:
-                            break
-                    else:
-                        print("Loading ERA5 failed after 10 attempts...")
-                        return None
-                else:
-                    items_era5 = search.get_all_items()
+            if len(items_era5.to_dict()['features']) == 0:
+                return None
 
-                if len(items_era5.to_dict()['features']) == 0:
-                    return None
+            epsg = int(items_era5.to_dict()['features'][0]['properties']['cube:dimensions']['lat']['reference_system'].split('epsg:')[1])
+            
+            """
+            for item in items_era5:
+                signed_item = pc.sign(item)
+                for b in self.bands:
+                    asset = signed_item.assets[ERA5BANDS_DESCRIPTION[b]]
+                    print(asset.extra_fields["xarray:open_kwargs"])
+            # Extract assets of interest 
+            """
+            datasets = []
+            for item in items_era5:
+                signed_item = pc.sign(item)
+                datasets += [
+                    xr.open_dataset(asset.href, **asset.extra_fields["xarray:open_kwargs"])
+                    for b in self.bands
+                    if (ERA5BANDS_DESCRIPTION[b] in signed_item.assets.keys()) and (asset := signed_item.assets[ERA5BANDS_DESCRIPTION[b]])
+                ]
 
-                epsg = int(items_era5.to_dict()['features'][0]['properties']['cube:dimensions']['lat']['reference_system'].split('epsg:')[1])
-                
-                """
-                for item in items_era5:
-                    signed_item = pc.sign(item)
-                    for b in self.bands:
-                        asset = signed_item.assets[ERA5BANDS_DESCRIPTION[b]]
-                        print(asset.extra_fields["xarray:open_kwargs"])
-                # Extract assets of interest 
-                """
-                datasets = []
-                for item in items_era5:
-                    signed_item = pc.sign(item)
-                    datasets += [
-                        xr.open_dataset(asset.href, **asset.extra_fields["xarray:open_kwargs"])
-                        for b in self.bands
-                        if (ERA5BANDS_DESCRIPTION[b] in signed_item.assets.keys()) and (asset := signed_item.assets[ERA5BANDS_DESCRIPTION[b]])
-                    ]
-    
-                
+            
 
         if self.aws_bucket == "s3":
             year = time_interval.split('-')[0]
@@ -10,6 +10,7 @@ import time
 import random
 
 from . import provider_base
+from ..retry import retry_call
 
 SHORT_TO_LONG_NAMES = {
     't2m': '2m_temperature', 
@@ -38,19 +39,7 @@ class ERA5(provider_base.Provider):
         if self.zarrpath:
             era5 = xr.open_zarr(self.zarrpath, consolidated = False)
         elif self.zarrurl:
-            for attempt in range(10):
-                try:
-                    mapper = fsspec.get_mapper(self.zarrurl)
-                    era5 = xr.open_zarr(mapper, consolidated=True)
-                except fsspec.exceptions.FSTimeoutError:
-                    sleeptime = random.uniform(10,60)
-                    print(f"ERA5 timeout, attempt {attempt}, retrying in {sleeptime} sec.")
-                    time.sleep(sleeptime)
-                else:
-                    break
-            else:
-                print(f"Loading ERA5 for bbox {bbox} failed")
-                return None
+            era5 = retry_call(lambda: xr.open_zarr(fsspec.get_mapper(self.zarrurl), consolidated=True), endpoint = self.zarrurl)
 
         era5 = era5[self.bands]
 
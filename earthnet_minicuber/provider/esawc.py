@@ -5,12 +5,16 @@ import stackstac
 import rasterio
 import xarray as xr
 import numpy as np
-from contextlib import nullcontext
 import planetary_computer as pc
 import time
 import random
 
 from . import provider_base
+from .stac import search_items
+from .sessions import bucket_endpoint, get_session
+from .blocks import proxy_items
+from .tiles import localize_items
+from ..execution import get_backend
 
 
 class ESAWorldcover(provider_base.Provider):
@@ -22,48 +26,29 @@ class ESAWorldcover(provider_base.Provider):
 
         if aws_bucket == "dea":
             URL = "https://explorer.digitalearth.africa/stac/"
-            os.environ['AWS_S3_ENDPOINT'] = 's3.af-south-1.amazonaws.com'
 
         else:#elif aws_bucket == "planetary_computer":
             URL = 'https://planetarycomputer.microsoft.com/api/stac/v1'
 
+        self.collection = "esa_worldcover" if aws_bucket == "dea" else "esa-worldcover"
         self.catalog = pystac_client.Client.open(URL)
 
-        os.environ['AWS_NO_SIGN_REQUEST'] = "TRUE"
+        self.session = get_session(bucket_endpoint(aws_bucket))
 
 
+    def stac_queries(self, bbox, time_interval, **kwargs):
+        return [dict(catalog = self.catalog, collections = [self.collection], bbox = bbox)]
+
     def load_data(self, bbox, time_interval, **kwargs):
 
-        if self.aws_bucket == "dea":
-            cm = rasterio.Env(aws_unsigned = True, AWS_S3_ENDPOINT= 's3.af-south-1.amazonaws.com')
-            
-        else:
-            cm = nullcontext()
-        
-        with cm:
+        with self.session.env():
 
             stack = None
 
-            # if "dem" in self.bands:
-            search = self.catalog.search(
-                    bbox = bbox,
-                    collections=["esa_worldcover" if self.aws_bucket == "dea" else "esa-worldcover"]
-                )
-
             if self.aws_bucket == "planetary_computer":
-                for attempt in range(10):
-                    try:
-                        items_esawc = pc.sign(search)
-                    except pystac_client.exceptions.APIError:
-                        print(f"ESAWC: Planetary computer time out, attempt {attempt}, retrying in 60 seconds...")
-                        time.sleep(random.uniform(30,90))
-                    else:
-                        break
-                else:
-                    print("Loading ESAWC failed after 10 attempts...")
-                    return None
+                items_esawc = search_items(self.catalog, [self.collection], bbox = bbox, sign = True)
             else:
-                items_esawc = search.get_all_items()
+                items_esawc = search_items(self.catalog, [self.collection], bbox = bbox)
 
             if len(items_esawc.to_dict()['features']) == 0:
                 return None
@@ -71,7 +56,9 @@ class ESAWorldcover(provider_base.Provider):
             metadata = items_esawc.to_dict()['features'][0]["properties"]
             epsg = metadata["proj:epsg"]
 
-            stack = stackstac.stack(items_esawc, epsg = epsg, dtype = "float32", properties = False, band_coords = False, bounds_latlon = bbox, xy_coords = 'center', chunksize = 1024)
+            items_esawc = proxy_items(localize_items(items_esawc, self.session), self.session)
+
+            stack = stackstac.stack(items_esawc, epsg = epsg, dtype = "float32", properties = False, band_coords = False, bounds_latlon = bbox, xy_coords = 'center', chunksize = get_backend().chunksize(1024), gdal_env = self.session.gdal_env())
             stack["band"] = ["lc"]
 
 
@@ -11,6 +11,10 @@ import xarray as xr
 import odc.algo
 
 from . import provider_base
+from .stac import search_items
+from .blocks import proxy_items
+from .sessions import get_session
+from ..execution import get_backend
 
 
 
@@ -200,7 +204,7 @@ class Landsat(provider_base.Provider):
         
         self.sensor = sensor
         if cloud_mask and ("QA_PIXEL" not in bands):
-            bands.append("QA_PIXEL")
+            bands = bands + ["QA_PIXEL"]
             self.drop_qa = True
         else:
             self.drop_qa = False
@@ -212,18 +216,16 @@ class Landsat(provider_base.Provider):
         URL = "https://explorer.digitalearth.africa/stac/"
         self.catalog = pystac_client.Client.open(URL)
 
-        os.environ['AWS_NO_SIGN_REQUEST'] = "TRUE"
-        os.environ['AWS_S3_ENDPOINT'] = 's3.af-south-1.amazonaws.com'
+        self.session = get_session("dea")
 
 
+    def stac_queries(self, bbox, time_interval, **kwargs):
+        return [dict(catalog = self.catalog, collections = [self.sensor], bbox = bbox, datetime = time_interval)]
+
     def load_data(self, bbox, time_interval, **kwargs):
         
-        with rasterio.Env(aws_unsigned = True, AWS_S3_ENDPOINT= 's3.af-south-1.amazonaws.com'):
-            items_ls = self.catalog.search(
-                    bbox = bbox,
-                    collections=[self.sensor],
-                    datetime=time_interval
-                ).get_all_items()
+        with self.session.env():
+            items_ls = search_items(self.catalog, [self.sensor], bbox = bbox, datetime = time_interval)
             
             if len(items_ls.to_dict()['features']) == 0:
                 return None
@@ -231,7 +233,7 @@ class Landsat(provider_base.Provider):
             metadata = items_ls.to_dict()['features'][0]["properties"]
             epsg = metadata["proj:epsg"]
 
-            stack = stackstac.stack(items_ls, epsg = epsg, assets = self.bands, dtype = "float32", properties = False, band_coords = False, bounds_latlon = bbox, xy_coords = 'center', chunksize = 1024)
+            stack = stackstac.stack(proxy_items(items_ls, self.session, assets = self.bands), epsg = epsg, assets = self.bands, dtype = "float32", properties = False, band_coords = False, bounds_latlon = bbox, xy_coords = 'center', chunksize = get_backend().chunksize(1024), gdal_env = self.session.gdal_env())
 
 
             ls_bands = [f"{self.sensor}_{b.split('_')[1] if b!= 'QA_PIXEL' else b}" for b in stack.band.values]
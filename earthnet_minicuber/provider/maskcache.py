@@ -0,0 +1,67 @@
+"""On-disk cache of cloud mask predictions per Sentinel 2 scene.
+
+Cloud mask inference is deterministic, so the mask of a scene only depends on the item, the model (checkpoint, rescale factor, runtime, tiling), the preprocessing of its inputs (data source, processing baseline correction, band scaling) and the read window. With a mask cache, either set with `set_mask_cache` or through the environment variable EMC_MASK_CACHE (a directory), CloudMask stores the mask of every timestep as a compressed uint8 array keyed by these, and later minicubes with the same scene, settings and window (e.g. reruns) reuse it instead of running the model. Masks are only served for the exact window: the tiled and blended prediction depends on the window, so a mask cropped from a larger window would differ from a fresh prediction.
+
+Only trained models are cached, randomly initialized ones (pretrained = False) differ between processes. The cache is a DiskCache: shared by all processes using the same directory and limited to max_bytes.
+"""
+
+import io
+import os
+
+import numpy as np
+
+from ..cache import DiskCache
+
+
+def mask_window(stack):
+    """Grid window of a stack with x and y coordinates (pixel centers) and an epsg attribute or coordinate."""
+    x, y = stack.x.values, stack.y.values
+    epsg = stack.attrs.get("epsg", stack.coords["epsg"].item() if "epsg" in stack.coords else None)
+    return {
+        "epsg": int(epsg) if epsg is not None else None,
+        "x0": float(x[0]), "y0": float(y[0]),
+        "dx": float(x[1] - x[0]) if len(x) > 1 else None, "dy": float(y[1] - y[0]) if len(y) > 1 else None,
+        "nx": len(x), "ny": len(y),
+    }
+
+
+class MaskCache(DiskCache):
+
+    def __init__(self, path, max_bytes = "5GB", ttl = None, **kwargs):
+        super().__init__(path, max_bytes = max_bytes, ttl = ttl, **kwargs)
+
+    def get(self, item_id, model, window):
+        """Cached uint8 mask (y, x) of the item in exactly this window, or None."""
+        data = self.get_bytes({"item": item_id, "model": model, "window": window}, ".npz")
+        if data is None:
+            return None
+        return np.load(io.BytesIO(data))["mask"]
+
+    def put(self, item_id, model, window, mask):
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, mask = mask.astype("uint8"))
+        self.put_bytes({"item": item_id, "model": model, "window": window}, buffer.getvalue(), ".npz")
+
+
+_MASK_CACHE = None
+
+
+def set_mask_cache(cache = None, **kwargs):
+    """Set the cloud mask prediction cache of this process.
+
+    Args:
+        cache: A MaskCache, a directory for a new MaskCache, or None to disable caching.
+        kwargs: Passed on to MaskCache if cache is a directory, e.g. max_bytes.
+    """
+    global _MASK_CACHE
+    if (cache is not None) and isinstance(cache, (str, os.PathLike)):
+        cache = MaskCache(cache, **kwargs)
+    _MASK_CACHE = cache
+    return cache
+
+
+def get_mask_cache():
+    global _MASK_CACHE
+    if (_MASK_CACHE is None) and os.environ.get("EMC_MASK_CACHE"):
+        _MASK_CACHE = MaskCache(os.environ["EMC_MASK_CACHE"])
+    return _MASK_CACHE
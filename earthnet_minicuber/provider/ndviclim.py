@@ -8,6 +8,11 @@ import numpy as np
 from rasterio import RasterioIOError
 
 from . import provider_base
+from .stac import search_items
+from .sessions import get_session
+from .blocks import proxy_items
+from .tiles import localize_items
+from ..execution import get_backend
 
 
 class NDVIClim(provider_base.Provider):
@@ -20,19 +25,18 @@ class NDVIClim(provider_base.Provider):
         URL = "https://explorer.digitalearth.africa/stac/"
         self.catalog = pystac_client.Client.open(URL)
 
-        os.environ['AWS_NO_SIGN_REQUEST'] = "TRUE"
-        os.environ['AWS_S3_ENDPOINT'] = 's3.af-south-1.amazonaws.com'
+        self.session = get_session("dea")
 
 
+    def stac_queries(self, bbox, time_interval, **kwargs):
+        return [dict(catalog = self.catalog, collections = ["ndvi_climatology_ls"], bbox = bbox)]
+
     def load_data(self, bbox, time_interval, **kwargs):
 
-        gdal_session = stackstac.DEFAULT_GDAL_ENV.updated(always=dict(session=rasterio.session.AWSSession(aws_unsigned = True, endpoint_url = 's3.af-south-1.amazonaws.com')))
+        gdal_session = self.session.gdal_env()
         
-        with rasterio.Env(aws_unsigned = True, AWS_S3_ENDPOINT= 's3.af-south-1.amazonaws.com'):
-            items_clim = self.catalog.search(
-                bbox = bbox,
-                collections=["ndvi_climatology_ls"],
-            ).get_all_items()
+        with self.session.env():
+            items_clim = search_items(self.catalog, ["ndvi_climatology_ls"], bbox = bbox)
 
             if len(items_clim.to_dict()['features']) == 0:
                 return None
@@ -40,7 +44,9 @@ class NDVIClim(provider_base.Provider):
             metadata = items_clim.to_dict()['features'][0]["properties"]
             epsg = metadata["proj:epsg"]
 
-            stack = stackstac.stack(items_clim, epsg = epsg, dtype = "float32", properties = False, band_coords = False, bounds_latlon = bbox, xy_coords = 'center', chunksize = 800,errors_as_nodata=(RasterioIOError('.*'), ), gdal_env=gdal_session)
+            items_clim = proxy_items(localize_items(items_clim, self.session), self.session)
+
+            stack = stackstac.stack(items_clim, epsg = epsg, dtype = "float32", properties = False, band_coords = False, bounds_latlon = bbox, xy_coords = 'center', chunksize = get_backend().chunksize(800),errors_as_nodata=(RasterioIOError('.*'), ), gdal_env=gdal_session)
 
             clims = {}
             if "mean" in self.bands:
@@ -0,0 +1,31 @@
+"""Per-process pool of provider instances.
+
+Constructing a provider opens its STAC catalog and, for Sentinel 2, builds the cloud mask model, which takes seconds, a large share of small minicubes. Minicuber therefore takes its providers from this pool, keyed by provider name and kwargs, so every worker process builds each configuration once and reuses it for all later minicubes. Providers keep no state between load_data calls, so one instance can serve any number of minicubes.
+"""
+
+import copy
+import threading
+
+from ..cache import hash_key
+from . import PROVIDERS
+
+_POOL = {}
+_POOL_LOCK = threading.Lock()
+
+
+def get_provider(name, kwargs = None):
+    """The pooled provider of name built with kwargs, created on first use in this process."""
+    kwargs = kwargs or {}
+    provider_class = PROVIDERS[name]
+    key = (provider_class, hash_key(kwargs))
+    with _POOL_LOCK:
+        if key not in _POOL:
+            # Providers may extend their list arguments, which must not change the specs (and thus the key).
+            _POOL[key] = provider_class(**copy.deepcopy(kwargs))
+        return _POOL[key]
+
+
+def clear_provider_pool():
+    """Drop all pooled providers, e.g. to free the memory of their models."""
+    with _POOL_LOCK:
+        _POOL.clear()
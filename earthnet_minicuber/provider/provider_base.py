@@ -7,4 +7,27 @@ class Provider(ABC):
     def load_data(self, bbox, time_interval, **kwargs):
         pass
 
+    # Time intervals load_data can handle: None for any interval, "months" for whole calendar months, "month" for single calendar months.
+    time_alignment = None
+
+    def stac_queries(self, bbox, time_interval, **kwargs):
+        """The STAC searches load_data runs for these arguments, as dicts of search_items arguments (catalog, collections, bbox, datetime), so they can be prefetched concurrently. Providers without STAC searches return an empty list."""
+        return []
+
+    def daily_timesteps(self, bbox, time_interval):
+        """Number of timesteps per day load_data returns for time_interval, as a pandas Series indexed by day, counted from the STAC items. None if unknown."""
+        import pandas as pd
+        from .stac import search_items
+
+        queries = [query for query in self.stac_queries(bbox, time_interval) if query.get("datetime") == time_interval]
+        if len(queries) == 0:
+            return None
+
+        dates = []
+        for query in queries:
+            for item in search_items(**query):
+                dates.append(pd.Timestamp(item.datetime or item.properties["start_datetime"]).tz_localize(None).normalize())
+
+        return pd.Series(dates, dtype = "datetime64[ns]").value_counts().sort_index()
+
     
\ No newline at end of file
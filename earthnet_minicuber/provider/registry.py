@@ -0,0 +1,85 @@
+"""Lazy registry of provider classes.
+
+Providers are registered by name as "module:Class" strings and only imported when a minicube spec first asks for them, so a spec with `cop` or `esawc` does not import torch, odc, s3fs or zarr. Other packages can add providers through the entry point group "earthnet_minicuber.providers", e.g. in their setup.py:
+
+    entry_points = {"earthnet_minicuber.providers": ["myprovider = mypackage.provider:MyProvider"]}
+
+or at runtime with `register_provider("myprovider", MyProvider)`.
+"""
+
+import importlib
+import threading
+
+from collections.abc import MutableMapping
+from importlib.metadata import entry_points
+
+ENTRY_POINT_GROUP = "earthnet_minicuber.providers"
+
+
+def resolve(target):
+    """The object named by a "module:attribute" string, or target itself if it is no string."""
+    if not isinstance(target, str):
+        return target
+    module, _, attribute = target.partition(":")
+    obj = importlib.import_module(module)
+    for name in attribute.split("."):
+        obj = getattr(obj, name)
+    return obj
+
+
+class ProviderRegistry(MutableMapping):
+
+    def __init__(self, providers = None):
+        """
+        Args:
+            providers: Dict of names to provider classes or "module:Class" strings.
+        """
+        self._providers = dict(providers or {})
+        self._entry_points_loaded = False
+        self._lock = threading.RLock()
+
+    def __repr__(self):
+        return f"ProviderRegistry({sorted(self)})"
+
+    def _load_entry_points(self):
+        with self._lock:
+            if self._entry_points_loaded:
+                return
+            self._entry_points_loaded = True
+            try:
+                eps = entry_points(group = ENTRY_POINT_GROUP)
+            except TypeError: # Python < 3.10
+                eps = entry_points().get(ENTRY_POINT_GROUP, [])
+            for ep in eps:
+                self._providers.setdefault(ep.name, ep.value)
+
+    def __getitem__(self, name):
+        with self._lock:
+            if name not in self._providers:
+                self._load_entry_points()
+            if name not in self._providers:
+                raise KeyError(f"Unknown provider {name}, available are {sorted(self._providers)}.")
+            provider = self._providers[name]
+            if isinstance(provider, str):
+                provider = self._providers[name] = resolve(provider)
+            return provider
+
+    def __setitem__(self, name, provider):
+        with self._lock:
+            self._providers[name] = provider
+
+    def __delitem__(self, name):
+        with self._lock:
+            del self._providers[name]
+
+    def __contains__(self, name):
+        self._load_entry_points()
+        return name in self._providers
+
+    def __iter__(self):
+        self._load_entry_points()
+        return iter(list(self._providers))
+
+    def __len__(self):
+        self._load_entry_points()
+        return len(self._providers)
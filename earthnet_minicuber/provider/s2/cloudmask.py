@@ -1,4 +1,7 @@
 
+import functools
+import threading
+
 import numpy as np
 import segmentation_models_pytorch as smp 
 import xarray as xr
@@ -7,30 +10,73 @@ import torch
 
 from torch.utils.model_zoo import load_url
 
-def get_checkpoint(bands_avail):
+from .runtimes import compile_model
+from ..maskcache import get_mask_cache, mask_window
+
+CHECKPOINT_URLS = {
+    ('B01', 'B02', 'B03', 'B04', 'B05', 'B06', 'B07', 'B8A', 'B09', 'B11', 'B12', 'AOT', 'WVP'): "https://nextcloud.bgc-jena.mpg.de/s/qHKcyZpzHtXnzL2/download/mobilenetv2_l2a_all.pth",
+    ("B02", "B03", "B04", "B8A"): "https://nextcloud.bgc-jena.mpg.de/s/Ti4aYdHe2m3jBHy/download/mobilenetv2_l2a_rgbnir.pth",
+}
+
+_NUM_THREADS_LOCK = threading.Lock()
+
+@functools.lru_cache(maxsize = None)
+def load_checkpoint(url):
+    """State dict of a checkpoint URL, downloaded once per machine (torch hub cache) and loaded once per process."""
+    return load_url(url)
+
+
+def get_checkpoint(bands_avail, pretrained = True):
+    """Checkpoint and its bands for the available bands. With pretrained = False nothing is downloaded and the checkpoint is None."""
 
     bands_avail = set(bands_avail)
 
-    if set(['B01', 'B02', 'B03', 'B04', 'B05', 'B06', 'B07', 'B8A', 'B09', 'B11', 'B12', 'AOT', 'WVP']).issubset(bands_avail):
-        ckpt = load_url("https://nextcloud.bgc-jena.mpg.de/s/qHKcyZpzHtXnzL2/download/mobilenetv2_l2a_all.pth")
-        ckpt_bands = ['B01', 'B02', 'B03', 'B04', 'B05', 'B06', 'B07', 'B8A', 'B09', 'B11', 'B12', 'AOT', 'WVP']
-    elif set(["B02", "B03", "B04", "B8A"]).issubset(bands_avail):
-        ckpt = load_url("https://nextcloud.bgc-jena.mpg.de/s/Ti4aYdHe2m3jBHy/download/mobilenetv2_l2a_rgbnir.pth")
-        ckpt_bands = ["B02", "B03", "B04", "B8A"]
-    else:
-        raise Exception(f"The bands {bands_avail} do not contain the necessary bands for cloud masking. Please include at least bands B02, B03, B04 and B8A.")
-        ckpt = None
-        ckpt_bands = None
+    for ckpt_bands, url in CHECKPOINT_URLS.items():
+        if set(ckpt_bands).issubset(bands_avail):
+            ckpt = load_checkpoint(url) if pretrained else None
+            return ckpt, list(ckpt_bands)
 
-    return ckpt, ckpt_bands
+    raise Exception(f"The bands {bands_avail} do not contain the necessary bands for cloud masking. Please include at least bands B02, B03, B04 and B8A.")
+
+
+def tile_starts(length, tile_size, overlap):
+    """Start offsets of overlapping tiles of tile_size covering length, the last one flush with the end."""
+    if length <= tile_size:
+        return [0]
+    starts = list(range(0, length - tile_size, tile_size - overlap))
+    return starts + [length - tile_size]
+
+
+def blend_weights(size, overlap):
+    """1D weights of a tile, ramping up linearly over the overlap at both ends, so overlapping tiles blend without seams."""
+    ramp = np.minimum(np.arange(1, size + 1), np.arange(size, 0, -1)) / (overlap + 1)
+    return np.clip(ramp, None, 1).astype("float32")
 
 
 class CloudMask:
-    def __init__(self, bands = ["B02", "B03", "B04", "B8A"], cloud_mask_rescale_factor = None):
+    def __init__(self, bands = ["B02", "B03", "B04", "B8A"], cloud_mask_rescale_factor = None, pretrained = True, batch_size = 4, tile_size = 512, tile_overlap = 64, num_threads = None, runtime = "eager", preprocessing = None):
+        """
+        Args:
+            bands: Available Sentinel 2 bands, selects the checkpoint.
+            cloud_mask_rescale_factor: Downsampling factor before inference.
+            pretrained: Load the trained weights. If False, the model is randomly initialized (e.g. for benchmarks without network access).
+            batch_size: Timesteps per forward pass.
+            tile_size: Largest spatial tile per forward pass (rounded down to a multiple of 32). Larger images are predicted in overlapping tiles whose class probabilities are blended.
+            tile_overlap: Pixels shared by neighbouring tiles.
+            num_threads: Intra-op threads of torch during inference, torch's default if None.
+            runtime: "eager", "torchscript", "onnx" or "onnx-int8", see earthnet_minicuber.provider.s2.runtimes.
+            preprocessing: Settings of the provider that change the reflectances passed to the cloud mask (e.g. data source and processing baseline correction), part of the mask cache key.
+        """
 
         self.cloud_mask_rescale_factor = cloud_mask_rescale_factor
         self.bands = bands
-        ckpt, self.ckpt_bands = get_checkpoint(bands)
+        self.batch_size = batch_size
+        self.tile_size = max(32, (tile_size // 32) * 32)
+        self.tile_overlap = min(tile_overlap, self.tile_size // 2)
+        self.num_threads = num_threads
+        self.preprocessing = preprocessing or {}
+        ckpt, self.ckpt_bands = get_checkpoint(bands, pretrained = pretrained)
+        self.checkpoint_url = CHECKPOINT_URLS[tuple(self.ckpt_bands)] if pretrained else None
 
         self.model = smp.Unet(
                 encoder_name="mobilenet_v2",
@@ -44,14 +90,32 @@ class CloudMask:
 
         self.model.eval()
 
+        self.runtime = runtime
+        self.compiled_model = compile_model(self.model, runtime, in_channels = len(self.ckpt_bands), num_threads = num_threads)
+
         self.bands_scale = xr.DataArray(12*[10000,] + [65535, 65535, 1], coords = {"band": ["B01", "B02", "B03", "B04", "B05", "B06", "B07", "B08", "B8A", "B09", "B11", "B12", "AOT", "WVP", "SCL"]})
 
-    def __call__(self, stack):
+        self._buffers = threading.local()
 
-        ds = stack.to_dataset("band")
+    def buffer(self, name, shape):
+        """Zeroed float32 tensor of shape, reused across batches and calls of the same thread."""
+        buffers = self._buffers.__dict__
+        if (name not in buffers) or (tuple(buffers[name].shape) != tuple(shape)):
+            buffers[name] = torch.empty(shape, dtype = torch.float32)
+        return buffers[name].zero_()
+
+    def predict_tile(self, x):
+        """Class scores (b, 4, h, w) of a padded tile (b, c, h, w): softmax probabilities, or one-hot classes with cloud_mask_rescale_factor."""
+        if not self.cloud_mask_rescale_factor:
+            return torch.softmax(self.compiled_model(x), dim = 1)
 
-        x = torch.from_numpy((stack.sel(band = self.ckpt_bands)/self.bands_scale).fillna(1.0).transpose("time", "band", "y", "x").values.astype("float32"))
+        x = torch.nn.functional.interpolate(x, scale_factor = self.cloud_mask_rescale_factor, mode = 'bilinear')
+        y_hat = torch.argmax(self.compiled_model(x), dim = 1).float()
+        y_hat = torch.nn.functional.max_pool2d(y_hat[:,None,...], kernel_size = self.cloud_mask_rescale_factor)[:,0,...]
+        return torch.nn.functional.one_hot(y_hat.long(), num_classes = 4).permute(0, 3, 1, 2).float()
 
+    def predict(self, x):
+        """Cloud mask classes (time, y, x) of scaled inputs x (time, band, y, x), in batches over time and overlapping tiles over space."""
         b, c, h, w = x.shape
 
         h_big = ((h//32 + 1)*32)
@@ -62,23 +126,79 @@ class CloudMask:
         w_pad_left = (w_big - w)//2
         w_pad_right = ((w_big - w) + 1)//2
 
-        x = torch.nn.functional.pad(x, (w_pad_left, w_pad_right, h_pad_left, h_pad_right), mode = "reflect")
+        tile_h, tile_w = min(self.tile_size, h_big), min(self.tile_size, w_big)
+        tiles = [(i, j) for i in tile_starts(h_big, tile_h, self.tile_overlap) for j in tile_starts(w_big, tile_w, self.tile_overlap)]
+        tile_weights = torch.from_numpy(blend_weights(tile_h, self.tile_overlap)[:, None] * blend_weights(tile_w, self.tile_overlap)[None, :])
+
+        weights = self.buffer("weights", (h_big, w_big))
+        for i, j in tiles:
+            weights[i:i+tile_h, j:j+tile_w] += tile_weights
+
+        y_hat = np.empty((b, h, w), dtype = "float32")
+
+        for t in range(0, b, self.batch_size):
+            x_batch = torch.from_numpy(x[t:t + self.batch_size])
+            x_batch = torch.nn.functional.pad(x_batch, (w_pad_left, w_pad_right, h_pad_left, h_pad_right), mode = "reflect")
+
+            if len(tiles) == 1:
+                scores = self.predict_tile(x_batch)
+            else:
+                scores = self.buffer("scores", (self.batch_size, 4, h_big, w_big))[:len(x_batch)]
+                for i, j in tiles:
+                    scores[..., i:i+tile_h, j:j+tile_w] += self.predict_tile(x_batch[..., i:i+tile_h, j:j+tile_w]) * tile_weights
+                scores /= weights
 
-        if self.cloud_mask_rescale_factor:
-            #orig_size = (x.shape[-2], x.shape[-1])
-            x = torch.nn.functional.interpolate(x, scale_factor = self.cloud_mask_rescale_factor, mode = 'bilinear')
+            y_hat[t:t + self.batch_size] = torch.argmax(scores, dim = 1)[:, h_pad_left:-h_pad_right, w_pad_left:-w_pad_right].numpy()
 
-        with torch.no_grad():
-            y_hat = self.model(x)
+        return y_hat
 
-        y_hat = torch.argmax(y_hat, dim = 1).float()
+    def identity(self):
+        """Everything besides the input that the predicted masks depend on, for the mask cache."""
+        return {"checkpoint": self.checkpoint_url, "rescale": self.cloud_mask_rescale_factor, "runtime": self.runtime, "tile_size": self.tile_size, "tile_overlap": self.tile_overlap, "preprocessing": self.preprocessing, "bands_scale": [float(self.bands_scale.sel(band = b)) for b in self.ckpt_bands]}
 
-        if self.cloud_mask_rescale_factor:
-            y_hat = torch.nn.functional.max_pool2d(y_hat[:,None,...], kernel_size = self.cloud_mask_rescale_factor)[:,0,...]#torch.nn.functional.interpolate(y_hat, size = orig_size, mode = "bilinear")
-                                                
-        y_hat = y_hat[:, h_pad_left:-h_pad_right, w_pad_left:-w_pad_right]
+    def predict_stack(self, stack):
+        """Cloud mask classes (time, y, x) of a stack (time, band, y, x) of unscaled reflectances."""
+        x = (stack.sel(band = self.ckpt_bands)/self.bands_scale).fillna(1.0).transpose("time", "band", "y", "x").values.astype("float32")
+
+        if not self.num_threads:
+            with torch.inference_mode():
+                return self.predict(x)
+
+        # torch's thread count is process-wide, so predictions with their own count run one at a time.
+        with _NUM_THREADS_LOCK:
+            num_threads = torch.get_num_threads()
+            torch.set_num_threads(self.num_threads)
+            try:
+                with torch.inference_mode():
+                    return self.predict(x)
+            finally:
+                torch.set_num_threads(num_threads)
+
+    def __call__(self, stack):
+
+        ds = stack.to_dataset("band")
 
-        ds["mask"] = (("time", "y", "x"),y_hat.cpu().numpy())
+        cache = get_mask_cache() if self.checkpoint_url is not None else None
+        if (cache is None) or ("id" not in stack.coords):
+            y_hat = self.predict_stack(stack)
+        else:
+            # Timesteps with a cached mask of their scene skip inference.
+            window, model = mask_window(stack), self.identity()
+            ids = [str(i) for i in np.atleast_1d(stack["id"].values)]
+            y_hat = np.empty((len(stack.time), len(stack.y), len(stack.x)), dtype = "float32")
+            missing = []
+            for t, item_id in enumerate(ids):
+                mask = cache.get(item_id, model, window)
+                if mask is None:
+                    missing.append(t)
+                else:
+                    y_hat[t] = mask
+            if missing:
+                y_hat[missing] = self.predict_stack(stack.isel(time = missing))
+                for t in missing:
+                    cache.put(ids[t], model, window, y_hat[t])
+
+        ds["mask"] = (("time", "y", "x"), y_hat)
 
         return ds.to_array("band")
     
@@ -0,0 +1,77 @@
+"""CPU inference runtimes of the cloud mask model.
+
+The cloud mask U-Net runs in eager PyTorch by default. The other runtimes compile it once per CloudMask (i.e. once per pooled Sentinel 2 provider) for faster CPU inference:
+
+- "torchscript": traced, frozen and optimized for inference (conv and batch norm folded, MKL-DNN fused ops). Same results up to float rounding.
+- "onnx": exported to ONNX and run with ONNX Runtime. Needs onnx and onnxruntime (`pip install earthnet-minicuber[onnx]`).
+- "onnx-int8": the ONNX model with int8 weights from ONNX Runtime's dynamic quantization, which unlike torch's dynamic quantization also covers convolutions. Fastest, but not bit-identical, check it with `parity` first.
+
+`parity` compares a runtime to the eager model on reference inputs, `earthnet_minicuber.benchmark.cloudmask` measures throughput and parity of all runtimes.
+"""
+
+import tempfile
+import warnings
+
+from pathlib import Path
+
+import numpy as np
+import torch
+
+RUNTIMES = ["eager", "torchscript", "onnx", "onnx-int8"]
+
+
+class OnnxModel:
+    """Callable like the torch model, running an ONNX export of it in ONNX Runtime."""
+
+    def __init__(self, model, in_channels, quantize = False, num_threads = None):
+        import onnxruntime
+        self.tmpdir = tempfile.TemporaryDirectory(prefix = "emc_cloudmask_")
+        path = Path(self.tmpdir.name)/"cloudmask.onnx"
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            torch.onnx.export(model, torch.rand(1, in_channels, 64, 64), str(path), input_names = ["x"], output_names = ["y"], dynamic_axes = {"x": {0: "batch", 2: "height", 3: "width"}, "y": {0: "batch", 2: "height", 3: "width"}}, opset_version = 17)
+        if quantize:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            quantized = path.with_suffix(".int8.onnx")
+            quantize_dynamic(str(path), str(quantized), weight_type = QuantType.QUInt8)
+            path = quantized
+
+        options = onnxruntime.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(str(path), options, providers = ["CPUExecutionProvider"])
+
+    def __call__(self, x):
+        return torch.from_numpy(self.session.run(["y"], {"x": x.numpy()})[0])
+
+
+def compile_model(model, runtime = "eager", in_channels = 4, num_threads = None):
+    """The model (in eval mode) compiled for a runtime of RUNTIMES, as a callable from input to logits tensors."""
+    if runtime == "eager":
+        return model
+    if runtime == "torchscript":
+        with torch.no_grad(), warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            traced = torch.jit.trace(model, torch.rand(1, in_channels, 64, 64))
+            return torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+    if runtime in ["onnx", "onnx-int8"]:
+        return OnnxModel(model, in_channels, quantize = (runtime == "onnx-int8"), num_threads = num_threads)
+    raise ValueError(f"Unknown cloud mask runtime {runtime}, use one of {RUNTIMES}.")
+
+
+def parity(reference, candidate, x, batch_size = 4):
+    """Agreement of two compiled models on inputs x (time, band, y, x), padded to multiples of 32.
+
+    Returns:
+        Dict with the fraction of pixels of equal class ("agreement") and the largest absolute difference of class probabilities ("max_prob_diff").
+    """
+    equal, total, max_diff = 0, 0, 0.0
+    with torch.inference_mode():
+        for t in range(0, len(x), batch_size):
+            x_batch = torch.from_numpy(np.ascontiguousarray(x[t:t + batch_size], dtype = "float32"))
+            p_ref = torch.softmax(reference(x_batch), dim = 1)
+            p_cand = torch.softmax(candidate(x_batch), dim = 1)
+            equal += (p_ref.argmax(1) == p_cand.argmax(1)).sum().item()
+            total += p_ref[:, 0].numel()
+            max_diff = max(max_diff, (p_ref - p_cand).abs().max().item())
+    return {"agreement": equal / total, "max_prob_diff": max_diff}
@@ -10,13 +10,16 @@ import time
 import numpy as np
 import xarray as xr
 import random
-from contextlib import nullcontext
 
 from shapely.geometry import Polygon, box
 
 from .nbar import call_sen2nbar, correct_processing_baseline
 from .cloudmask import CloudMask, cloud_mask_reduce
 from .. import provider_base
+from ..stac import search_items
+from ..blocks import proxy_items
+from ..sessions import bucket_endpoint, get_session
+from ...execution import compute, get_backend
 
 S2BANDS_DESCRIPTION = {
     "B01": "Coastal aerosol",
@@ -37,17 +40,46 @@ S2BANDS_DESCRIPTION = {
     "mask": "Deep Learning Cloud Mask, trained by Vitus Benson on cloudSEN12, leveraging code from César Aybar."
 }
 
+SCL_NODATA = 0
+SCL_CLOUD_CLASSES = [8, 9, 10]
+
+def scene_flags(scl):
+    """Per timestep of an SCL stack (time, y, x): whether the scene has no valid pixel in the bbox (empty) and whether all its valid pixels are clouds or cirrus (cloudy)."""
+    valid = scl.notnull() & (scl != SCL_NODATA)
+    n_valid = valid.sum(("y", "x")).values
+    n_cloud = (valid & scl.isin(SCL_CLOUD_CLASSES)).sum(("y", "x")).values
+    empty = n_valid == 0
+    return empty, (~empty) & (n_cloud == n_valid)
+
+def skipped_scenes(stack, scl, cloud_mask):
+    """Stand-in for the processed stack of scenes skipped by the SCL pre-pass: all bands NaN besides SCL, with cloud_mask a mask of the class the cloud mask gives clouds (1) at valid pixels and NaN at nodata."""
+    ds = xr.full_like(stack, np.nan).to_dataset("band")
+    ds["SCL"] = scl
+    if cloud_mask:
+        ds["mask"] = xr.where(scl.notnull() & (scl != SCL_NODATA), 1, np.nan).astype("float32")
+    return ds.to_array("band")
+
+def merge_skipped(processed, skipped, keep, skip):
+    """Processed stack of the scenes at indices keep and stand-ins of the skipped scenes at indices skip, concatenated back into the original order of time."""
+    if len(keep) == 0:
+        return skipped
+    coords = set(processed.coords) & set(skipped.coords)
+    stack = xr.concat([processed.drop_vars(set(processed.coords) - coords), skipped.drop_vars(set(skipped.coords) - coords)], dim = "time", coords = "minimal", compat = "override")
+    return stack.isel(time = np.argsort(np.concatenate([keep, skip]), kind = "stable"))
+
 class Sentinel2(provider_base.Provider):
 
-    def __init__(self, bands = ["AOT", "B01", "B02", "B03", "B04", "B05", "B06", "B07", "B08", "B8A", "B09", "B11", "B12", "WVP"], best_orbit_filter = True, five_daily_filter = False, brdf_correction = True, cloud_mask = True, cloud_mask_rescale_factor = None, aws_bucket = "planetary_computer", s2_avail_var = True, correct_processing_baseline = True):
+    def __init__(self, bands = ["AOT", "B01", "B02", "B03", "B04", "B05", "B06", "B07", "B08", "B8A", "B09", "B11", "B12", "WVP"], best_orbit_filter = True, five_daily_filter = False, brdf_correction = True, cloud_mask = True, cloud_mask_rescale_factor = None, cloud_mask_kwargs = None, aws_bucket = "planetary_computer", s2_avail_var = True, correct_processing_baseline = True, skip_empty_scenes = True):
         
         self.is_temporal = True
         self.name = 's2'
 
-        self.cloud_mask = CloudMask(bands=bands, cloud_mask_rescale_factor = cloud_mask_rescale_factor) if cloud_mask else None
+        # The cloud mask runs after the processing baseline correction and before NBAR, so only the former changes its inputs.
+        preprocessing = {"aws_bucket": aws_bucket, "correct_processing_baseline": correct_processing_baseline}
+        self.cloud_mask = CloudMask(bands=bands, cloud_mask_rescale_factor = cloud_mask_rescale_factor, preprocessing = preprocessing, **(cloud_mask_kwargs or {})) if cloud_mask else None
 
         if self.cloud_mask and "SCL" not in bands:
-            bands += ["SCL"]
+            bands = bands + ["SCL"]
 
         self.bands = bands
         self.best_orbit_filter = best_orbit_filter
@@ -56,22 +88,22 @@ class Sentinel2(provider_base.Provider):
         self.aws_bucket = aws_bucket
         self.s2_avail_var = s2_avail_var
         self.correct_processing_baseline = correct_processing_baseline
+        self.skip_empty_scenes = skip_empty_scenes
 
         if aws_bucket == "dea":
             URL = "https://explorer.digitalearth.africa/stac/"
-            os.environ['AWS_S3_ENDPOINT'] = 's3.af-south-1.amazonaws.com'
 
         elif aws_bucket == "planetary_computer":
             URL = 'https://planetarycomputer.microsoft.com/api/stac/v1'
 
         else:
             URL = "https://earth-search.aws.element84.com/v0"
-            if 'AWS_S3_ENDPOINT' in os.environ:
-                del os.environ['AWS_S3_ENDPOINT']
+
+        self.collection = "s2_l2a" if aws_bucket == "dea" else ("sentinel-2-l2a" if aws_bucket == "planetary_computer" else "sentinel-s2-l2a-cogs")
         
         self.catalog = pystac_client.Client.open(URL)
 
-        os.environ['AWS_NO_SIGN_REQUEST'] = "TRUE"
+        self.session = get_session(bucket_endpoint(aws_bucket))
 
     def get_attrs_for_band(self, band):
 
@@ -109,39 +141,23 @@ class Sentinel2(provider_base.Provider):
         
 
 
-    def load_data(self, bbox, time_interval, **kwargs):
+    def stac_queries(self, bbox, time_interval, **kwargs):
+        queries = [dict(catalog = self.catalog, collections = [self.collection], bbox = bbox, datetime = time_interval)]
+        if self.best_orbit_filter and ("full_time_interval" in kwargs):
+            queries.append(dict(catalog = self.catalog, collections = [self.collection], bbox = bbox, datetime = kwargs["full_time_interval"]))
+        return queries
 
-        if self.aws_bucket == "dea":
-            cm = rasterio.Env(aws_unsigned = True, AWS_S3_ENDPOINT= 's3.af-south-1.amazonaws.com')
-            
-        else:
-            cm = nullcontext()
+    def load_data(self, bbox, time_interval, **kwargs):
 
-        gdal_session = stackstac.DEFAULT_GDAL_ENV.updated(always=dict(session=rasterio.session.AWSSession(aws_unsigned = True, endpoint_url = 's3.af-south-1.amazonaws.com' if self.aws_bucket == "dea" else None)))
+        gdal_session = self.session.gdal_env()
 
-        with cm as gs:
+        with self.session.env():
         
 
-            search = self.catalog.search(
-                        bbox = bbox,
-                        collections=["s2_l2a" if self.aws_bucket == "dea" else ("sentinel-2-l2a" if self.aws_bucket == "planetary_computer" else "sentinel-s2-l2a-cogs")],
-                        datetime=time_interval
-                    )
-            
             if self.aws_bucket == "planetary_computer":
-                for attempt in range(10):
-                    try:
-                        items_s2 = pc.sign(search)
-                    except pystac_client.exceptions.APIError:
-                        print(f"Sen2: Planetary computer time out, attempt {attempt}, retrying in 60 seconds...")
-                        time.sleep(random.uniform(30,90))
-                    else:
-                        break
-                else:
-                    print("Loading Sen2 failed after 10 attempts...")
-                    return None
+                items_s2 = search_items(self.catalog, [self.collection], bbox = bbox, datetime = time_interval, sign = True)
             else:
-                items_s2 = search.get_all_items()
+                items_s2 = search_items(self.catalog, [self.collection], bbox = bbox, datetime = time_interval)
 
             if len(items_s2.to_dict()['features']) == 0:
                 return None
@@ -150,7 +166,7 @@ class Sentinel2(provider_base.Provider):
             epsg = metadata["proj:epsg"]
 
 
-            stack = stackstac.stack(items_s2, epsg = epsg, assets = self.bands, dtype = "float32", properties = ["sentinel:product_id"], band_coords = False, bounds_latlon = bbox, xy_coords = 'center', chunksize = 2048,errors_as_nodata=(RasterioIOError('.*'), ), gdal_env=gdal_session)
+            stack = stackstac.stack(proxy_items(items_s2, self.session, assets = self.bands), epsg = epsg, assets = self.bands, dtype = "float32", properties = ["sentinel:product_id"], band_coords = False, bounds_latlon = bbox, xy_coords = 'center', chunksize = get_backend().chunksize(2048),errors_as_nodata=(RasterioIOError('.*'), ), gdal_env=gdal_session)
 
 
             if self.aws_bucket != "planetary_computer":
@@ -165,16 +181,8 @@ class Sentinel2(provider_base.Provider):
                 if "full_time_interval" in kwargs:
                     full_time_interval = kwargs["full_time_interval"]
 
-                    search_best_orbit = self.catalog.search(
-                            bbox = bbox,
-                            collections=["s2_l2a" if self.aws_bucket == "dea" else ("sentinel-2-l2a" if self.aws_bucket == "planetary_computer" else "sentinel-s2-l2a-cogs")],
-                            datetime=full_time_interval
-                        )
-
-                    if self.aws_bucket == "planetary_computer":
-                        items_s2_best_orbit = pc.sign(search_best_orbit)
-                    else:
-                        items_s2_best_orbit = search_best_orbit.get_all_items()
+                    # Only geometries and dates are needed, so the items are not signed.
+                    items_s2_best_orbit = search_items(self.catalog, [self.collection], bbox = bbox, datetime = full_time_interval)
                 else:
                     full_time_interval = time_interval
                     items_s2_best_orbit = items_s2
@@ -205,15 +213,32 @@ class Sentinel2(provider_base.Provider):
             if len(stack.time) == 0:
                 return None
 
-            if self.correct_processing_baseline:
-                stack = correct_processing_baseline(stack, items_s2)
+            skipped = None
+            if self.skip_empty_scenes and ("SCL" in self.bands):
+                # Cheap pre-pass: only SCL is read for all scenes, empty and fully clouded ones skip the other bands, the cloud mask and NBAR.
+                scl = compute(stack.sel(band = "SCL"))
+                empty, cloudy = scene_flags(scl)
+                skip = np.flatnonzero(empty | cloudy)
+                keep = np.flatnonzero(~(empty | cloudy))
+                if len(skip) > 0:
+                    skipped = skipped_scenes(stack.isel(time = skip), scl.isel(time = skip), self.cloud_mask)
+                    ds = stack.to_dataset("band")
+                    ds["SCL"] = scl
+                    stack = ds.to_array("band").isel(time = keep)
+
+            if (skipped is None) or (len(stack.time) > 0):
+                if self.correct_processing_baseline:
+                    stack = correct_processing_baseline(stack, items_s2)
+
+                if self.cloud_mask:
+                    stack = self.cloud_mask(compute(stack))
+
+                if self.brdf_correction:
+                    stack = call_sen2nbar(stack, items_s2, epsg)
 
-            if self.cloud_mask:
-                stack = self.cloud_mask(stack.compute())
+            if skipped is not None:
+                stack = merge_skipped(stack, skipped, keep, skip)
 
-            if self.brdf_correction:
-                stack = call_sen2nbar(stack, items_s2, epsg)
-                    
             bands = stack.band.values
             stack["band"] = [f"s2_{b}" for b in stack.band.values]
 
@@ -7,7 +7,6 @@ import rasterio
 import numpy as np
 import xarray as xr
 from rasterio import RasterioIOError
-from contextlib import nullcontext
 import time
 import random
 import planetary_computer as pc
@@ -17,6 +16,10 @@ from scipy.ndimage.filters import uniform_filter
 from scipy.ndimage.measurements import variance
 
 from . import provider_base
+from .stac import search_items
+from .blocks import proxy_items
+from .sessions import bucket_endpoint, get_session
+from ..execution import get_backend
 
 
 def lee_filter(da, size):
@@ -65,45 +68,25 @@ class Sentinel1(provider_base.Provider):
             URL = "https://explorer.digitalearth.africa/stac/"
         elif self.aws_bucket == "planetary_computer":
             URL = "https://planetarycomputer.microsoft.com/api/stac/v1"
+        self.collection = "s1_rtc" if self.aws_bucket == "dea" else "sentinel-1-rtc"
         self.catalog = pystac_client.Client.open(URL)
 
-        if self.aws_bucket == "dea":
-            os.environ['AWS_NO_SIGN_REQUEST'] = "TRUE"
-            os.environ['AWS_S3_ENDPOINT'] = 's3.af-south-1.amazonaws.com'
+        self.session = get_session(bucket_endpoint(self.aws_bucket))
+
 
+    def stac_queries(self, bbox, time_interval, **kwargs):
+        return [dict(catalog = self.catalog, collections = [self.collection], bbox = bbox, datetime = time_interval)]
 
     def load_data(self, bbox, time_interval, **kwargs):
 
-        gdal_session = stackstac.DEFAULT_GDAL_ENV.updated(always=dict(session=rasterio.session.AWSSession(aws_unsigned = True, endpoint_url = 's3.af-south-1.amazonaws.com' if self.aws_bucket == "dea" else None)))
+        gdal_session = self.session.gdal_env()
 
-        if self.aws_bucket == "dea":
-            cm = rasterio.Env(aws_unsigned = True, AWS_S3_ENDPOINT= 's3.af-south-1.amazonaws.com')
-            
-        else:
-            cm = nullcontext()
-        
-        with cm as gs:
+        with self.session.env():
 
-            search = self.catalog.search(
-                    bbox = bbox,
-                    collections=["s1_rtc" if self.aws_bucket == "dea" else "sentinel-1-rtc"],
-                    datetime=time_interval
-                )
-                
             if self.aws_bucket == "planetary_computer":
-                for attempt in range(10):
-                    try:
-                        items_s1 = pc.sign(search)
-                    except pystac_client.exceptions.APIError:
-                        print(f"Sen2: Planetary computer time out, attempt {attempt}, retrying in 60 seconds...")
-                        time.sleep(random.uniform(30,90))
-                    else:
-                        break
-                else:
-                    print("Loading Sen2 failed after 10 attempts...")
-                    return None
+                items_s1 = search_items(self.catalog, [self.collection], bbox = bbox, datetime = time_interval, sign = True)
             else:
-                items_s1 = search.get_all_items()
+                items_s1 = search_items(self.catalog, [self.collection], bbox = bbox, datetime = time_interval)
 
                 for item in items_s1:
                     trafo = get_valid_trafo_s1(item)
@@ -118,7 +101,7 @@ class Sentinel1(provider_base.Provider):
             epsg = metadata["proj:epsg"]
             # geotransform = metadata["proj:transform"]
 
-            stack = stackstac.stack(items_s1, epsg = epsg, assets = self.bands, dtype = "float32", properties = False, band_coords = False, bounds_latlon = bbox, xy_coords = 'center', chunksize = 2048,errors_as_nodata=(RasterioIOError('.*'), ), gdal_env=gdal_session)
+            stack = stackstac.stack(proxy_items(items_s1, self.session, assets = self.bands), epsg = epsg, assets = self.bands, dtype = "float32", properties = False, band_coords = False, bounds_latlon = bbox, xy_coords = 'center', chunksize = get_backend().chunksize(2048),errors_as_nodata=(RasterioIOError('.*'), ), gdal_env=gdal_session)
 
             # stack = stack.isel(time = [v[0] for v in stack.groupby("time.date").groups.values()])
 
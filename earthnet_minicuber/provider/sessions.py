@@ -0,0 +1,82 @@
+"""Shared GDAL sessions and read settings per data endpoint.
+
+Every raster provider reads from one of a few endpoints (Digital Earth Africa and Element84 buckets on AWS, the Planetary Computer blob storage, the ISRIC web server). Instead of building its own rasterio session and setting AWS variables in os.environ, which leaks into all other providers of the process, a provider asks for the EndpointSession of its endpoint. The sessions are created once per process and reused by all providers and minicubes, and all of them use the same GDAL read profile tuned for small windowed reads from Cloud Optimized GeoTIFFs: no directory listings on open, larger header reads, merged multi-range requests over HTTP/2 with keep-alive and a shared block cache.
+"""
+
+import threading
+
+import rasterio
+import stackstac
+
+from rasterio.session import AWSSession
+
+READ_PROFILE = {
+    # Do not list the directory of every file that is opened.
+    "GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR",
+    # Fetch the COG header with the first request.
+    "GDAL_INGESTED_BYTES_AT_OPEN": 65536,
+    # Read several blocks per request and reuse connections.
+    "GDAL_HTTP_MULTIRANGE": "YES",
+    "GDAL_HTTP_MERGE_CONSECUTIVE_RANGES": "YES",
+    "GDAL_HTTP_MULTIPLEX": "YES",
+    "GDAL_HTTP_VERSION": "2",
+    "GDAL_HTTP_TCP_KEEPALIVE": "YES",
+    "CPL_VSIL_CURL_USE_HEAD": "NO",
+    "GDAL_HTTP_MAX_RETRY": 5,
+    "GDAL_HTTP_RETRY_DELAY": 1,
+    # Keep downloaded blocks, headers and file sizes around for other windows of the same files.
+    "VSI_CACHE": "TRUE",
+    "VSI_CACHE_SIZE": 64 * 2**20,
+    "CPL_VSIL_CURL_CACHE_SIZE": 256 * 2**20,
+}
+
+ENDPOINTS = {
+    "dea": {"aws": {"aws_unsigned": True, "endpoint_url": "s3.af-south-1.amazonaws.com"}, "options": {"AWS_S3_ENDPOINT": "s3.af-south-1.amazonaws.com", "AWS_NO_SIGN_REQUEST": "YES"}},
+    "element84": {"aws": {"aws_unsigned": True}, "options": {"AWS_NO_SIGN_REQUEST": "YES"}},
+    "planetary_computer": {"aws": {"aws_unsigned": True}, "options": {}},
+    "isric": {"aws": None, "options": {}},
+}
+
+
+class EndpointSession:
+
+    def __init__(self, name, aws = None, options = None):
+        self.name = name
+        self.aws_session = AWSSession(**aws) if aws is not None else None
+        self.options = {**READ_PROFILE, **(options or {})}
+        self._gdal_env = None
+
+    def __repr__(self):
+        return f"EndpointSession({self.name})"
+
+    def env(self):
+        """rasterio.Env with the session and read profile of this endpoint, for reads outside of stackstac."""
+        if self.aws_session is not None:
+            return rasterio.Env(session = self.aws_session, **self.options)
+        return rasterio.Env(**self.options)
+
+    def gdal_env(self):
+        """stackstac gdal_env with the session and read profile of this endpoint."""
+        if self._gdal_env is None:
+            always = dict(self.options)
+            if self.aws_session is not None:
+                always["session"] = self.aws_session
+            self._gdal_env = stackstac.DEFAULT_GDAL_ENV.updated(always = always)
+        return self._gdal_env
+
+
+_SESSIONS = {}
+_SESSIONS_LOCK = threading.Lock()
+
+
+def get_session(endpoint):
+    """The EndpointSession of an endpoint ("dea", "element84", "planetary_computer" or "isric"), shared by the whole process."""
+    with _SESSIONS_LOCK:
+        if endpoint not in _SESSIONS:
+            _SESSIONS[endpoint] = EndpointSession(endpoint, **ENDPOINTS[endpoint])
+        return _SESSIONS[endpoint]
+
+
+def bucket_endpoint(aws_bucket):
+    """Endpoint of the aws_bucket argument of the Sentinel 1, Sentinel 2 and ESA Worldcover providers."""
+    return aws_bucket if aws_bucket in ["dea", "planetary_computer"] else "element84"
@@ -11,6 +11,8 @@ from pathlib import Path
 import traceback
 
 from . import provider_base
+from .sessions import get_session
+from .tiles import get_tile_cache, snapped_window
 
 
 
@@ -60,6 +62,15 @@ class Soilgrids(provider_base.Provider):
         sg_url = f'/vsicurl?max_retry=3&retry_delay=1&list_dir=no&url={location}'
         return sg_url
 
+    def read_snapped(self, sg_url, snapped_bbox):
+        """Data and profile of a pixel aligned window around snapped_bbox, for the tile cache."""
+        with get_session("isric").env(), rasterio.open(sg_url) as src:
+            with WarpedVRT(src, crs=4326, resampling=Resampling.nearest) as vrt:
+                window = snapped_window(vrt, snapped_bbox)
+                data = vrt.read(window=window)
+                profile = {"crs": vrt.crs, "transform": vrt.window_transform(window), "nodata": vrt.nodata}
+        return data, profile
+
     def open_one_soilgrid(self, var, depth, val, bbox):
 
         if self.dirpath is not None:
@@ -86,10 +97,14 @@ class Soilgrids(provider_base.Provider):
         
         sg_url = self.construct_url(var, depth, val)
 
-        with rasterio.open(sg_url) as src:
-            with WarpedVRT(src, crs=4326, resampling=Resampling.nearest) as vrt:
-                dst_window = vrt.window(*bbox)
-                data = vrt.read(window=dst_window)
+        tile_cache = get_tile_cache()
+        if tile_cache is not None:
+            data = tile_cache.read_window(sg_url, bbox, lambda snapped: self.read_snapped(sg_url, snapped))
+        else:
+            with get_session("isric").env(), rasterio.open(sg_url) as src:
+                with WarpedVRT(src, crs=4326, resampling=Resampling.nearest) as vrt:
+                    dst_window = vrt.window(*bbox)
+                    data = vrt.read(window=dst_window)
 
         _, ny, nx = data.shape
         lon_left, lat_bottom, lon_right, lat_top = bbox
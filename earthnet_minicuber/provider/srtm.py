@@ -8,6 +8,11 @@ import numpy as np
 
 
 from . import provider_base
+from .stac import search_items
+from .sessions import get_session
+from .blocks import proxy_items
+from .tiles import localize_items
+from ..execution import get_backend
 
 
 class SRTM(provider_base.Provider):
@@ -22,21 +27,20 @@ class SRTM(provider_base.Provider):
         URL = "https://explorer.digitalearth.africa/stac/"
         self.catalog = pystac_client.Client.open(URL)
 
-        os.environ['AWS_NO_SIGN_REQUEST'] = "TRUE"
-        os.environ['AWS_S3_ENDPOINT'] = 's3.af-south-1.amazonaws.com'
+        self.session = get_session("dea")
 
 
+    def stac_queries(self, bbox, time_interval, **kwargs):
+        return [dict(catalog = self.catalog, collections = ["dem_srtm"], bbox = bbox)]
+
     def load_data(self, bbox, time_interval, **kwargs):
         
-        with rasterio.Env(aws_unsigned = True, AWS_S3_ENDPOINT= 's3.af-south-1.amazonaws.com'):
+        with self.session.env():
 
             stack = None
 
             # if "dem" in self.bands:
-            items_srtm = self.catalog.search(
-                    bbox = bbox,
-                    collections=["dem_srtm"]
-                ).get_all_items()
+            items_srtm = search_items(self.catalog, ["dem_srtm"], bbox = bbox)
 
             if len(items_srtm.to_dict()['features']) == 0:
                 return None
@@ -44,7 +48,9 @@ class SRTM(provider_base.Provider):
             metadata = items_srtm.to_dict()['features'][0]["properties"]
             epsg = metadata["proj:epsg"]
 
-            stack = stackstac.stack(items_srtm, epsg = epsg, dtype = "float32", properties = False, band_coords = False, bounds_latlon = bbox, xy_coords = 'center', chunksize = 512)
+            items_srtm = proxy_items(localize_items(items_srtm, self.session), self.session)
+
+            stack = stackstac.stack(items_srtm, epsg = epsg, dtype = "float32", properties = False, band_coords = False, bounds_latlon = bbox, xy_coords = 'center', chunksize = get_backend().chunksize(512), gdal_env = self.session.gdal_env())
             stack["band"] = ["dem"]
 
             # if "mrrtf" in self.bands or "mrvbf" in self.bands or "slope" in self.bands:
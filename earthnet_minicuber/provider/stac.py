@@ -0,0 +1,128 @@
+"""STAC searches with an optional on-disk response cache.
+
+All providers run their STAC searches through `search_items`. Searches prefetched concurrently (see stac_async) are taken from memory. If a STAC cache is configured, either with `set_stac_cache` or through the environment variable EMC_STAC_CACHE (a directory), the unsigned search results are stored on disk keyed by catalog URL, collections, bbox and datetime. Planetary Computer items are signed after reading them from the cache, so cached entries never contain expired tokens.
+"""
+
+import os
+import threading
+
+import pystac
+
+from ..cache import DiskCache, hash_key
+from ..retry import retry_call
+from ..tracing import span
+
+
+class StacCache(DiskCache):
+
+    def __init__(self, path, max_bytes = "1GB", ttl = 7*24*3600, **kwargs):
+        super().__init__(path, max_bytes = max_bytes, ttl = ttl, **kwargs)
+
+    def get(self, key):
+        d = self.get_json(key)
+        return pystac.ItemCollection.from_dict(d, preserve_dict = False) if d is not None else None
+
+    def put(self, key, items):
+        self.put_json(key, items.to_dict(transform_hrefs = False))
+
+
+_STAC_CACHE = None
+
+
+def set_stac_cache(cache = None, **kwargs):
+    """Set the STAC cache used by all providers of this process.
+
+    Args:
+        cache: A StacCache (or any object with get(key) and put(key, items)), a directory for a new StacCache, or None to disable caching.
+        kwargs: Passed on to StacCache if cache is a directory, e.g. max_bytes or ttl.
+    """
+    global _STAC_CACHE
+    if (cache is not None) and isinstance(cache, (str, os.PathLike)):
+        cache = StacCache(cache, **kwargs)
+    _STAC_CACHE = cache
+    return cache
+
+
+def get_stac_cache():
+    global _STAC_CACHE
+    if (_STAC_CACHE is None) and os.environ.get("EMC_STAC_CACHE"):
+        _STAC_CACHE = StacCache(os.environ["EMC_STAC_CACHE"])
+    return _STAC_CACHE
+
+
+_PREFETCHED = {}
+_PREFETCHED_LOCK = threading.Lock()
+
+
+def add_prefetched(key, items):
+    """Make the result of a search available to search_items of this process, e.g. after prefetching it concurrently."""
+    with _PREFETCHED_LOCK:
+        _PREFETCHED[hash_key(key)] = items
+
+
+def get_prefetched(key):
+    with _PREFETCHED_LOCK:
+        return _PREFETCHED.get(hash_key(key))
+
+
+def discard_prefetched(keys):
+    with _PREFETCHED_LOCK:
+        for key in keys:
+            _PREFETCHED.pop(hash_key(key), None)
+
+
+def catalog_url(catalog):
+    url = catalog.get_self_href()
+    return url.rstrip("/") if url else url
+
+
+def search_key(catalog, collections, bbox = None, datetime = None, **kwargs):
+    return {
+        "url": catalog_url(catalog),
+        "collections": sorted(collections),
+        "bbox": [round(float(v), 7) for v in bbox] if bbox is not None else None,
+        "datetime": datetime,
+        **kwargs
+    }
+
+
+def search_items(catalog, collections, bbox = None, datetime = None, sign = False, **kwargs):
+    """Search a STAC catalog and return all matching items as a pystac.ItemCollection.
+
+    Args:
+        catalog: pystac_client.Client to search.
+        collections: List of collection ids.
+        bbox: Bounding box (left, bottom, right, top) in lon/lat.
+        datetime: Datetime or datetime interval, None for no temporal filter.
+        sign: If True, sign the items for the Planetary Computer.
+    """
+    with span("stac_search", collections = list(collections), datetime = datetime) as record:
+        cache = get_stac_cache()
+        key = search_key(catalog, collections, bbox = bbox, datetime = datetime, **kwargs)
+
+        items = get_prefetched(key)
+        record["prefetched"] = items is not None
+
+        if (items is None) and (cache is not None):
+            items = cache.get(key)
+        record["cached"] = (items is not None) and not record["prefetched"]
+
+        if items is None:
+            search_kwargs = dict(bbox = bbox, collections = collections, **kwargs)
+            if datetime is not None:
+                search_kwargs["datetime"] = datetime
+            url = catalog_url(catalog)
+            if url and url.startswith("http"):
+                items = retry_call(lambda: catalog.search(**search_kwargs).item_collection(), endpoint = url)
+            else:
+                items = catalog.search(**search_kwargs).item_collection()
+            if cache is not None:
+                cache.put(key, items)
+
+        if sign:
+            import planetary_computer as pc
+            items = pc.sign(items)
+
+        record["items"] = len(items)
+
+    return items
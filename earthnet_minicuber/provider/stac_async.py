@@ -0,0 +1,151 @@
+"""Concurrent prefetching of STAC searches with asyncio and aiohttp.
+
+A minicube runs one STAC search per provider and time interval, one after the other. `prefetch_searches` issues all of them up front, concurrently with a limit on the number of open requests, and hands the results to `search_items`, so the `load_data` calls of the providers find their searches already done. Searches that fail are left to `load_data`, which runs them synchronously as before.
+"""
+
+import asyncio
+import threading
+
+import pystac
+
+from pystac_client import ItemSearch
+
+from ..cache import hash_key
+from ..retry import backoff_delay, count_retry, get_endpoint
+from ..tracing import span
+from .stac import add_prefetched, get_stac_cache, search_key
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def search_request(catalog, collections, bbox = None, datetime = None, limit = 100, **kwargs):
+    """URL and JSON body of the POST /search request equivalent to catalog.search(...), None if the catalog has no HTTP search endpoint."""
+    search_link = catalog.get_search_link() if hasattr(catalog, "get_search_link") else None
+    if search_link is None:
+        return None
+    url = search_link.href
+    params = ItemSearch(url, bbox = bbox, datetime = datetime, collections = collections, limit = limit, **kwargs).get_parameters()
+    return url, {k: list(v) if isinstance(v, tuple) else v for k, v in params.items()}
+
+
+async def fetch_items(session, semaphore, url, body, max_attempts = 3, retry_wait = 2):
+    """All items of a search, following the next links of the result pages."""
+    import aiohttp
+
+    endpoint = get_endpoint(url)
+    features = []
+    method, headers = "POST", None
+    while url is not None:
+        for attempt in range(max_attempts):
+            # reserve locks and updates the shared state file, which must not block the event loop.
+            await asyncio.sleep(await asyncio.to_thread(endpoint.reserve))
+            try:
+                async with semaphore:
+                    async with session.request(method, url, json = body if method == "POST" else None, headers = headers) as response:
+                        if response.status in RETRY_STATUS and (attempt + 1 < max_attempts):
+                            raise aiohttp.ClientResponseError(response.request_info, response.history, status = response.status)
+                        response.raise_for_status()
+                        page = await response.json(content_type = None)
+                endpoint.record(True)
+                break
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                endpoint.record(False)
+                if attempt + 1 == max_attempts:
+                    raise
+                count_retry(endpoint.name)
+                await asyncio.sleep(backoff_delay(attempt, base_delay = retry_wait))
+
+        features += page.get("features", [])
+
+        next_link = next((link for link in page.get("links", []) if link.get("rel") == "next"), None)
+        if next_link is None:
+            url = None
+        else:
+            url = next_link["href"]
+            method = next_link.get("method", "GET").upper()
+            headers = next_link.get("headers")
+            if method == "POST":
+                body = {**body, **next_link.get("body", {})} if next_link.get("merge", False) else next_link.get("body", body)
+
+    return pystac.ItemCollection.from_dict({"type": "FeatureCollection", "features": features}, preserve_dict = False)
+
+
+async def _prefetch(requests, max_concurrency, timeout):
+    import aiohttp
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+    async with aiohttp.ClientSession(timeout = aiohttp.ClientTimeout(total = timeout)) as session:
+        tasks = [fetch_items(session, semaphore, url, body) for url, body in requests]
+        return await asyncio.gather(*tasks, return_exceptions = True)
+
+
+def _run(coroutine):
+    """Run a coroutine to completion, also from code that already runs in an event loop (e.g. Jupyter)."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+
+    result = {}
+    def target():
+        try:
+            result["value"] = asyncio.run(coroutine)
+        except BaseException as e:
+            result["error"] = e
+    thread = threading.Thread(target = target)
+    thread.start()
+    thread.join()
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
+
+
+def prefetch_searches(queries, max_concurrency = 8, timeout = 300, verbose = False):
+    """Run STAC searches concurrently and make their results available to search_items.
+
+    Args:
+        queries: List of dicts with the search_items arguments catalog, collections, bbox, datetime and further search parameters (as returned by Provider.stac_queries).
+        max_concurrency: Maximum number of concurrent requests.
+        timeout: Timeout in seconds per request.
+
+    Returns:
+        List of the search keys that were prefetched, to be released with discard_prefetched.
+    """
+    cache = get_stac_cache()
+
+    prefetched = []
+    todo = {}
+    for query in queries:
+        # Further search parameters (e.g. query or filter) are part of the key, like in search_items.
+        kwargs = {k: v for k, v in query.items() if k not in ["catalog", "collections", "bbox", "datetime", "sign"]}
+        key = search_key(query["catalog"], query["collections"], bbox = query.get("bbox"), datetime = query.get("datetime"), **kwargs)
+        if (hash_key(key) in todo) or (key in prefetched):
+            continue
+        items = cache.get(key) if cache is not None else None
+        if items is not None:
+            add_prefetched(key, items)
+            prefetched.append(key)
+            continue
+        request = search_request(query["catalog"], query["collections"], bbox = query.get("bbox"), datetime = query.get("datetime"), **kwargs)
+        if request is not None:
+            todo[hash_key(key)] = (key, request)
+
+    if len(todo) == 0:
+        return prefetched
+
+    with span("stac_prefetch", searches = len(todo)) as record:
+        results = _run(_prefetch([request for _, request in todo.values()], max_concurrency, timeout))
+
+        for (key, _), items in zip(todo.values(), results):
+            if isinstance(items, BaseException):
+                if verbose:
+                    print(f"Prefetching STAC search {key['collections']} {key['datetime']} failed ({items.__class__.__name__}), searching again when loading.")
+                continue
+            add_prefetched(key, items)
+            if cache is not None:
+                cache.put(key, items)
+            prefetched.append(key)
+
+        record["failed"] = sum(isinstance(items, BaseException) for items in results)
+
+    return prefetched
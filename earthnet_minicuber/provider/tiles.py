@@ -0,0 +1,156 @@
+"""Local cache of the tiles of static spatial layers.
+
+The static providers (SRTM, Copernicus DEM, ALOS World 3D, NASADEM, ESA Worldcover, NDVI climatology, Soilgrids) read the same source tiles for every minicube in a region, and every minicube downloads its window again. With a tile cache, either set with `set_tile_cache` or through the environment variable EMC_TILE_CACHE (a directory), the source COGs of the STAC items are copied once to local disk and all later minicubes read the local copies. Entries are keyed by the asset href without its query string, so Planetary Computer tiles are found again after their signing tokens expire. Soilgrids only serves global VRTs, so its reads are cached as GeoTIFFs of windows snapped to a grid of SNAP_DEGREES, which neighbouring minicubes share.
+
+The cache is a DiskCache: shared by all processes using the same directory, written atomically and limited to max_bytes (least recently used tiles are evicted). Copies that fail are simply read remotely.
+"""
+
+import math
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from urllib.parse import urlparse, urlunparse
+
+import pystac
+import rasterio
+import rasterio.shutil
+
+from rasterio.windows import Window
+
+from ..cache import DiskCache
+from ..tracing import span
+
+SNAP_DEGREES = 0.25
+
+TIFF_SUFFIXES = (".tif", ".tiff")
+
+
+def strip_query(href):
+    """The href without query string and fragment, e.g. without Planetary Computer tokens."""
+    return urlunparse(urlparse(href)._replace(query = "", fragment = ""))
+
+
+def is_raster_asset(asset):
+    return ("tiff" in (asset.media_type or "")) or urlparse(asset.href).path.lower().endswith(TIFF_SUFFIXES)
+
+
+def snap_bbox(bbox, degrees = SNAP_DEGREES):
+    """The bbox (lon_left, lat_bottom, lon_right, lat_top) expanded to multiples of degrees."""
+    return [math.floor(bbox[0] / degrees) * degrees, math.floor(bbox[1] / degrees) * degrees, math.ceil(bbox[2] / degrees) * degrees, math.ceil(bbox[3] / degrees) * degrees]
+
+
+class TileCache(DiskCache):
+
+    def __init__(self, path, max_bytes = "20GB", ttl = None, max_workers = 8, **kwargs):
+        """
+        Args:
+            path: Cache directory.
+            max_bytes: Size limit, least recently used tiles are evicted above it.
+            ttl: Time to live of a tile in seconds. None for no expiry, static layers do not change.
+            max_workers: Concurrent tile downloads.
+        """
+        super().__init__(path, max_bytes = max_bytes, ttl = ttl, **kwargs)
+        # Local tiles are referenced by absolute paths in the STAC items.
+        self.path = self.path.resolve()
+        self.max_workers = max_workers
+
+    def get_tile(self, href, session = None):
+        """Local path of the tile at href, copied with the rasterio session of its endpoint on a miss. The remote href if the copy fails."""
+        key = {"href": strip_query(href)}
+        path = self.lookup(key, ".tif")
+        if path is not None:
+            return str(path)
+
+        try:
+            with span("download_tile", href = key["href"]):
+                with self.writing(key, ".tif") as tmppath:
+                    with (session.env() if session is not None else rasterio.Env()):
+                        rasterio.shutil.copyfiles(href, tmppath)
+        except Exception as e:
+            print(f"Could not cache tile {key['href']}, reading it remotely: {e}")
+            return href
+
+        return str(self.entry_path(key, ".tif"))
+
+    def localize(self, items, session = None, assets = None):
+        """Copy of the STAC items with the hrefs of their raster assets (or of the given asset keys) replaced by local tiles."""
+        items = [item.clone() for item in items]
+
+        to_localize = [asset for item in items for key, asset in item.assets.items() if (key in assets if assets is not None else is_raster_asset(asset))]
+
+        with ThreadPoolExecutor(max_workers = self.max_workers) as pool:
+            futures = [pool.submit(copy_context().run, self.get_tile, asset.href, session) for asset in to_localize]
+            paths = [future.result() for future in futures]
+
+        for asset, path in zip(to_localize, paths):
+            asset.href = path
+
+        return pystac.ItemCollection(items)
+
+    def read_window(self, url, bbox, read, degrees = SNAP_DEGREES):
+        """Read bbox from the global layer at url through a cached window snapped to degrees.
+
+        Args:
+            url: GDAL path of the layer, used as key.
+            bbox: lon_left, lat_bottom, lon_right, lat_top.
+            read: Function of a snapped bbox returning the data (bands, y, x) and the rasterio profile of a window of the layer containing it.
+            degrees: Grid size of the snapped windows.
+
+        Returns:
+            Numpy array (bands, y, x) of bbox.
+        """
+        snapped = snap_bbox(bbox, degrees)
+        key = {"url": url, "bbox": snapped}
+        path = self.lookup(key, ".tif")
+        if path is None:
+            data, profile = read(snapped)
+            profile.update(driver = "GTiff", count = data.shape[0], height = data.shape[1], width = data.shape[2], dtype = data.dtype, tiled = True, compress = "deflate")
+            with self.writing(key, ".tif") as tmppath:
+                with rasterio.open(tmppath, "w", **profile) as dst:
+                    dst.write(data)
+            path = self.entry_path(key, ".tif")
+
+        with rasterio.open(path) as src:
+            return src.read(window = src.window(*bbox))
+
+
+def snapped_window(vrt, bbox, margin = 1):
+    """Window of vrt containing bbox, with integer offsets and a margin of pixels."""
+    window = vrt.window(*bbox)
+    col_off, row_off = math.floor(window.col_off) - margin, math.floor(window.row_off) - margin
+    width = math.ceil(window.col_off + window.width) + margin - col_off
+    height = math.ceil(window.row_off + window.height) + margin - row_off
+    return Window(col_off, row_off, width, height).intersection(Window(0, 0, vrt.width, vrt.height))
+
+
+_TILE_CACHE = None
+
+
+def set_tile_cache(cache = None, **kwargs):
+    """Set the tile cache used by all static providers of this process.
+
+    Args:
+        cache: A TileCache, a directory for a new TileCache, or None to disable caching.
+        kwargs: Passed on to TileCache if cache is a directory, e.g. max_bytes.
+    """
+    global _TILE_CACHE
+    if (cache is not None) and isinstance(cache, (str, os.PathLike)):
+        cache = TileCache(cache, **kwargs)
+    _TILE_CACHE = cache
+    return cache
+
+
+def get_tile_cache():
+    global _TILE_CACHE
+    if (_TILE_CACHE is None) and os.environ.get("EMC_TILE_CACHE"):
+        _TILE_CACHE = TileCache(os.environ["EMC_TILE_CACHE"])
+    return _TILE_CACHE
+
+
+def localize_items(items, session = None, assets = None):
+    """The STAC items reading from local tiles if a tile cache is set, else the items unchanged."""
+    cache = get_tile_cache()
+    if cache is None:
+        return items
+    return cache.localize(items, session = session, assets = assets)
@@ -0,0 +1,143 @@
+"""Precomputed regridding of provider cubes onto the minicube grid.
+
+The target grid of a minicube is the outer product of two 1d coordinate vectors, so regridding separates into one lookup per axis. A RegridPlan holds, per axis, the nearest neighbour indices and the bilinear indices and weights from a source grid to a target grid. Plans are cached per (source grid, target grid) and applied to all variables and timesteps at once with vectorized numpy indexing (per chunk if the data is a dask array).
+"""
+
+import threading
+
+from collections import OrderedDict
+
+import numpy as np
+import xarray as xr
+
+
+def axis_weights(src, dst):
+    """Nearest indices, bilinear indices and weights, and validity mask to interpolate from coordinates src to dst.
+
+    src may be ascending or descending. Target coordinates outside of src are invalid (filled with NaN), like in xarray.interp.
+    """
+    src = np.asarray(src, dtype = "float64")
+    dst = np.asarray(dst, dtype = "float64")
+
+    order = np.argsort(src, kind = "stable")
+    s = src[order]
+
+    if len(s) == 1:
+        idx = np.zeros(len(dst), dtype = "int64")
+        return idx, idx, idx, np.zeros(len(dst)), (dst == s[0])
+
+    i = np.clip(np.searchsorted(s, dst, side = "right") - 1, 0, len(s) - 2)
+    t = (dst - s[i]) / (s[i+1] - s[i])
+    valid = (dst >= s[0]) & (dst <= s[-1])
+
+    i0, i1 = order[i], order[i+1]
+    nearest = np.where(t <= 0.5, i0, i1)
+
+    return nearest, i0, i1, np.where(valid, t, 0.0), valid
+
+
+def output_dtype(dtype, method = "nearest"):
+    """dtype of regridded data, the same as with xarray.interp: float64 for bilinear interpolation, the input dtype of floats and float64 of other types for nearest neighbour."""
+    if (method != "linear") and np.issubdtype(dtype, np.floating):
+        return np.dtype(dtype)
+    return np.result_type(dtype, np.float64)
+
+
+def _nearest(arr, iy, ix, valid):
+    out = np.take(np.take(arr, iy, axis = -2), ix, axis = -1).astype(output_dtype(arr.dtype, "nearest"))
+    out[..., ~valid] = np.nan
+    return out
+
+
+def _bilinear(arr, iy0, iy1, wy, ix0, ix1, wx, valid):
+    dtype = output_dtype(arr.dtype, "linear")
+    rows0 = np.take(arr, iy0, axis = -2)
+    rows1 = np.take(arr, iy1, axis = -2)
+
+    out = np.zeros(arr.shape[:-2] + (len(iy0), len(ix0)), dtype = dtype)
+    for rows, w_row in [(rows0, 1 - wy), (rows1, wy)]:
+        for ix, w_col in [(ix0, 1 - wx), (ix1, wx)]:
+            w = (w_row[:, None] * w_col[None, :]).astype(dtype)
+            # Neighbours with zero weight must not spread their NaNs
+            out += np.where(w > 0, np.take(rows, ix, axis = -1) * w, 0)
+
+    out[..., ~valid] = np.nan
+    return out
+
+
+class RegridPlan:
+
+    def __init__(self, src_x, src_y, dst_x, dst_y):
+        self.nx, self.ny = len(dst_x), len(dst_y)
+        self.ix_nearest, self.ix0, self.ix1, self.wx, valid_x = axis_weights(src_x, dst_x)
+        self.iy_nearest, self.iy0, self.iy1, self.wy, valid_y = axis_weights(src_y, dst_y)
+        self.valid = valid_y[:, None] & valid_x[None, :]
+
+    def regrid_array(self, arr, method = "nearest"):
+        """Regrid a numpy array whose last two axes are (y, x), to the dtype given by output_dtype."""
+        if method == "linear":
+            return _bilinear(arr, self.iy0, self.iy1, self.wy, self.ix0, self.ix1, self.wx, self.valid)
+        else:
+            return _nearest(arr, self.iy_nearest, self.ix_nearest, self.valid)
+
+    def regrid_dataarray(self, da, x_dim, y_dim, method = "nearest"):
+        if da.chunks is not None:
+            da = da.chunk({x_dim: -1, y_dim: -1})
+        return xr.apply_ufunc(
+            self.regrid_array, da,
+            kwargs = {"method": method},
+            input_core_dims = [[y_dim, x_dim]],
+            output_core_dims = [[y_dim, x_dim]],
+            exclude_dims = {x_dim, y_dim},
+            dask = "parallelized",
+            dask_gufunc_kwargs = {"output_sizes": {y_dim: self.ny, x_dim: self.nx}},
+            output_dtypes = [output_dtype(da.dtype, method)],
+            keep_attrs = True
+        )
+
+    def apply(self, ds, x_dim, y_dim, new_x, new_y):
+        """Regrid all data variables of ds, using nearest neighbour or bilinear interpolation depending on their interpolation_type attribute.
+
+        Like in the interp-based regridding, variables without interpolation_type are interpolated with nearest neighbour, variables with another interpolation_type are dropped. Variables without both spatial dimensions are kept as they are. Output dtypes are those of interp too, see output_dtype.
+        """
+        data_vars = {}
+        for name, da in ds.data_vars.items():
+            interpolation_type = da.attrs.get("interpolation_type")
+            if (x_dim not in da.dims) or (y_dim not in da.dims):
+                data_vars[name] = da
+            elif (interpolation_type is None) or (interpolation_type == "nearest"):
+                data_vars[name] = self.regrid_dataarray(da, x_dim, y_dim, method = "nearest")
+            elif interpolation_type == "linear":
+                data_vars[name] = self.regrid_dataarray(da, x_dim, y_dim, method = "linear")
+
+        coords = {k: v for k, v in ds.coords.items() if (x_dim not in v.dims) and (y_dim not in v.dims)}
+        coords[x_dim] = new_x
+        coords[y_dim] = new_y
+
+        return xr.Dataset(data_vars, coords = coords, attrs = ds.attrs)
+
+
+_PLAN_CACHE = OrderedDict()
+_PLAN_CACHE_LOCK = threading.Lock()
+PLAN_CACHE_SIZE = 128
+
+
+def get_regrid_plan(src_x, src_y, dst_x, dst_y):
+    """Cached RegridPlan from the source grid (src_x, src_y) to the target grid (dst_x, dst_y)."""
+    src_x, src_y, dst_x, dst_y = [np.ascontiguousarray(v, dtype = "float64") for v in (src_x, src_y, dst_x, dst_y)]
+    key = (src_x.tobytes(), src_y.tobytes(), dst_x.tobytes(), dst_y.tobytes())
+
+    with _PLAN_CACHE_LOCK:
+        plan = _PLAN_CACHE.get(key)
+        if plan is not None:
+            _PLAN_CACHE.move_to_end(key)
+            return plan
+
+    plan = RegridPlan(src_x, src_y, dst_x, dst_y)
+
+    with _PLAN_CACHE_LOCK:
+        _PLAN_CACHE[key] = plan
+        while len(_PLAN_CACHE) > PLAN_CACHE_SIZE:
+            _PLAN_CACHE.popitem(last = False)
+
+    return plan
@@ -0,0 +1,225 @@
+"""Retries, backoff and rate limits for remote calls.
+
+Remote calls (STAC searches, opening remote Zarr stores) go through `retry_call`, which retries failures that are worth retrying (connection errors, timeouts, STAC API errors) with exponential backoff and full jitter, so failing workers do not come back at the same time.
+
+Each endpoint (e.g. "planetary_computer", "dea", or the host name of other URLs) has a token bucket and a circuit breaker. The token bucket spreads requests over time, so that many workers starting at once do not all hit the endpoint together. The circuit breaker opens after a number of consecutive failures, and for a while all calls to the endpoint fail at once with CircuitOpenError instead of piling up retries on a service that is down. After that, one call is let through to probe the endpoint. Bucket and breaker states are kept in small files in a state directory (EMC_RATE_LIMIT_DIR, by default in the temporary directory) under a file lock, so they are shared by all threads and processes of a machine, e.g. the workers of emc-batch.
+
+Retries are counted per endpoint in the counters opened with `retry_stats()`, and each retry is emitted as a "retry" tracing event.
+"""
+
+import contextvars
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import urlparse
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+
+from .tracing import span
+
+
+# Requests per second and burst size of the token buckets
+RATE_LIMITS = {
+    "planetary_computer": (5, 10),
+    "default": (10, 20),
+}
+
+HOSTS = {
+    "planetarycomputer.microsoft.com": "planetary_computer",
+    "explorer.digitalearth.africa": "dea",
+    "earth-search.aws.element84.com": "element84",
+}
+
+_STATS = contextvars.ContextVar("emc_retry_stats", default = None)
+
+
+class CircuitOpenError(ConnectionError):
+    """Raised without calling the endpoint while its circuit breaker is open."""
+
+    def __init__(self, message, retry_after = 0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_retryable(err):
+    """Connection problems, timeouts and STAC API errors are worth a retry of the call, everything else is not. An open circuit breaker is not, callers retry later (see CircuitOpenError.retry_after)."""
+    import fsspec
+    import pystac_client
+    import requests
+
+    return isinstance(err, (pystac_client.exceptions.APIError, ConnectionError, TimeoutError, fsspec.exceptions.FSTimeoutError, requests.exceptions.ConnectionError, requests.exceptions.Timeout)) and not isinstance(err, CircuitOpenError)
+
+
+def backoff_delay(attempt, base_delay = 1, max_delay = 60):
+    """Seconds to wait before retry number attempt + 1: exponential backoff with full jitter."""
+    return random.uniform(0, min(max_delay, base_delay * 2**attempt))
+
+
+def endpoint_of(url):
+    """Endpoint name of a URL: a known service or the host name."""
+    host = urlparse(url).hostname or url
+    return HOSTS.get(host, host)
+
+
+def state_dir():
+    path = os.environ.get("EMC_RATE_LIMIT_DIR") or Path(tempfile.gettempdir())/f"earthnet_minicuber_endpoints_{os.getuid() if hasattr(os, 'getuid') else 0}"
+    Path(path).mkdir(exist_ok = True, parents = True)
+    return Path(path)
+
+
+class Endpoint:
+
+    def __init__(self, name, rate = None, capacity = None, failure_threshold = 5, reset_timeout = 60, path = None):
+        """
+        Args:
+            name: Endpoint name.
+            rate, capacity: Requests per second and burst size of the token bucket. Defaults from RATE_LIMITS.
+            failure_threshold: Consecutive failures that open the circuit breaker.
+            reset_timeout: Seconds the circuit breaker stays open.
+            path: State file shared across processes, in state_dir() if None.
+        """
+        self.name = name
+        default_rate, default_capacity = RATE_LIMITS.get(name, RATE_LIMITS["default"])
+        self.rate = rate or default_rate
+        self.capacity = capacity or default_capacity
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.path = Path(path) if path is not None else state_dir()/f"{name.replace('/', '_').replace(':', '_')}.json"
+        self._lock = threading.Lock()
+        self._local_state = {}
+
+    def __repr__(self):
+        return f"Endpoint({self.name})"
+
+    @contextmanager
+    def _state(self):
+        """The shared state as a dict, locked for the enclosed code and saved afterwards."""
+        with self._lock:
+            if fcntl is None:
+                yield self._local_state
+                return
+            with open(self.path, "a+") as fp:
+                fcntl.flock(fp, fcntl.LOCK_EX)
+                try:
+                    fp.seek(0)
+                    try:
+                        state = json.loads(fp.read() or "{}")
+                    except ValueError:
+                        state = {}
+                    yield state
+                    fp.seek(0)
+                    fp.truncate()
+                    fp.write(json.dumps(state))
+                    fp.flush()
+                finally:
+                    fcntl.flock(fp, fcntl.LOCK_UN)
+
+    def reserve(self):
+        """Take a token and return the seconds to wait before using it. Raises CircuitOpenError while the circuit breaker is open."""
+        now = time.time()
+        with self._state() as state:
+            opened_at = state.get("opened_at")
+            if opened_at is not None:
+                if now - opened_at < self.reset_timeout:
+                    retry_after = self.reset_timeout - (now - opened_at)
+                    raise CircuitOpenError(f"Circuit breaker of {self.name} is open after {state.get('failures', 0)} consecutive failures, retry in {retry_after:.0f} seconds.", retry_after = retry_after)
+                # Half open: let this call probe the endpoint, the others wait for its outcome.
+                state["opened_at"] = now
+
+            tokens = min(self.capacity, state.get("tokens", self.capacity) + (now - state.get("updated", now)) * self.rate)
+            tokens -= 1
+            state["tokens"], state["updated"] = tokens, now
+        return max(0.0, -tokens / self.rate)
+
+    def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    def record(self, success):
+        with self._state() as state:
+            if success:
+                state["failures"] = 0
+                state["opened_at"] = None
+            else:
+                state["failures"] = state.get("failures", 0) + 1
+                if state["failures"] >= self.failure_threshold:
+                    state["opened_at"] = time.time()
+
+
+_ENDPOINTS = {}
+_ENDPOINTS_LOCK = threading.Lock()
+
+
+def get_endpoint(name):
+    """The Endpoint of a name or URL, shared by the whole process."""
+    name = endpoint_of(name) if "://" in name else name
+    with _ENDPOINTS_LOCK:
+        if name not in _ENDPOINTS:
+            _ENDPOINTS[name] = Endpoint(name)
+        return _ENDPOINTS[name]
+
+
+def set_endpoint(name, **kwargs):
+    """Configure the rate limit and circuit breaker of an endpoint, see Endpoint."""
+    with _ENDPOINTS_LOCK:
+        _ENDPOINTS[name] = Endpoint(name, **kwargs)
+        return _ENDPOINTS[name]
+
+
+@contextmanager
+def retry_stats():
+    """Count the retries of the enclosed code. Yields a dict of retries per endpoint."""
+    stats = {}
+    token = _STATS.set(stats)
+    try:
+        yield stats
+    finally:
+        _STATS.reset(token)
+
+
+def count_retry(endpoint):
+    stats = _STATS.get()
+    if stats is not None:
+        stats[endpoint] = stats.get(endpoint, 0) + 1
+
+
+def retry_call(func, *args, endpoint = "default", max_attempts = 5, base_delay = 1, max_delay = 60, retryable = is_retryable, **kwargs):
+    """Call func(*args, **kwargs) through the rate limit and circuit breaker of endpoint, retrying retryable errors with exponential backoff.
+
+    Args:
+        func: The remote call.
+        endpoint: Endpoint name or URL.
+        max_attempts: Calls before giving up and raising the last error.
+        base_delay, max_delay: Backoff before retry n is uniform in [0, min(max_delay, base_delay * 2**n)] seconds.
+        retryable: Predicate on the raised exception.
+    """
+    endpoint = get_endpoint(endpoint)
+    for attempt in range(max_attempts):
+        endpoint.acquire()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as err:
+            if not retryable(err):
+                # The endpoint answered (e.g. with a 404), which also closes a half open circuit breaker.
+                endpoint.record(True)
+                raise
+            endpoint.record(False)
+            if attempt + 1 == max_attempts:
+                raise
+            delay = backoff_delay(attempt, base_delay = base_delay, max_delay = max_delay)
+            count_retry(endpoint.name)
+            with span("retry", endpoint = endpoint.name, attempt = attempt + 1, error_class = err.__class__.__name__, delay = round(delay, 2)):
+                time.sleep(delay)
+        else:
+            endpoint.record(True)
+            return result
@@ -0,0 +1,137 @@
+"""Streaming minicube output to an appendable Zarr store.
+
+The ZarrStreamWriter receives the minicube one time interval at a time and appends it along time, so the minicube never has to be held in memory completely. Variables without a time dimension (static providers) are written once.
+
+zarr and dask.array are imported on use, so importing earthnet_minicuber does not pay for them.
+"""
+
+import shutil
+
+from pathlib import Path
+
+import numpy as np
+import xarray as xr
+
+
+def blosc_encoding(cname = "zstd", clevel = 5, shuffle = "shuffle", zarr_format = 2):
+    """Zarr encoding entry for Blosc compression, for the installed zarr version and the given zarr format.
+
+    Args:
+        cname: Blosc compressor, e.g. "zstd", "lz4" or "blosclz".
+        clevel: Compression level, 0-9.
+        shuffle: "noshuffle", "shuffle" or "bitshuffle".
+    """
+    import zarr
+
+    if int(zarr.__version__.split(".")[0]) < 3:
+        import numcodecs
+        return {"compressor": numcodecs.Blosc(cname = cname, clevel = clevel, shuffle = getattr(numcodecs.Blosc, shuffle.upper()))}
+    if zarr_format == 2:
+        import numcodecs
+        return {"compressors": (numcodecs.Blosc(cname = cname, clevel = clevel, shuffle = getattr(numcodecs.Blosc, shuffle.upper())),)}
+    return {"compressors": (zarr.codecs.BloscCodec(cname = cname, clevel = clevel, shuffle = shuffle),)}
+
+
+class ZarrStreamWriter:
+
+    def __init__(self, store, time_chunksize = 1):
+        """
+        Args:
+            store: Path of the Zarr store. An existing store is replaced.
+            time_chunksize: Number of timesteps per chunk of the time-dependent variables.
+        """
+        self.store = Path(store)
+        self.time_chunksize = time_chunksize
+
+        if self.store.exists():
+            shutil.rmtree(self.store)
+        else:
+            self.store.parents[0].mkdir(exist_ok = True, parents = True)
+
+        self.schema = {}
+        self.times = None
+        self.static_vars = set()
+        self.attrs = {}
+
+    @property
+    def initialized(self):
+        return self.store.exists()
+
+    def _write(self, ds, **kwargs):
+        ds.to_zarr(self.store, consolidated = False, **kwargs)
+
+    def _time_encoding(self, ds):
+        encoding = {"time": {"units": "seconds since 1970-01-01", "calendar": "proleptic_gregorian", "dtype": "int64"}}
+        for name, da in ds.data_vars.items():
+            encoding[name] = {"chunks": tuple(self.time_chunksize if d == "time" else da.sizes[d] for d in da.dims)}
+        return encoding
+
+    def _add_variable(self, name, template):
+        """Add a new time-dependent variable, filled with NaN for all timesteps written so far."""
+        import dask.array
+
+        shape = tuple(len(self.times) if d == "time" else template.sizes[d] for d in template.dims)
+        chunks = tuple(self.time_chunksize if d == "time" else template.sizes[d] for d in template.dims)
+        da = xr.DataArray(dask.array.full(shape, np.nan, dtype = template.dtype, chunks = chunks), dims = template.dims, attrs = template.attrs)
+        coords = {k: v for k, v in template.coords.items() if k != "time" and k in template.dims}
+        self._write(xr.Dataset({name: da}, coords = coords), mode = "a")
+        self.schema[name] = template
+
+    def write_temporal(self, ds):
+        if len(ds.data_vars) == 0:
+            return
+
+        # Every interval must have the same variables, missing ones are filled with NaN, so all are stored as floats.
+        ds = ds.assign({name: da.astype(np.result_type(da.dtype, np.float32)) for name, da in ds.data_vars.items()})
+
+        if self.times is not None:
+            ds = ds.sel(time = ~ds.time.isin(self.times))
+            if len(ds.time) == 0:
+                return
+
+        if self.times is None:
+            self._write(ds, mode = "w", encoding = self._time_encoding(ds))
+            self.schema = {name: da.isel(time = 0, drop = True).expand_dims(time = 1) for name, da in ds.data_vars.items()}
+            self.times = ds.indexes["time"]
+            return
+
+        for name, da in ds.data_vars.items():
+            if name not in self.schema:
+                self._add_variable(name, da.isel(time = 0, drop = True).expand_dims(time = 1))
+
+        for name, template in self.schema.items():
+            if name not in ds.data_vars:
+                ds[name] = xr.full_like(template.isel(time = 0, drop = True), np.nan).expand_dims(time = ds.time).transpose(*template.dims)
+
+        ds = ds.drop_vars([c for c in ds.coords if c not in ds.dims])
+
+        self._write(ds, append_dim = "time")
+        self.times = self.times.append(ds.indexes["time"])
+
+    def write_static(self, ds):
+        if len(ds.data_vars) == 0:
+            return
+        ds = ds.drop_vars([name for name in ds.data_vars if name in self.static_vars])
+        if self.initialized:
+            import zarr
+            # Coordinates like lat and lon are already in the store.
+            ds = ds.drop_vars([c for c in ds.coords if c in zarr.open_group(self.store, mode = "r")])
+            self._write(ds, mode = "a")
+        else:
+            self._write(ds, mode = "w")
+        self.static_vars.update(ds.data_vars)
+
+    def write(self, cube):
+        """Write one time interval (variables with time dimension) and / or static variables."""
+        self.attrs.update(cube.attrs)
+        temporal = [name for name, da in cube.data_vars.items() if "time" in da.dims]
+        self.write_temporal(cube[temporal])
+        self.write_static(cube.drop_vars(temporal + (["time"] if "time" in cube.coords else [])))
+
+    def close(self):
+        if not self.initialized:
+            return
+        import zarr
+        group = zarr.open_group(self.store, mode = "a")
+        group.attrs.update(self.attrs)
+        zarr.consolidate_metadata(self.store)
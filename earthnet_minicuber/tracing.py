@@ -0,0 +1,127 @@
+"""Structured tracing of the minicube pipeline.
+
+Pipeline stages (STAC searches, provider loads, regridding, dask computes, saving) are wrapped in spans. While a Tracer is active, every finished span is emitted as one event: a dict with the stage, its duration in seconds, the peak resident memory of the process, stage specific fields (e.g. number of STAC items or bytes) and the fields of the enclosing trace_context (e.g. cube_id, provider and time interval). Events are written as JSON lines and / or passed to callbacks.
+
+Tracing is off unless a tracer is set with `tracing(...)` or the environment variable EMC_TRACE points to a JSON lines file. Without a tracer a span costs one context variable lookup.
+
+The active tracer and context are context variables, so they follow the code into threads only if the work is submitted with contextvars.copy_context().run, as Minicuber does.
+"""
+
+import contextvars
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+
+_TRACER = contextvars.ContextVar("emc_tracer", default = None)
+_CONTEXT = contextvars.ContextVar("emc_trace_context", default = {})
+_ENV_TRACER = None
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes, None where unavailable."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+class Tracer:
+
+    def __init__(self, path = None, callbacks = None):
+        """
+        Args:
+            path: JSON lines file the events are appended to. Lines are written with a single write, so several processes can share one file.
+            callbacks: Callables that are called with each event dict.
+        """
+        self.path = path
+        self.callbacks = list(callbacks or [])
+        self._lock = threading.Lock()
+
+    def emit(self, event):
+        event = {"timestamp": datetime.datetime.now().isoformat(), "pid": os.getpid(), **event}
+        if self.path is not None:
+            line = json.dumps(event, default = str) + "\n"
+            with self._lock:
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, line.encode())
+                finally:
+                    os.close(fd)
+        for callback in self.callbacks:
+            callback(event)
+
+
+def get_tracer():
+    global _ENV_TRACER
+    tracer = _TRACER.get()
+    if (tracer is None) and os.environ.get("EMC_TRACE"):
+        if (_ENV_TRACER is None) or (_ENV_TRACER.path != os.environ["EMC_TRACE"]):
+            _ENV_TRACER = Tracer(os.environ["EMC_TRACE"])
+        tracer = _ENV_TRACER
+    return tracer
+
+
+@contextmanager
+def tracing(tracer = None, path = None, callbacks = None):
+    """Activate a tracer for the enclosed code.
+
+    Args:
+        tracer: A Tracer, or a path of a JSON lines file, or a callable receiving the events.
+        path, callbacks: Create a Tracer with these arguments instead.
+    """
+    if tracer is None:
+        tracer = Tracer(path = path, callbacks = callbacks)
+    elif callable(tracer) and not isinstance(tracer, Tracer):
+        tracer = Tracer(callbacks = [tracer])
+    elif not isinstance(tracer, Tracer):
+        tracer = Tracer(path = tracer)
+    token = _TRACER.set(tracer)
+    try:
+        yield tracer
+    finally:
+        _TRACER.reset(token)
+
+
+@contextmanager
+def trace_context(**fields):
+    """Add fields to all events emitted in the enclosed code."""
+    token = _CONTEXT.set({**_CONTEXT.get(), **fields})
+    try:
+        yield
+    finally:
+        _CONTEXT.reset(token)
+
+
+@contextmanager
+def span(stage, **fields):
+    """Time the enclosed code as a stage. Yields a dict, fields added to it are emitted with the event."""
+    tracer = get_tracer()
+    record = dict(fields)
+    if tracer is None:
+        yield record
+        return
+
+    start = time.perf_counter()
+    error = None
+    try:
+        yield record
+    except BaseException as e:
+        error = e.__class__.__name__
+        raise
+    finally:
+        event = {**_CONTEXT.get(), "stage": stage, **record, "seconds": time.perf_counter() - start, "peak_rss": peak_rss()}
+        if error is not None:
+            event["error"] = error
+        tracer.emit(event)
@@ -13,6 +13,7 @@ install_requires = [
     "pillow",
     "xarray",
     "zarr",
+    "numcodecs",
     "dask",
     "netcdf4",
     "pandas",
@@ -43,9 +44,14 @@ setup(name='earthnet-minicuber',
                 "License :: OSI Approved :: MIT License",
                 "Programming Language :: Python :: 3"
                  ],
-        packages=['earthnet_minicuber', 'earthnet_minicuber.provider', 'earthnet_minicuber.provider.s2'],#find_packages(),
+        packages=['earthnet_minicuber', 'earthnet_minicuber.provider', 'earthnet_minicuber.provider.s2', 'earthnet_minicuber.benchmark'],#find_packages(),
         install_requires=install_requires,
+        entry_points={
+            "console_scripts": ["emc-batch=earthnet_minicuber.batch:main", "emc-benchmark=earthnet_minicuber.benchmark.run:main"],
+        },
         extras_require={
             "EE": ["earthengine-api","wxee","eemont"],
+            "distributed": ["distributed"],
+            "onnx": ["onnx", "onnxruntime"],
         }
         )
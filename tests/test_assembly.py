@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from earthnet_minicuber.assembly import CubeAssembler
+
+
+def product_cube(name, times, seed, nan_fraction = 0.0):
+    rng = np.random.default_rng(seed)
+    data = rng.uniform(0, 1, (len(times), 4, 5)).astype("float32")
+    data[rng.uniform(0, 1, data.shape) < nan_fraction] = np.nan
+    return xr.Dataset({name: (("time", "lat", "lon"), data, {"interpolation_type": "linear"})}, coords = {"time": times, "lat": np.linspace(51, 50.9, 4), "lon": np.linspace(11.5, 11.6, 5)})
+
+
+def overlapping_cubes():
+    """Two providers with different timesteps, each loaded in two intervals that share their boundary timestep, and a static cube."""
+    s2_times, era5_times = pd.date_range("2021-01-01", "2021-02-25", freq = "5D"), pd.date_range("2021-01-01", "2021-02-28", freq = "D")
+    s2_first = product_cube("s2_B02", s2_times[:7], seed = 0, nan_fraction = 0.3)
+    s2_second = product_cube("s2_B02", s2_times[6:], seed = 1, nan_fraction = 0.3)
+    # The boundary timestep has the same values in both intervals where both are valid, the second one fills gaps of the first.
+    boundary = s2_first["s2_B02"].isel(time = -1).values
+    s2_second["s2_B02"][0] = np.where(np.isnan(boundary), s2_second["s2_B02"][0].values, boundary)
+    era5_first = product_cube("era5_t", era5_times[:31], seed = 2)
+    era5_second = product_cube("era5_t", era5_times[30:], seed = 3)
+    era5_second["era5_t"][0] = era5_first["era5_t"][-1]
+    dem = product_cube("cop_dem", era5_times[:1], seed = 4).isel(time = 0, drop = True)
+    return [s2_first, era5_first, dem, s2_second, era5_second]
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_assembly_matches_merge(lazy):
+    cubes = overlapping_cubes()
+    expected = xr.merge(cubes, compat = "no_conflicts", join = "outer")
+
+    assembler = CubeAssembler()
+    for cube in cubes:
+        assembler.add(cube.chunk() if lazy else cube)
+    assembled = assembler.to_dataset().compute()
+
+    assert len(assembler) == 0
+    assert sorted(assembled.data_vars) == sorted(expected.data_vars)
+    for name in expected.data_vars:
+        assert assembled[name].dtype == expected[name].dtype
+        xr.testing.assert_equal(assembled[name].transpose(*expected[name].dims), expected[name])
@@ -0,0 +1,32 @@
+import time
+
+from earthnet_minicuber import batch, retry
+from earthnet_minicuber.minicuber import Minicuber
+
+
+def test_run_job_waits_for_open_circuit_breaker(tmp_path, monkeypatch):
+    endpoint = retry.set_endpoint("test_outage", failure_threshold = 1, reset_timeout = 1, path = tmp_path/"test_outage.json")
+    calls = []
+
+    def remote_call():
+        calls.append(time.time())
+        if len(calls) == 1:
+            raise ConnectionError("endpoint down")
+        return "ok"
+
+    def save_minicube(specs, savepath, **kwargs):
+        retry.retry_call(remote_call, endpoint = endpoint.name, max_attempts = 1)
+        savepath.write_text("cube")
+
+    monkeypatch.setattr(Minicuber, "save_minicube", save_minicube)
+    monkeypatch.setattr(batch, "backoff_delay", lambda attempt, base_delay = 1, max_delay = 60: 0)
+
+    # The first attempt opens the breaker, the second one finds it open, the third one probes the recovered endpoint.
+    job = {"cube_id": "cube", "specs": {}, "savepath": str(tmp_path/"cube.nc")}
+    record = batch.run_job(job, max_attempts = 3, retry_wait = 0)
+
+    assert record["status"] == "done"
+    assert record["attempts"] == 3
+    assert len(calls) == 2
+    assert calls[1] - calls[0] >= endpoint.reset_timeout * 0.99
+    assert (tmp_path/"cube.nc").read_text() == "cube"
@@ -0,0 +1,70 @@
+import re
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from earthnet_minicuber.provider.blocks import BlockCache, UpstreamError
+
+DATA = bytes(range(256)) * 64
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serves DATA with Range support at /good/..., a shorter range at /short/... and a shifted one at /misaligned/..."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        start, end = [int(v) for v in re.fullmatch(r"bytes=(\d+)-(\d+)", self.headers["Range"]).groups()]
+        end = min(end, len(DATA) - 1)
+        mode = self.path.split("/")[1]
+        if mode == "short":
+            end = max(start, end - 10)
+        elif mode == "misaligned":
+            start, end = start + 1, min(end + 1, len(DATA) - 1)
+        body = DATA[start:end + 1]
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {start}-{end}/{len(DATA)}")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture(scope = "module")
+def upstream():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def test_proxy_serves_registered_hrefs_only(tmp_path, upstream):
+    cache = BlockCache(tmp_path, block_size = 1024)
+    href = cache.proxy_href(f"{upstream}/good/asset.tif")
+
+    response = requests.get(href, headers = {"Range": "bytes=1000-2999"})
+    assert response.status_code == 206
+    assert response.content == DATA[1000:3000]
+
+    base, secret, token, name = href.rsplit("/", 3)
+    assert requests.get(f"{base}/{'x' * len(secret)}/{token}/{name}").status_code == 403
+    assert requests.get(f"{base}/{secret}/{'0' * len(token)}/{name}").status_code == 403
+    assert requests.get(f"{base}/{token}/{name}").status_code == 403
+
+
+def test_read_range_through_cache(tmp_path, upstream):
+    cache = BlockCache(tmp_path, block_size = 1024)
+    assert cache.read_range(f"{upstream}/good/asset.tif", 500, 5000) == DATA[500:5001]
+    assert cache.read_range(f"{upstream}/good/asset.tif", len(DATA) - 100, len(DATA) - 1) == DATA[-100:]
+
+
+@pytest.mark.parametrize("mode", ["short", "misaligned"])
+def test_bad_ranges_are_not_cached(tmp_path, upstream, mode):
+    cache = BlockCache(tmp_path, block_size = 1024)
+    with pytest.raises(UpstreamError) as err:
+        cache.read_range(f"{upstream}/{mode}/asset.tif", 0, 3000)
+    assert err.value.status == 502
+    assert all(cache.get_bytes(cache.block_key(f"{upstream}/{mode}/asset.tif", index)) is None for index in range(3))
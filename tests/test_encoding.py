@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from earthnet_minicuber.encoding import NETCDF_PRESETS, bitround
+from earthnet_minicuber.minicuber import Minicuber
+
+
+def test_bitround():
+    values = np.array([1.0, 1.2, -3.7, 1e-30, 123456.789], dtype = "float32")
+    for keepbits in [0, 3, 10, 22]:
+        rounded = bitround(values, keepbits)
+        assert rounded.dtype == np.float32
+        np.testing.assert_allclose(rounded, values, rtol = 2.0 ** -(keepbits + 1))
+        # Rounded values have at most keepbits mantissa bits
+        assert (rounded.view("uint32") & np.uint32((1 << (23 - keepbits)) - 1) == 0).all()
+    np.testing.assert_array_equal(bitround(values, 23), values)
+
+
+def test_bitround_keeps_nan_and_inf():
+    values = np.array([np.nan, np.inf, -np.inf, np.finfo("float32").max, -np.finfo("float32").max], dtype = "float32")
+    rounded = bitround(values, 2)
+    assert np.isnan(rounded[0])
+    assert rounded[1] == np.inf and rounded[2] == -np.inf
+    assert np.isfinite(rounded[3:]).all()
+
+
+def test_bitround_rejects_negative_keepbits():
+    with pytest.raises(ValueError):
+        bitround(np.ones(3), -1)
+
+
+@pytest.mark.parametrize("preset", list(NETCDF_PRESETS))
+@pytest.mark.parametrize("keepbits", [None, 7])
+def test_netcdf_round_trip(tmp_path, preset, keepbits):
+    rng = np.random.default_rng(0)
+    minicube = xr.Dataset(
+        {
+            "s2_B02": (("time", "lat", "lon"), rng.uniform(0, 0.3, (3, 8, 8)).astype("float32"), {"interpolation_type": "linear"}),
+            "s2_mask": (("time", "lat", "lon"), rng.integers(0, 4, (3, 8, 8)).astype("float32"), {"interpolation_type": "nearest"}),
+        },
+        coords = {"time": pd.date_range("2021-01-01", periods = 3), "lat": np.linspace(51, 50.9, 8), "lon": np.linspace(11.5, 11.6, 8)},
+    )
+    minicube["s2_B02"][0, 0, 0] = np.nan
+
+    Minicuber.save_minicube_netcdf(minicube, tmp_path/"cube.nc", preset = preset, keepbits = keepbits)
+    saved = xr.open_dataset(tmp_path/"cube.nc").load()
+
+    tolerance = 0.3 * 2.0 ** -(keepbits + 1) if keepbits is not None else 0.3 / (2 ** 16 - 1)
+    np.testing.assert_allclose(saved["s2_B02"].values, minicube["s2_B02"].values, atol = tolerance, equal_nan = True)
+    np.testing.assert_array_equal(saved["s2_mask"].values, minicube["s2_mask"].values)
@@ -0,0 +1,103 @@
+import warnings
+
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from earthnet_minicuber.partition import interval_days, plan_minicube_intervals
+
+
+class FakeProvider:
+    """Temporal provider with one STAC item every five days."""
+
+    def __init__(self, bands = ("B02", "B03", "B04", "B8A"), time_alignment = None):
+        self.is_temporal = True
+        self.bands = list(bands)
+        if time_alignment is not None:
+            self.time_alignment = time_alignment
+
+    def daily_timesteps(self, bbox, time_interval):
+        days = interval_days(time_interval)
+        return pd.Series([1 if (day - days[0]).days % 5 == 0 else 0 for day in days], index = days)
+
+
+def fake_minicuber(time_interval, *providers):
+    return SimpleNamespace(time_interval = time_interval, xy_shape = (128, 128), padded_bbox = (11.5, 50.9, 11.6, 51.0), temporal_providers = list(providers))
+
+
+def timestep_bytes(provider, overhead = 4):
+    return len(provider.bands) * 128 * 128 * 4 * overhead
+
+
+def interval_bytes(provider, time_interval, interval):
+    timesteps = provider.daily_timesteps(None, time_interval)
+    return timesteps[interval_days(interval)].sum() * timestep_bytes(provider)
+
+
+def assert_partition(intervals, time_interval):
+    """The intervals are consecutive and cover every day of time_interval once."""
+    days = [day for interval in intervals for day in interval_days(interval)]
+    assert days == list(interval_days(time_interval))
+
+
+def test_budget_merges_and_splits_months():
+    provider = FakeProvider()
+    time_interval = "2021-01-01/2021-06-30"
+
+    intervals = plan_minicube_intervals(fake_minicuber(time_interval, provider), budget = 100 * timestep_bytes(provider))
+    assert intervals == [time_interval]
+
+    # About two months of timesteps per interval: whole months are merged while they fit
+    budget = 12 * timestep_bytes(provider)
+    intervals = plan_minicube_intervals(fake_minicuber(time_interval, provider), budget = budget)
+    assert_partition(intervals, time_interval)
+    assert intervals == ["2021-01-01/2021-02-28", "2021-03-01/2021-04-30", "2021-05-01/2021-05-31", "2021-06-01/2021-06-30"]
+    assert all(interval_bytes(provider, time_interval, interval) <= budget for interval in intervals)
+
+    # Less than a month per interval: months are split into runs of days that fit the budget
+    budget = 3 * timestep_bytes(provider)
+    intervals = plan_minicube_intervals(fake_minicuber(time_interval, provider), budget = budget)
+    assert_partition(intervals, time_interval)
+    assert len(intervals) > 6
+    assert all(interval_bytes(provider, time_interval, interval) <= budget for interval in intervals)
+
+
+@pytest.mark.parametrize("alignment", ["month", "months"])
+def test_alignment(alignment):
+    s2, era5 = FakeProvider(), FakeProvider(bands = ["t"], time_alignment = alignment)
+    time_interval = "2021-01-15/2021-04-10"
+    minicuber = fake_minicuber(time_interval, s2, era5)
+
+    # A large budget merges months with "months", but not with "month".
+    intervals = plan_minicube_intervals(minicuber, budget = "100GB")
+    assert_partition(intervals, time_interval)
+    if alignment == "month":
+        assert intervals == ["2021-01-15/2021-01-31", "2021-02-01/2021-02-28", "2021-03-01/2021-03-31", "2021-04-01/2021-04-10"]
+    else:
+        assert intervals == [time_interval]
+
+    # A budget below a month never splits months, but warns.
+    with pytest.warns(UserWarning, match = "over the memory budget"):
+        intervals = plan_minicube_intervals(minicuber, budget = timestep_bytes(s2))
+    assert intervals == ["2021-01-15/2021-01-31", "2021-02-01/2021-02-28", "2021-03-01/2021-03-31", "2021-04-01/2021-04-10"]
+
+
+@pytest.mark.parametrize("alignment", [None, "month", "months"])
+def test_interval_shorter_than_a_month(alignment):
+    time_interval = "2021-03-10/2021-03-20"
+    minicuber = fake_minicuber(time_interval, FakeProvider(time_alignment = alignment))
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        assert plan_minicube_intervals(minicuber, budget = "1GB") == [time_interval]
+
+    # One timestep per interval: split into days without alignment, kept whole with it
+    budget = timestep_bytes(minicuber.temporal_providers[0])
+    if alignment is None:
+        intervals = plan_minicube_intervals(minicuber, budget = budget)
+        assert_partition(intervals, time_interval)
+        assert len(intervals) == 3
+    else:
+        with pytest.warns(UserWarning, match = "over the memory budget"):
+            assert plan_minicube_intervals(minicuber, budget = budget) == [time_interval]
@@ -0,0 +1,20 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from earthnet_minicuber.regrid import RegridPlan
+
+
+@pytest.mark.parametrize("method", ["nearest", "linear"])
+@pytest.mark.parametrize("dtype", ["float32", "float64", "uint8"])
+def test_regrid_matches_interp(method, dtype):
+    rng = np.random.default_rng(0)
+    x, y = np.arange(10.), np.arange(8.)[::-1]
+    da = xr.DataArray((rng.uniform(0, 200, (3, 8, 10))).astype(dtype), dims = ("time", "y", "x"), coords = {"y": y, "x": x}, attrs = {"interpolation_type": method})
+    new_x, new_y = rng.uniform(-1, 10, 12), rng.uniform(-1, 8, 9)
+
+    expected = da.interp(x = new_x, y = new_y, method = method)
+    regridded = RegridPlan(x, y, new_x, new_y).apply(da.to_dataset(name = "v"), "x", "y", new_x, new_y)["v"]
+
+    assert regridded.dtype == expected.dtype
+    np.testing.assert_allclose(regridded.transpose("time", "y", "x").values, expected.values, rtol = 1e-6, equal_nan = True)
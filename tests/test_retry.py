@@ -0,0 +1,25 @@
+import time
+
+import pytest
+
+from earthnet_minicuber import retry
+
+
+def fail(err):
+    raise err
+
+
+def test_half_open_probe_with_non_retryable_error_closes_breaker(tmp_path):
+    endpoint = retry.set_endpoint("test_probe", failure_threshold = 1, reset_timeout = 0.2, path = tmp_path/"test_probe.json")
+
+    with pytest.raises(ConnectionError):
+        retry.retry_call(fail, ConnectionError("down"), endpoint = endpoint.name, max_attempts = 1)
+    with pytest.raises(retry.CircuitOpenError):
+        retry.retry_call(lambda: "ok", endpoint = endpoint.name)
+
+    time.sleep(0.25)
+    # The probe reaches the endpoint, which answers with an error that is not worth a retry.
+    with pytest.raises(ValueError):
+        retry.retry_call(fail, ValueError("not found"), endpoint = endpoint.name)
+
+    assert retry.retry_call(lambda: "ok", endpoint = endpoint.name) == "ok"
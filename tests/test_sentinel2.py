@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from earthnet_minicuber.provider.s2.sentinel2 import merge_skipped, scene_flags, skipped_scenes
+
+
+def synthetic_stack(n_time = 5, size = 4):
+    rng = np.random.default_rng(0)
+    bands = ["B02", "B8A", "SCL"]
+    data = rng.uniform(0, 10000, (n_time, len(bands), size, size)).astype("float32")
+    data[:, 2] = 4
+    return xr.DataArray(data, dims = ("time", "band", "y", "x"), coords = {"time": pd.date_range("2021-01-01", periods = n_time, freq = "5D"), "band": bands, "y": np.arange(size), "x": np.arange(size), "id": ("time", [f"item{t}" for t in range(n_time)]), "epsg": 32632})
+
+
+def test_scene_flags():
+    scl = synthetic_stack().sel(band = "SCL")
+    scl[1] = 9
+    scl[2] = np.nan
+    scl[3] = 0
+    scl[4] = 10
+    scl[4, 0] = np.nan
+    empty, cloudy = scene_flags(scl)
+    assert empty.tolist() == [False, False, True, True, False]
+    assert cloudy.tolist() == [False, True, False, False, True]
+
+
+def test_merge_skipped_restores_order():
+    stack = synthetic_stack()
+    stack.loc[dict(band = "SCL")] = xr.DataArray([4, 9, 0, 4, 8], dims = "time").broadcast_like(stack.sel(band = "SCL"))
+    scl = stack.sel(band = "SCL")
+    empty, cloudy = scene_flags(scl)
+    keep, skip = np.flatnonzero(~(empty | cloudy)), np.flatnonzero(empty | cloudy)
+
+    processed = stack.isel(time = keep).to_dataset("band")
+    processed["mask"] = (("time", "y", "x"), np.zeros((len(keep), 4, 4), dtype = "float32"))
+    processed = processed.to_array("band")
+    skipped = skipped_scenes(stack.isel(time = skip), scl.isel(time = skip), cloud_mask = True)
+
+    merged = merge_skipped(processed, skipped, keep, skip)
+
+    assert (merged.time.values == stack.time.values).all()
+    assert merged.id.values.tolist() == stack.id.values.tolist()
+    assert merged.band.values.tolist() == ["B02", "B8A", "SCL", "mask"]
+    np.testing.assert_array_equal(merged.sel(band = "B02").isel(time = keep).values, stack.sel(band = "B02").isel(time = keep).values)
+    assert merged.sel(band = "B02").isel(time = skip).isnull().all()
+    np.testing.assert_array_equal(merged.sel(band = "SCL").values, scl.values)
+    assert (merged.sel(band = "mask").isel(time = keep) == 0).all()
+    assert (merged.sel(band = "mask").isel(time = 1) == 1).all()
+    assert merged.sel(band = "mask").isel(time = 2).isnull().all()
+
+
+def test_merge_skipped_all_scenes_skipped():
+    stack = synthetic_stack(n_time = 2)
+    stack.loc[dict(band = "SCL")] = 9
+    skipped = skipped_scenes(stack, stack.sel(band = "SCL"), cloud_mask = False)
+    merged = merge_skipped(None, skipped, np.array([], dtype = int), np.arange(2))
+    assert merged.band.values.tolist() == ["B02", "B8A", "SCL"]
+    assert merged.sel(band = "B8A").isnull().all()